@@ -9,4 +9,5 @@ pytest_plugins = [
     "main.tests.fixtures",
     "main.tests.selenium",
     "main.tests.factory",
+    "main.tests.benchmark",
 ]
@@ -0,0 +1,103 @@
+"""
+    Async versions of the catalog read views, served by main/asgi.py.
+
+    A synchronous view holds its worker thread for every database round
+    trip in turn. These views await their queries instead, and the ones that
+    do not depend on each other ( the product detail's facets, product row
+    and feature images ) run at the same time, each in an executor thread
+    with its own database connection. The request waits for the slowest
+    query rather than for their sum.
+
+    Django's ORM is synchronous, so every query goes through sync_to_async.
+    The views take the same cache_policy() and conditional() decorators
+    ( demo/caching.py ) and render the same context and templates as
+    demo/views.py, so both do the same work per request. Under main/wsgi.py
+    the views still work, Django runs them in an event loop of their own.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.template.response import TemplateResponse
+from inventory import models
+from inventory.category_tree import get_category_tree_version
+from inventory.conditional import category_validators, product_validators
+from inventory.facets import get_facet_index
+from inventory.pagination import KeysetPaginator
+from demo.caching import cache_policy, conditional, in_thread, validators
+from demo.views import EMPTY_PRODUCT, _feature_images, _page, _price_filters, _product, _product_context
+
+
+async def _gather(*calls):
+    """
+        Awaits several ( fn, *args ) queries at once, returning their results
+        in order.
+    """
+    return await asyncio.gather(*(in_thread(fn)(*args) for fn, *args in calls))
+
+
+async def category(request):
+
+    # The page stays lazy, it is only read on a miss of the cached fragment
+    # in category.html when the response is rendered
+    version = await sync_to_async(get_category_tree_version)()
+    paginator = KeysetPaginator(
+        models.Category.objects.values(
+            "id", "name", "slug", "level", "tree_id", "lft",
+            # The rollups come with the same query, see inventory/category_stats.py
+            "stats__subtree_product_count", "stats__subtree_units", "stats__subtree_min_price",
+        ),
+        ("tree_id", "lft"),
+        settings.CATEGORIES_PER_PAGE,
+    )
+    return TemplateResponse(request, 'category.html', {
+        "page": _page(paginator, request),
+        "cursor": request.GET.get("cursor", ""),
+        "version": version,
+        "timeout": settings.CATEGORY_PAGE_CACHE_TIMEOUT,
+    })
+
+
+@cache_policy("listing")
+@conditional(category_validators, "category")
+async def product_by_category(request, category):
+
+    # The validators ( demo/caching.py ) read the category row, the page
+    # stays lazy like the sync view's, only read on a miss of the fragment
+    # cached per ETag and filters
+    found = validators(request)
+    if found is None:
+        raise Http404("No Category matches the given query.")
+    filters, query = _price_filters(request)
+    cards = models.ProductCard.objects.in_category_subtree(found["category"]).priced(**filters).values(
+        "product_id", "name", "slug", "store_price", "sale_price", "units", "product_created_at"
+    )
+    paginator = KeysetPaginator(cards, ("product_created_at", "product_id"), settings.PRODUCTS_PER_PAGE)
+    return TemplateResponse(request, 'product_by_category.html', {
+        "page": _page(paginator, request),
+        "cache_key": found["etag"],
+        "filters": query,
+        "cursor": request.GET.get("cursor", ""),
+        "timeout": settings.CATALOG_FRAGMENT_CACHE_TIMEOUT,
+    })
+
+
+@cache_policy("product")
+@conditional(product_validators, "slug")
+async def product_detail(request, slug):
+
+    # The validators ( demo/caching.py ) read the SKUs and the product id,
+    # the other three do not depend on each other
+    found = validators(request)
+    if found is None:
+        return TemplateResponse(request, 'product_detail.html', EMPTY_PRODUCT)
+    product_id = found["id"]
+    index, product, images = await _gather(
+        (get_facet_index, product_id),
+        (_product, product_id),
+        (_feature_images, product_id),
+    )
+    return TemplateResponse(request, 'product_detail.html', _product_context(
+        request, found, index, product, images,
+    ))
@@ -0,0 +1,119 @@
+"""
+    HTTP caching of the catalog views.
+
+    conditional() answers If-None-Match / If-Modified-Since with a 304 from
+    the validators of inventory/conditional.py, before the view runs a query.
+    cache_policy() sets the Cache-Control header of a CACHE_CONTROL_POLICIES
+    entry on the responses, 304s included:
+
+        @cache_policy("product")
+        @conditional(product_validators, "slug")
+        def product_detail(request, slug): ...
+
+    The view reads the validators computed for the request with
+    validators(request), their ETag also keys its template fragments.
+
+    Both decorators take async views too ( demo/async_views.py ), whose
+    validators are computed in an executor thread with in_thread().
+"""
+import asyncio
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+
+def in_thread(fn):
+    """
+        Runs fn in an executor thread. Those threads are not part of the
+        request, so their connections are closed ( returned to the pool, see
+        main/db/pool.py ) here rather than by the request_finished signal.
+    """
+    def run(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def validators(request):
+    """
+        The validators conditional() computed for the request, None when
+        the object does not exist.
+    """
+    return request.catalog_validators
+
+
+def conditional(compute, argument):
+    """
+        Conditional GET for a view, compute( view kwargs[argument] ) giving
+        the validators. They are computed once per request.
+    """
+    def get(request, **kwargs):
+        if not hasattr(request, "catalog_validators"):
+            request.catalog_validators = compute(kwargs[argument])
+        return request.catalog_validators
+
+    def etag(request, **kwargs):
+        found = get(request, **kwargs)
+        return found and found["etag"]
+
+    def last_modified(request, **kwargs):
+        found = get(request, **kwargs)
+        return found and found["last_modified"]
+
+    decorator = condition(etag_func=etag, last_modified_func=last_modified)
+
+    def wrap(view):
+        if not asyncio.iscoroutinefunction(view):
+            return decorator(view)
+
+        # What condition() does, the validators read in an executor thread
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            found = await in_thread(get)(request, **kwargs)
+            res_etag = quote_etag(found["etag"]) if found else None
+            res_last_modified = found and found["last_modified"] and timegm(found["last_modified"].utctimetuple())
+            response = get_conditional_response(request, etag=res_etag, last_modified=res_last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if res_last_modified and not response.has_header("Last-Modified"):
+                    response["Last-Modified"] = http_date(res_last_modified)
+                if res_etag and not response.has_header("ETag"):
+                    response["ETag"] = res_etag
+            return response
+
+        return wrapper
+
+    return wrap
+
+
+def cache_policy(name):
+    """
+        Sets the Cache-Control of the CACHE_CONTROL_POLICIES[name] policy on
+        successful responses of the view.
+    """
+    def apply(response):
+        if response.status_code in (200, 304):
+            patch_cache_control(response, **settings.CACHE_CONTROL_POLICIES[name])
+        return response
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                return apply(await view(request, *args, **kwargs))
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                return apply(view(request, *args, **kwargs))
+        return wrapper
+    return decorator
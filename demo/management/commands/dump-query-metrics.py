@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand
+from demo.metrics import get_histograms, reset_histograms
+
+
+class Command(BaseCommand):
+    help = "Prints the p50/p95/p99 query metrics recorded per URL name"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the histograms as JSON",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Clear the histograms after printing them",
+        )
+
+    def handle(self, *args, **kwargs):
+        histograms = get_histograms()
+        if kwargs["json"]:
+            # A percentile in the unbounded last bucket is inf, not JSON
+            self.stdout.write(json.dumps({
+                view_name: {
+                    metric: {name: None if value == float("inf") else value for name, value in summary.items()}
+                    for metric, summary in metrics.items()
+                }
+                for view_name, metrics in histograms.items()
+            }, indent=2))
+        else:
+            self.stdout.write("%-32s %-10s %8s %10s %10s %10s" % (
+                "view", "metric", "count", "p50", "p95", "p99"
+            ))
+            for view_name, metrics in histograms.items():
+                for metric, summary in metrics.items():
+                    self.stdout.write("%-32s %-10s %8d %10s %10s %10s" % (
+                        view_name, metric, summary["count"],
+                        summary["p50"], summary["p95"], summary["p99"],
+                    ))
+        if kwargs["reset"]:
+            reset_histograms()
@@ -1,22 +1,54 @@
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
+from inventory.loader import load_fixtures
+
+FIXTURES = [
+    "db_admin_fixture.json",
+    "db_category_fixture.json",
+    "db_product_fixture.json",
+    "db_category_product_fixture.json",
+    "db_brand_fixture.json",
+    "db_type_fixture.json",
+    "db_product_inventory_fixture.json",
+    "db_media_fixture.json",
+    "db_stock_fixture.json",
+    "db_product_attribute_fixture.json",
+    "db_product_attribute_value_fixture.json",
+    "db_product_attribute_values_fixture.json",
+]
 
 
 class Command(BaseCommand):
     help = "Makes db migrations, migrates and loads dummy data"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written per insert",
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Write the rows with COPY ( PostgreSQL only )",
+        )
+
     def handle(self, *args, **kwargs):
         call_command('makemigrations')
         call_command('migrate')
-        call_command("loaddata", "db_admin_fixture.json")
-        call_command("loaddata", "db_category_fixture.json")
-        call_command("loaddata", "db_product_fixture.json")
-        call_command("loaddata", "db_category_product_fixture.json")
-        call_command("loaddata", "db_brand_fixture.json")
-        call_command("loaddata", "db_type_fixture.json")
-        call_command("loaddata", "db_product_inventory_fixture.json")
-        call_command("loaddata", "db_media_fixture.json")
-        call_command("loaddata", "db_stock_fixture.json")
-        call_command("loaddata", "db_product_attribute_fixture.json")
-        call_command("loaddata", "db_product_attribute_value_fixture.json")
-        call_command("loaddata", "db_product_attribute_values_fixture.json")
+        # Streams the fixtures and bulk inserts them, see inventory/loader.py
+        load_fixtures(
+            FIXTURES,
+            batch_size=kwargs["batch_size"],
+            use_copy=kwargs["copy"],
+            stdout=self.stdout,
+        )
+        call_command("rebuild-product-cards")
+        # Counted from the cards
+        call_command("rebuild-price-buckets")
+        call_command("rebuild-search-index")
+        call_command("rebuild-category-stats")
+        # The loader sends no model signals, drop data cached from before
+        cache.clear()
@@ -0,0 +1,196 @@
+"""
+    Query count and latency metrics for the demo views.
+
+    QueryRecorder is a context manager recording every SQL query run inside
+    it, QueryMetricsMiddleware ( demo/middleware.py ) wraps each request with
+    one. The queries of the executor threads of sync_to_async ( the async
+    views of demo/async_views.py ) are recorded too: the active recorders
+    are held in a context variable, which asgiref copies into those threads,
+    and every connection is given an execute wrapper reading it when it is
+    created. Per URL name histograms are kept as bucket counters in the cache
+    named by QUERY_METRICS_CACHE, so the 'dump-query-metrics' command can
+    read them from another process when that cache is shared ( file based,
+    memcached... ). A local memory cache only sees its own process.
+"""
+import bisect
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds of the histogram buckets, the last bucket is unbounded
+MILLISECOND_BUCKETS = [
+    0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500,
+    750, 1000, 1500, 2000, 3000, 5000, 10000,
+]
+COUNT_BUCKETS = list(range(0, 21)) + [25, 30, 40, 50, 75, 100, 150, 200, 500, 1000]
+
+METRICS = {
+    "total_ms": MILLISECOND_BUCKETS,
+    "db_ms": MILLISECOND_BUCKETS,
+    "render_ms": MILLISECOND_BUCKETS,
+    "queries": COUNT_BUCKETS,
+}
+
+_IN_LIST = re.compile(r"\((?:%s, )+%s\)")
+
+
+def query_signature(sql):
+    """
+        Collapses IN (%s, %s, ...) lists so the same query with a different
+        number of parameters has one signature.
+    """
+    return _IN_LIST.sub("(%s, ...)", sql)
+
+
+# The QueryRecorders active in the current context, innermost last
+_recorders = ContextVar("query_recorders", default=())
+
+
+def _record(execute, sql, params, many, context):
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.queries.append((sql, duration))
+
+
+def _install(connection):
+    # Kept for the life of the connection object, pooled reconnects included
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+@receiver(connection_created)
+def connection_recorded(sender, connection, **kwargs):
+    _install(connection)
+
+
+class QueryRecorder:
+    """
+        Records the queries run on every database connection while active,
+        in the current thread and in the executor threads started from it
+        with sync_to_async.
+
+            with QueryRecorder() as recorder:
+                ...
+            recorder.count, recorder.db_time, recorder.duplicates()
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._token = None
+
+    def __enter__(self):
+        # Connections of this thread may predate the receiver
+        for connection in connections.all():
+            _install(connection)
+        self._token = _recorders.set(_recorders.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _recorders.reset(self._token)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        """
+            Seconds spent in the database.
+        """
+        return sum(duration for sql, duration in self.queries)
+
+    def duplicates(self):
+        """
+            Signatures run more than once, the usual sign of an N+1 pattern,
+            as (signature, times) most repeated first.
+        """
+        signatures = Counter(query_signature(sql) for sql, duration in self.queries)
+        return [(sql, times) for sql, times in signatures.most_common() if times > 1]
+
+
+def _cache():
+    return caches[settings.QUERY_METRICS_CACHE]
+
+
+def _views_key():
+    return "demo:metrics:views"
+
+
+def _bucket_key(view_name, metric, bucket):
+    return f"demo:metrics:{view_name}:{metric}:{bucket}"
+
+
+def record_request(view_name, values):
+    """
+        Adds one request's {metric: value} to the histograms of a URL name.
+    """
+    cache = _cache()
+    views = cache.get(_views_key(), set())
+    if view_name not in views:
+        cache.set(_views_key(), views | {view_name}, None)
+    for metric, bounds in METRICS.items():
+        if metric not in values:
+            continue
+        key = _bucket_key(view_name, metric, bisect.bisect_left(bounds, values[metric]))
+        # add() only creates missing counters, incr() is atomic on shared caches
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def _percentile(bounds, counts, total, fraction):
+    seen = 0
+    for bucket, count in enumerate(counts):
+        seen += count
+        if seen >= total * fraction:
+            return bounds[bucket] if bucket < len(bounds) else float("inf")
+    return None
+
+
+def get_histograms():
+    """
+        Returns {view_name: {metric: {"count", "p50", "p95", "p99"}}}, the
+        percentiles being the upper bound of the bucket they fall in.
+    """
+    cache = _cache()
+    histograms = {}
+    for view_name in sorted(cache.get(_views_key(), set())):
+        histograms[view_name] = {}
+        for metric, bounds in METRICS.items():
+            keys = [_bucket_key(view_name, metric, bucket) for bucket in range(len(bounds) + 1)]
+            stored = cache.get_many(keys)
+            counts = [stored.get(key, 0) for key in keys]
+            total = sum(counts)
+            if not total:
+                continue
+            histograms[view_name][metric] = {
+                "count": total,
+                "p50": _percentile(bounds, counts, total, 0.50),
+                "p95": _percentile(bounds, counts, total, 0.95),
+                "p99": _percentile(bounds, counts, total, 0.99),
+            }
+    return histograms
+
+
+def reset_histograms():
+    cache = _cache()
+    for view_name in cache.get(_views_key(), set()):
+        cache.delete_many([
+            _bucket_key(view_name, metric, bucket)
+            for metric, bounds in METRICS.items()
+            for bucket in range(len(bounds) + 1)
+        ])
+    cache.delete(_views_key())
@@ -0,0 +1,72 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from demo.metrics import QueryRecorder, record_request
+
+logger = logging.getLogger("demo.metrics")
+
+
+class QueryMetricsMiddleware:
+    """
+    Opt-in ( QUERY_METRICS_ENABLED ) per request query and latency metrics.
+
+    Every request gets a Server-Timing header with the database, template
+    render and total time, one JSON log line on the 'demo.metrics' logger
+    including the repeated query signatures, and is added to the histograms
+    of its URL name ( see demo/metrics.py ). Render time is only known for
+    views returning a TemplateResponse.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_render_time = None
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        values = {
+            "total_ms": total * 1000,
+            "db_ms": recorder.db_time * 1000,
+            "queries": recorder.count,
+        }
+        timings = [
+            'db;dur=%.2f;desc="%d queries"' % (values["db_ms"], recorder.count),
+        ]
+        if request.metrics_render_time is not None:
+            values["render_ms"] = request.metrics_render_time * 1000
+            timings.append("render;dur=%.2f" % values["render_ms"])
+        timings.append("total;dur=%.2f" % values["total_ms"])
+        response["Server-Timing"] = ", ".join(timings)
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        logger.info(json.dumps({
+            "view": view_name,
+            "path": request.path,
+            "status": response.status_code,
+            **{metric: round(value, 2) for metric, value in values.items()},
+            "duplicates": [
+                {"sql": sql, "times": times} for sql, times in recorder.duplicates()
+            ],
+        }))
+        if view_name:
+            record_request(view_name, values)
+        return response
+
+    def process_template_response(self, request, response):
+        # TemplateResponses are rendered right after this hook returns
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.metrics_render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,114 @@
+from urllib.parse import urlencode
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+
+"""
+    Tests for the async catalog views ( demo/async_views.py ).
+
+    Their independent queries run in other threads with their own database
+    connections, which only see committed rows, so these tests use the
+    transactional_db fixture.
+"""
+
+
+@pytest.fixture
+def async_get():
+    client = AsyncClient()
+
+    def get(url, data=None, **headers):
+        # Django 3.2's AsyncClient sends GET data as a header, it goes in
+        # the path instead
+        return async_to_sync(client.get)(url + ("?" + urlencode(data) if data else ""), **headers)
+
+    return get
+
+
+@pytest.fixture
+def listed(transactional_db, category_factory, product_factory, stock_factory):
+    parent = category_factory.create(slug="async-parent", name="async parent")
+    child = category_factory.create(slug="async-child", name="async child", parent=parent)
+    for n in range(3):
+        product = product_factory.create(
+            web_id=f"async_web_id_{n}", slug=f"async-product-{n}", name=f"async product {n}",
+            category=[parent, child] if n else [child],
+        )
+        stock_factory.create(product_inventory__product=product, units=n + 1)
+    return parent
+
+
+@pytest.mark.dbfactory
+def test_demo_async_listings_match_sync(client, async_get, listed, settings):
+    settings.PRODUCTS_PER_PAGE = 2
+    for sync_name, async_name, kwargs in (
+        ("demo:categories", "demo:async_categories", {}),
+        ("demo:product_by_category", "demo:async_product_by_category", {"category": listed.slug}),
+    ):
+        expected = client.get(reverse(sync_name, kwargs=kwargs))
+        response = async_get(reverse(async_name, kwargs=kwargs))
+        assert response.status_code == 200
+        assert response.content == expected.content
+
+        cursor = response.context["page"].next_cursor
+        if cursor:
+            assert async_get(reverse(async_name, kwargs=kwargs), {"cursor": cursor}).content == client.get(
+                reverse(sync_name, kwargs=kwargs), {"cursor": cursor}
+            ).content
+
+    assert async_get(reverse("demo:async_product_by_category", kwargs={"category": "missing"})).status_code == 404
+    assert async_get(reverse("demo:async_categories"), {"cursor": "broken"}).status_code == 404
+
+
+@pytest.mark.dbfactory
+def test_demo_async_product_detail(
+    async_get, transactional_db, product_factory, product_inventory_factory, stock_factory,
+    media_factory, product_attribute_factory, product_attribute_value_factory,
+    product_attribute_values_factory,
+):
+    product = product_factory.create(
+        web_id="async_detail", slug="async-detail", description="async detail description"
+    )
+    colour = product_attribute_factory.create(name="async-colour")
+    for sku, value, units in (("async_red", "red", 3), ("async_blue", "blue", 5)):
+        inventory = product_inventory_factory.create(sku=sku, upc=sku, product=product)
+        stock_factory.create(product_inventory=inventory, units=units)
+        media_factory.create(product_inventory=inventory, image=f"images/{sku}.png", is_feature=True)
+        product_attribute_values_factory.create(
+            productinventory=inventory,
+            attributevalues=product_attribute_value_factory.create(
+                product_attribute=colour, attribute_value=value
+            ),
+        )
+
+    url = reverse("demo:async_product_detail", kwargs={"slug": product.slug})
+    response = async_get(url)
+    assert response.status_code == 200
+    assert b"async detail description" in response.content
+    assert response.content.count(b"Stock Left") == 2
+    assert b"images/async_blue.png" in response.content
+
+    response = async_get(url, {"async-colour": "red"})
+    assert [row["sku"] for row in response.context["data"]] == ["async_red"]
+    assert b"Stock Left - 3" in response.content
+
+
+@pytest.mark.dbfactory
+def test_demo_async_pages_match_sync(client, async_get, listed, media_factory):
+    product = listed.product_set.order_by("id").first()
+    media_factory.create(product_inventory=product.default_sku, image="images/async_match.png", is_feature=True)
+    for sync_name, async_name, kwargs in (
+        ("demo:product_by_category", "demo:async_product_by_category", {"category": listed.slug}),
+        ("demo:product_detail", "demo:async_product_detail", {"slug": product.slug}),
+    ):
+        expected = client.get(reverse(sync_name, kwargs=kwargs))
+        response = async_get(reverse(async_name, kwargs=kwargs))
+        assert response.content == expected.content
+        assert response["ETag"] == expected["ETag"]
+        assert response["Cache-Control"] == expected["Cache-Control"]
+
+        # Headers go by their HTTP name
+        response = async_get(reverse(async_name, kwargs=kwargs), **{"If-None-Match": expected["ETag"]})
+        assert response.status_code == 304
+        assert response["Cache-Control"] == expected["Cache-Control"]
@@ -0,0 +1,157 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.urls import reverse
+from main.asgi import application as asgi_application
+from main.tests.benchmark import build_catalog
+from main.wsgi import application as wsgi_application
+
+"""
+    Load test of the catalog pages under main/wsgi.py and main/asgi.py, see
+    main/tests/benchmark.py for the options.
+
+    Both applications are called in process, without a server, by CONCURRENCY
+    clients for REQUESTS requests per page: the WSGI one from a pool of
+    CONCURRENCY threads like a threaded server, the ASGI one from an event
+    loop whose executor has as many threads. WSGI requests go to the sync
+    views and ASGI requests to the async ones ( demo/async_views.py ). The
+    throughput and latency percentiles are printed and written to
+    --benchmark-json.
+
+    The requests read the database from their own threads and connections,
+    so the catalog is committed and flushed after the test.
+"""
+
+pytestmark = pytest.mark.benchmark
+
+CONCURRENCY = 16
+REQUESTS = 400
+
+
+def wsgi_get(path, query=""):
+    statuses = []
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": None,
+    }
+    result = wsgi_application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b"".join(result)
+    finally:
+        # Sends request_finished, which closes the request's connection
+        result.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(path, query=""):
+    messages = []
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(b"host", b"testserver")],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 0),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_application(scope, receive, send)
+    return messages[0]["status"]
+
+
+def summary(latencies, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        # Nearest rank, statistics.quantiles() needs Python 3.8
+        return latencies[min(len(latencies) - 1, max(0, math.ceil(p / 100 * len(latencies)) - 1))]
+
+    return {
+        "requests": len(latencies),
+        "concurrency": CONCURRENCY,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p95_ms": round(percentile(95) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def load_wsgi(path, query):
+    def timed(_):
+        started = time.perf_counter()
+        status = wsgi_get(path, query)
+        return status, time.perf_counter() - started
+
+    wsgi_get(path, query)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        results = list(pool.map(timed, range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+    assert {status for status, _ in results} == {200}
+    return summary([latency for _, latency in results], elapsed)
+
+
+def load_asgi(path, query):
+    async def run():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(CONCURRENCY))
+        slots = asyncio.Semaphore(CONCURRENCY)
+
+        async def timed():
+            async with slots:
+                started = time.perf_counter()
+                status = await asgi_get(path, query)
+                return status, time.perf_counter() - started
+
+        await asgi_get(path, query)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(timed() for _ in range(REQUESTS)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    assert {status for status, _ in results} == {200}
+    return summary([latency for _, latency in results], elapsed)
+
+
+@pytest.fixture
+def committed_catalog(request, transactional_db):
+    return build_catalog(request.config.getoption("--catalog-size"))
+
+
+def test_benchmark_load_wsgi_and_asgi(request, committed_catalog):
+    results = request.config._benchmark_results
+    pages = [
+        ("categories", "", {}),
+        ("product_by_category", "", {"category": committed_catalog["root"].slug}),
+        ("product_detail", "", {"slug": committed_catalog["product"].slug}),
+        ("product_detail", "bench-colour=red&bench-colour=blue", {"slug": committed_catalog["product"].slug}),
+    ]
+    print()
+    for name, query, kwargs in pages:
+        label = name + (":filtered" if query else "")
+        wsgi = results[f"load:wsgi:{label}"] = load_wsgi(reverse(f"demo:{name}", kwargs=kwargs), query)
+        asgi = results[f"load:asgi:{label}"] = load_asgi(reverse(f"demo:async_{name}", kwargs=kwargs), query)
+        for server, result in (("wsgi", wsgi), ("asgi", asgi)):
+            print(
+                f"{label:<30} {server}: {result['requests_per_sec']:>7} req/s"
+                f"  p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms  p99 {result['p99_ms']:>8}ms"
+            )
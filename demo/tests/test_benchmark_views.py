@@ -0,0 +1,134 @@
+import io
+import math
+import tracemalloc
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+from inventory import models
+from inventory.facets import FacetIndex
+from inventory.feeds import import_feed
+from inventory.pagination import AFTER, KeysetPaginator
+
+"""
+    Catalog benchmarks, see main/tests/benchmark.py for the options.
+    The query counts are upper bounds, going over one fails the run.
+"""
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_benchmark_view_categories(db, client, catalog, benchmark):
+    url = reverse("demo:categories")
+    benchmark("view:demo:categories", lambda: client.get(url), max_queries=1)
+
+
+def test_benchmark_view_product_by_category(db, client, catalog, benchmark):
+    url = reverse("demo:product_by_category", kwargs={"category": catalog["category"].slug})
+    benchmark("view:demo:product_by_category", lambda: client.get(url), max_queries=2)
+
+
+def test_benchmark_view_product_by_category_deep_page(db, client, catalog, benchmark):
+    # The root lists the whole catalog, the deep page starts a few pages
+    # before its end
+    root = catalog["root"]
+    url = reverse("demo:product_by_category", kwargs={"category": root.slug})
+    cards = models.ProductCard.objects.in_category_subtree(root).values("product_id", "product_created_at")
+    paginator = KeysetPaginator(cards, ("product_created_at", "product_id"), settings.PRODUCTS_PER_PAGE)
+    row = cards.order_by("-product_created_at", "-product_id")[3 * settings.PRODUCTS_PER_PAGE]
+    cursor = paginator.cursor(AFTER, row)
+    benchmark("view:demo:product_by_category:first_page", lambda: client.get(url), max_queries=2)
+    benchmark(
+        "view:demo:product_by_category:deep_page", lambda: client.get(url, {"cursor": cursor}), max_queries=2
+    )
+
+
+def test_benchmark_view_product_by_category_price_filters(db, client, catalog, benchmark):
+    # Ranges and the sale flag over the whole catalog, read through the
+    # cards' price and sale indexes
+    url = reverse("demo:product_by_category", kwargs={"category": catalog["root"].slug})
+    benchmark(
+        "view:demo:product_by_category:price_range",
+        lambda: client.get(url, {"min_price": "100", "max_price": "150"}),
+        max_queries=2,
+    )
+    benchmark("view:demo:product_by_category:on_sale", lambda: client.get(url, {"on_sale": "1"}), max_queries=2)
+
+
+def test_benchmark_view_product_detail(db, client, catalog, benchmark):
+    url = reverse("demo:product_detail", kwargs={"slug": catalog["product"].slug})
+    # The validators with the SKUs, the facet index before it is cached,
+    # the product row and the feature images
+    benchmark("view:demo:product_detail", lambda: client.get(url), max_queries=4)
+    benchmark(
+        "view:demo:product_detail:filtered",
+        lambda: client.get(url + "?bench-colour=red&bench-colour=blue&bench-size=9"),
+        max_queries=3,
+    )
+
+
+def test_benchmark_query_subtree_cards(db, catalog, benchmark):
+    root = catalog["root"]
+    benchmark(
+        "query:cards_in_subtree",
+        lambda: list(models.ProductCard.objects.in_category_subtree(root).values_list("id", flat=True)),
+        max_queries=1,
+    )
+
+
+def test_benchmark_query_price_buckets(db, client, catalog, benchmark):
+    url = reverse("api:list", kwargs={"resource": "price-buckets"})
+    benchmark(
+        "view:api:price_buckets", lambda: client.get(url, {"category_id": catalog["root"].id}), max_queries=1
+    )
+
+
+def test_benchmark_query_category_tree(db, catalog, benchmark):
+    benchmark(
+        "query:category_tree",
+        lambda: list(models.Category.objects.order_by("tree_id", "lft").values("id", "slug")),
+        max_queries=1,
+    )
+
+
+def test_benchmark_query_facet_index(db, catalog, benchmark):
+    product_id = catalog["product"].id
+    benchmark("query:facet_index_build", lambda: FacetIndex.build(product_id), max_queries=1)
+
+
+def test_benchmark_query_inventory_by_sku(db, catalog, benchmark):
+    sku = models.ProductInventory.objects.order_by("-id").values_list("sku", flat=True)[0]
+    benchmark(
+        "query:inventory_by_sku",
+        lambda: models.ProductInventory.objects.select_related("product", "product_inventory").get(sku=sku),
+        max_queries=1,
+    )
+
+
+def test_benchmark_view_api_export(db, client, catalog, benchmark):
+    url = reverse("api:export", kwargs={"resource": "inventories"})
+
+    def export():
+        return sum(len(chunk) for chunk in client.get(url).streaming_content)
+
+    benchmark("view:api:export:inventories", export, max_queries=1)
+    # Rows are streamed a chunk at a time, whatever the catalog size
+    tracemalloc.start()
+    export()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 16 * 1024 * 1024, f"the export peaked at {peak} bytes"
+
+
+def test_benchmark_import_supplier_feed(db, catalog, benchmark):
+    # A feed of every SKU, half of them repriced and restocked. The first
+    # round writes them, the next ones find nothing changed
+    rows = models.ProductInventory.objects.order_by("id").values_list("sku", "store_price")
+    lines = ["sku,store_price,units"] + [
+        f"{sku},{price - 1 if n % 2 else price},{n % 50}" for n, (sku, price) in enumerate(rows.iterator())
+    ]
+    feed = "\n".join(lines) + "\n"
+    batches = math.ceil(len(lines) / 5000)
+    # Per batch the lookup, and the UPDATE, the rows read back and the
+    # change feed INSERT of both tables in a savepoint
+    benchmark("import:supplier_feed", lambda: import_feed(io.StringIO(feed), "csv"), max_queries=9 * batches)
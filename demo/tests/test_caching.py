@@ -0,0 +1,111 @@
+import pytest
+from django.urls import reverse
+from django.utils.http import http_date
+from inventory import models, stock
+
+"""
+    Tests for the HTTP caching of the catalog views: conditional GETs from
+    the validators of inventory/conditional.py, the Cache-Control policies
+    and the listing fragment cache ( demo/caching.py ).
+"""
+
+
+@pytest.fixture
+def product(db, category_factory, product_factory, product_inventory_factory, stock_factory):
+    category = category_factory.create(slug="cached", name="cached")
+    product = product_factory.create(
+        web_id="cached_web_id", slug="cached-product", name="cached product", category=[category],
+    )
+    for variant, units in enumerate((4, 7)):
+        sku = product_inventory_factory.create(
+            product=product, sku=f"cached-{variant}", upc=f"cached-{variant}", is_default=variant == 0,
+        )
+        stock_factory.create(product_inventory=sku, units=units)
+    return product
+
+
+def listing_url():
+    return reverse("demo:product_by_category", kwargs={"category": "cached"})
+
+
+def detail_url():
+    return reverse("demo:product_detail", kwargs={"slug": "cached-product"})
+
+
+@pytest.mark.dbfactory
+def test_demo_caching_listing_revalidates(client, product, django_assert_num_queries):
+    response = client.get(listing_url())
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert response.has_header("Last-Modified")
+    assert set(response["Cache-Control"].split(", ")) == {
+        "public", "max-age=0", "s-maxage=60", "stale-while-revalidate=300",
+    }
+
+    # Revalidating is the single validators query
+    with django_assert_num_queries(1):
+        response = client.get(listing_url(), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert "s-maxage=60" in response["Cache-Control"]
+
+    # Rendered again from the cached fragment, without reading the page
+    with django_assert_num_queries(1):
+        assert b"Stock Left - 4" in client.get(listing_url()).content
+
+    # A stock change moves the card, the ETag and the fragment key
+    default = models.Stock.objects.get(product_inventory__sku="cached-0")
+    default.units = 9
+    default.save()
+    response = client.get(listing_url(), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert b"Stock Left - 9" in response.content
+
+
+@pytest.mark.dbfactory
+def test_demo_caching_product_detail_revalidates(
+    client, product, media_factory, django_assert_num_queries, django_capture_on_commit_callbacks,
+):
+    response = client.get(detail_url())
+    etag = response["ETag"]
+    assert "s-maxage=30" in response["Cache-Control"]
+    with django_assert_num_queries(1):
+        assert client.get(detail_url(), HTTP_IF_NONE_MATCH=etag).status_code == 304
+    last_modified = response["Last-Modified"]
+    assert client.get(detail_url(), HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+    def changed():
+        nonlocal etag
+        response = client.get(detail_url(), HTTP_IF_NONE_MATCH=etag)
+        etag = response["ETag"]
+        return response.status_code == 200
+
+    # Stock of a SKU that is not the default, moved without signals
+    with django_capture_on_commit_callbacks(execute=True):
+        stock.restock({models.ProductInventory.objects.get(sku="cached-1").id: 3})
+    assert changed()
+    assert not changed()
+
+    media_factory.create(product_inventory=product.default_sku, image="images/cached.png")
+    assert changed()
+
+    sku = models.ProductInventory.objects.get(sku="cached-1")
+    sku.store_price = 50
+    sku.save()
+    assert changed()
+
+    # Modified since a day before its last change
+    older = http_date(models.Product.objects.get(pk=product.pk).updated_at.timestamp() - 86400)
+    assert client.get(detail_url(), HTTP_IF_MODIFIED_SINCE=older).status_code == 200
+
+
+@pytest.mark.dbfactory
+def test_demo_caching_missing_pages(client, db):
+    response = client.get(reverse("demo:product_by_category", kwargs={"category": "missing"}))
+    assert response.status_code == 404
+    assert not response.has_header("ETag")
+    assert not response.has_header("Cache-Control")
+
+    # An unknown product is an empty page, never validated
+    response = client.get(reverse("demo:product_detail", kwargs={"slug": "missing"}))
+    assert not response.has_header("ETag")
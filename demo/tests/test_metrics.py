@@ -0,0 +1,92 @@
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import AsyncClient
+from django.urls import reverse
+from demo.metrics import QueryRecorder, get_histograms, query_signature, record_request
+from inventory import models
+
+
+@pytest.fixture
+def metrics_enabled(settings):
+    settings.QUERY_METRICS_ENABLED = True
+
+
+def test_demo_metrics_query_signature():
+    assert query_signature("SELECT 1 WHERE id IN (%s, %s, %s)") == query_signature(
+        "SELECT 1 WHERE id IN (%s, %s)"
+    )
+
+
+@pytest.mark.dbfactory
+def test_demo_metrics_query_recorder_duplicates(db, category_factory):
+    categories = category_factory.create_batch(3)
+    with QueryRecorder() as recorder:
+        # An N+1 on purpose
+        for category in categories:
+            list(models.Category.objects.filter(id=category.id))
+        models.Product.objects.count()
+    assert recorder.count == 4
+    assert recorder.db_time > 0
+    duplicates = recorder.duplicates()
+    assert len(duplicates) == 1
+    assert duplicates[0][1] == 3
+
+
+@pytest.mark.dbfactory
+def test_demo_metrics_middleware(db, client, metrics_enabled, category_factory, caplog):
+    category_factory.create(slug="metrics")
+    url = reverse("demo:product_by_category", kwargs={"category": "metrics"})
+
+    with caplog.at_level("INFO", logger="demo.metrics"):
+        response = client.get(url)
+        client.get(url)
+
+    timing = response["Server-Timing"]
+    assert 'db;dur=' in timing and 'desc="2 queries"' in timing
+    assert "render;dur=" in timing and "total;dur=" in timing
+
+    line = json.loads(caplog.records[0].getMessage())
+    assert line["view"] == "demo:product_by_category"
+    assert line["queries"] == 2
+
+    histograms = get_histograms()
+    # The second request renders the listing from the fragment cache
+    assert histograms["demo:product_by_category"]["queries"] == {
+        "count": 2, "p50": 1, "p95": 2, "p99": 2,
+    }
+    call_command("dump-query-metrics", "--reset")
+    assert get_histograms() == {}
+
+
+@pytest.mark.dbfactory
+def test_demo_metrics_middleware_async_views(
+    transactional_db, metrics_enabled, product_factory, stock_factory, caplog
+):
+    # Their queries run in executor threads, on connections of their own
+    product = product_factory.create(web_id="metrics_async", slug="metrics-async")
+    stock_factory.create(product_inventory__product=product)
+    url = reverse("demo:async_product_detail", kwargs={"slug": product.slug})
+
+    with caplog.at_level("INFO", logger="demo.metrics"):
+        async_to_sync(AsyncClient().get)(url)
+    line = json.loads(caplog.records[0].getMessage())
+    assert line["view"] == "demo:async_product_detail"
+    assert line["queries"] >= 3
+
+
+@pytest.mark.dbfactory
+def test_demo_metrics_json_unbounded(db, capsys):
+    record_request("demo:slow", {"total_ms": 60000})
+    call_command("dump-query-metrics", "--json", "--reset")
+    assert json.loads(capsys.readouterr().out)["demo:slow"]["total_ms"] == {
+        "count": 1, "p50": None, "p95": None, "p99": None,
+    }
+
+
+@pytest.mark.dbfactory
+def test_demo_metrics_middleware_disabled(db, client):
+    response = client.get(reverse("demo:categories"))
+    assert not response.has_header("Server-Timing")
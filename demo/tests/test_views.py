@@ -0,0 +1,164 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+
+@pytest.mark.dbfactory
+def test_demo_product_by_category_reads_cards(
+    db, client, django_assert_num_queries, category_factory, product_factory, stock_factory
+):
+    """
+        The category listing is served from the ProductCard read model, one
+        query for the category and one for its cards.
+    """
+    category = category_factory.create(slug="listed")
+    product = product_factory.create(
+        web_id="listed_web_id", slug="listed-product", name="listed product",
+        category=[category],
+    )
+    stock_factory.create(product_inventory__product=product, units=4)
+
+    with django_assert_num_queries(2):
+        response = client.get(
+            reverse("demo:product_by_category", kwargs={"category": "listed"})
+        )
+    assert response.status_code == 200
+    assert b"listed product" in response.content
+    assert b"Stock Left - 4" in response.content
+
+
+@pytest.mark.dbfactory
+def test_demo_product_by_category_includes_subcategories(
+    db, client, category_factory, product_factory
+):
+    """
+        Browsing a category lists the products of its whole subtree once.
+    """
+    parent = category_factory.create(slug="parent")
+    child = category_factory.create(slug="child", parent=parent)
+    product_factory.create(
+        web_id="child_web_id", slug="child-product", name="child product",
+        category=[parent, child],
+    )
+
+    response = client.get(
+        reverse("demo:product_by_category", kwargs={"category": "parent"})
+    )
+    assert response.content.count(b"child product") == 1
+
+    response = client.get(
+        reverse("demo:product_by_category", kwargs={"category": "missing"})
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.dbfactory
+def test_demo_listings_are_paged(db, client, settings, category_factory, product_factory):
+    """
+        Both listings follow their next cursor to the end, a bad cursor is a
+        404.
+    """
+    settings.PRODUCTS_PER_PAGE = 2
+    settings.CATEGORIES_PER_PAGE = 2
+    category = category_factory.create(slug="paged", name="paged")
+    category_factory.create(slug="paged-child", name="paged child", parent=category)
+    category_factory.create(slug="other", name="other")
+    for n in range(5):
+        product_factory.create(
+            web_id=f"paged_web_id_{n}", slug=f"paged-product-{n}", name=f"paged product {n}",
+            category=[category],
+        )
+
+    for url, names in (
+        (reverse("demo:product_by_category", kwargs={"category": "paged"}), 5),
+        (reverse("demo:categories"), 3),
+    ):
+        seen = 0
+        cursor = ""
+        while True:
+            response = client.get(url, {"cursor": cursor} if cursor else {})
+            page = response.context["page"]
+            seen += len(page.object_list)
+            if not page.next_cursor:
+                break
+            cursor = page.next_cursor
+        assert seen == names
+
+        assert client.get(url, {"cursor": "broken"}).status_code == 404
+
+
+@pytest.mark.dbfactory
+def test_demo_product_by_category_price_filters(
+    db, client, settings, django_assert_num_queries, category_factory, product_factory,
+    product_inventory_factory,
+):
+    """
+        The listing takes a price range and an on sale flag, kept in the page
+        links. Filtering costs no extra query.
+    """
+    settings.PRODUCTS_PER_PAGE = 1
+    category = category_factory.create(slug="filtered")
+    for n, (price, sale) in enumerate(((10, 10), (20, 15), (30, 15))):
+        product = product_factory.create(
+            web_id=f"filtered_web_id_{n}", slug=f"filtered-product-{n}", name=f"filtered product {n}",
+            category=[category],
+        )
+        product_inventory_factory.create(
+            product=product, upc=f"filtered_{n}", store_price=price, sale_price=sale,
+        )
+    url = reverse("demo:product_by_category", kwargs={"category": "filtered"})
+
+    def names(query):
+        seen = []
+        while True:
+            response = client.get(url, query)
+            page = response.context["page"]
+            seen += [row["name"] for row in page.object_list]
+            if not page.next_cursor:
+                return seen
+            filters = response.context["filters"].replace("&", "&amp;")
+            assert f'href="?{filters + "&amp;" if filters else ""}cursor=' in response.content.decode()
+            query = dict(query, cursor=page.next_cursor)
+
+    with django_assert_num_queries(2):
+        client.get(url, {"min_price": "15", "max_price": "25"})
+    assert names({"min_price": "15", "max_price": "25"}) == ["filtered product 1"]
+    assert sorted(names({"min_price": "15"})) == ["filtered product 1", "filtered product 2"]
+    assert sorted(names({"on_sale": "1", "max_price": "30"})) == ["filtered product 1", "filtered product 2"]
+    assert len(names({})) == 3
+
+    for query in ({"min_price": "cheap"}, {"max_price": "NaN"}):
+        assert client.get(url, query).status_code == 404
+
+
+@pytest.mark.dbfactory
+def test_demo_category_shows_subtree_stats(
+    db, client, django_assert_num_queries, django_capture_on_commit_callbacks, category_factory, product_factory,
+    stock_factory,
+):
+    """
+        Each category shows the products, stock and lowest price of its
+        subtree, read with the categories in one query.
+    """
+    with django_capture_on_commit_callbacks(execute=True):
+        parent = category_factory.create(slug="stats-parent", name="stats parent")
+        child = category_factory.create(slug="stats-child", name="stats child", parent=parent)
+        stock = stock_factory.create(
+            product_inventory__product=product_factory.create(
+                web_id="stats_web_id", slug="stats-product", name="stats product", category=[child],
+            ),
+            product_inventory__store_price=12, product_inventory__sale_price=12, units=4,
+        )
+    with django_assert_num_queries(1):
+        content = client.get(reverse("demo:categories")).content.decode()
+    assert content.count("(1 products, 4 in stock, from $12.00)") == 2
+
+    # A stock change leaves the cached page alone until it expires
+    with django_capture_on_commit_callbacks(execute=True):
+        stock.units = 6
+        stock.save()
+    with django_assert_num_queries(0):
+        content = client.get(reverse("demo:categories")).content.decode()
+    assert "(1 products, 4 in stock, from $12.00)" in content
+    cache.clear()
+    assert "(1 products, 6 in stock, from $12.00)" in client.get(reverse("demo:categories")).content.decode()
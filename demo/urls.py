@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = "demo"
 
@@ -7,5 +7,12 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('categories/', views.category, name='categories'),
     path('product-by-category/<slug:category>/', views.product_by_category, name='product_by_category'),
+    # The same pages from async views, see demo/async_views.py
+    path('async/categories/', async_views.category, name='async_categories'),
+    path(
+        'async/product-by-category/<slug:category>/', async_views.product_by_category,
+        name='async_product_by_category',
+    ),
+    path('async/<slug:slug>/', async_views.product_detail, name='async_product_detail'),
     path('<slug:slug>/', views.product_detail, name='product_detail'),
 ]
@@ -1,47 +1,154 @@
-from django.shortcuts import render
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import Http404
+from django.template.response import TemplateResponse
 from inventory import models
+from inventory.category_tree import get_category_tree_version
+from inventory.conditional import category_validators, product_validators
+from inventory.facets import get_facet_index
+from inventory.images import srcsets
+from inventory.pagination import InvalidCursor, KeysetPaginator
+from demo.caching import cache_policy, conditional, validators
+
+
+# Views return a TemplateResponse rather than render() so the template render
+# time can be measured apart, see demo/middleware.py
 
 
 def home(request):
-    return render(request, 'index.html')
+    return TemplateResponse(request, 'index.html')
+
+
+def _page(paginator, request):
+    try:
+        return paginator.page(request.GET.get("cursor"))
+    except InvalidCursor:
+        raise Http404("Invalid cursor")
+
+
+def _price_filters(request):
+    """
+        Returns the listing's ?min_price=&max_price=&on_sale=1 filters as
+        ProductCardQuerySet.priced() arguments, and as a query string to keep
+        in the page links.
+    """
+    filters = {}
+    for name in ("min_price", "max_price"):
+        if request.GET.get(name):
+            try:
+                filters[name] = Decimal(request.GET[name])
+            except InvalidOperation:
+                raise Http404("Invalid price")
+            if not filters[name].is_finite():
+                raise Http404("Invalid price")
+    if request.GET.get("on_sale") == "1":
+        filters["on_sale"] = True
+    return filters, urlencode({name: int(value) if value is True else value for name, value in filters.items()})
 
 
 def category(request):
 
-    data = models.Category.objects.all()
-
-    return render(request, 'category.html', {"data": data})
+    # Categories are paged in tree order with a keyset cursor, see
+    # inventory/pagination.py. Each page is cached per tree version
+    # ( see category.html ) and only read on a cache miss, the stats on it
+    # are refreshed when it expires, every stock move would invalidate it
+    paginator = KeysetPaginator(
+        models.Category.objects.values(
+            "id", "name", "slug", "level", "tree_id", "lft",
+            # The rollups come with the same query, see inventory/category_stats.py
+            "stats__subtree_product_count", "stats__subtree_units", "stats__subtree_min_price",
+        ),
+        ("tree_id", "lft"),
+        settings.CATEGORIES_PER_PAGE,
+    )
+    return TemplateResponse(request, 'category.html', {
+        "page": _page(paginator, request),
+        "cursor": request.GET.get("cursor", ""),
+        "version": get_category_tree_version(),
+        "timeout": settings.CATEGORY_PAGE_CACHE_TIMEOUT,
+    })
 
 
+@cache_policy("listing")
+@conditional(category_validators, "category")
 def product_by_category(request, category):
 
-    data = models.Product.objects.filter(category__slug=category).values(
-        "id", "name", "slug", "category__name", "product__store_price",
-        "product__product_inventory__units"
+    # A client holding the current page got a 304 without reaching here,
+    # the category row was read along with the validators
+    found = validators(request)
+    if found is None:
+        raise Http404("No Category matches the given query.")
+    node = found["category"]
+
+    # Reads the denormalized listing cards, see inventory/product_cards.py
+    # Covers the whole subtree, a product listed under several of the
+    # subcategories is only shown once. Pages are read from a keyset
+    # cursor, the last one costs the same as the first. Price ranges and
+    # the sale flag are read from the cards' own indexes
+    filters, query = _price_filters(request)
+    cards = models.ProductCard.objects.in_category_subtree(node).priced(**filters).values(
+        "product_id", "name", "slug", "store_price", "sale_price", "units", "product_created_at"
+    )
+    paginator = KeysetPaginator(
+        cards, ("product_created_at", "product_id"), settings.PRODUCTS_PER_PAGE
     )
 
-    return render(request, 'product_by_category.html', {"data": data})
-
-
+    # The page is only read on a miss of the fragment cached per ETag and
+    # filters
+    return TemplateResponse(request, 'product_by_category.html', {
+        "page": _page(paginator, request),
+        "cache_key": found["etag"],
+        "filters": query,
+        "cursor": request.GET.get("cursor", ""),
+        "timeout": settings.CATALOG_FRAGMENT_CACHE_TIMEOUT,
+    })
+
+
+def _product(product_id):
+    return models.Product.objects.filter(id=product_id).values("id", "name", "description").first()
+
+
+def _feature_images(product_id):
+    return {
+        inventory_id: {"image": image, "srcsets": srcsets(image_hash, image_width)}
+        for inventory_id, image, image_hash, image_width in models.Media.objects.filter(
+            product_inventory__product_id=product_id, is_feature=True
+        ).values_list("product_inventory_id", "image", "image_hash", "image_width")
+    }
+
+
+def _product_context(request, found, index, product, images):
+    """
+        The context of the product page, rendered the same by the async
+        view ( demo/async_views.py ).
+    """
+    # Colour and size filters combine as colour=red AND size=10, several
+    # values of one attribute as size=9 OR size=10, see inventory/facets.py
+    inventory_ids, facets = index.filter(index.selection_from(request.GET))
+    # The SKU rows were read with the validators, see inventory/conditional.py
+    skus = found["skus"]
+    data = [
+        dict(skus[inventory_id], **images.get(inventory_id, {"image": None, "srcsets": {}}))
+        for inventory_id in inventory_ids
+        if inventory_id in skus
+    ]
+    return {"product": product, "data": data, "facets": facets}
+
+
+# An unknown product is an empty page
+EMPTY_PRODUCT = {"product": None, "data": [], "facets": []}
+
+
+@cache_policy("product")
+@conditional(product_validators, "slug")
 def product_detail(request, slug):
 
-    filter_args = []
-
-    if request.GET:
-        for value in request.GET.values():
-            filter_args.append(value)
-
-    print(filter_args)
-    # from django.db.models import Count
-
-    print(models.ProductInventory.objects.filter(product__slug=slug))
-
-    # Returns the Default Product for all ProductInventory Tuples
-    # See ProductInventory Model for more detail
-    data = models.ProductInventory.objects.filter(product__slug=slug).filter(
-        attribute_values__attribute_value__in=filter_args
-    ).values(
-        "id", "product__name", "sku", "store_price", "product_inventory__units"
-    )
-
-    return render(request, 'product_detail.html', {"data": data})
+    found = validators(request)
+    if found is None:
+        return TemplateResponse(request, 'product_detail.html', EMPTY_PRODUCT)
+    product_id = found["id"]
+    return TemplateResponse(request, 'product_detail.html', _product_context(
+        request, found, get_facet_index(product_id), _product(product_id), _feature_images(product_id),
+    ))
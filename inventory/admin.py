@@ -1,4 +1,189 @@
+"""
+    Admin of the catalog, usable on tables of millions of rows:
+        - the category tree shows its top levels, a node's subtree is opened
+          on its own page instead of rendering every node
+        - the big tables are paged with EstimatedCountPaginator, counted
+          from the planner's estimates, and skip the full count
+        - related rows are read by the list query ( list_select_related )
+          and chosen with autocomplete widgets
+        - products are searched through their search documents
+          ( inventory/search.py ), SKUs by exact sku or upc
+        - bulk actions write with one UPDATE and add the rows to the change
+          feed ( inventory/changes.py ), the signals of a save are not sent
+"""
 from django.contrib import admin
-from .models import Category
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
+from mptt.admin import DraggableMPTTAdmin
+from inventory import models
+from inventory.cache import bump_version_on_commit
+from inventory.category_tree import CATEGORY_TREE_NAMESPACE
+from inventory.changes import record_updates
+from inventory.counting import estimated_count
+from inventory.search import autocomplete
 
-admin.site.register(Category)
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Takes the count from the planner's estimate when it is over
+        threshold ( COUNT_ESTIMATE_THRESHOLD by default ), see
+        inventory/counting.py. The last pages of an overestimated list are
+        empty.
+    """
+    threshold = None
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list, self.threshold)[0]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # The filtered count is enough, the total would be a second count
+    show_full_result_count = False
+    list_per_page = 50
+
+
+def _update(modeladmin, request, queryset, message, **values):
+    """
+        Applies values to the selected rows with one UPDATE and records them
+        in the change feed.
+    """
+    model = queryset.model
+    ids = list(queryset.values_list("id", flat=True))
+    with transaction.atomic():
+        updated = model.objects.filter(id__in=ids).update(**values)
+        record_updates(model, ids)
+    modeladmin.message_user(request, message % {"count": updated})
+
+
+@admin.register(models.Category)
+class CategoryAdmin(DraggableMPTTAdmin):
+    list_display = ("tree_actions", "indented_title", "slug", "is_active", "subtree")
+    list_display_links = ("indented_title",)
+    list_filter = ("is_active",)
+    search_fields = ("name", "=slug")
+    prepopulated_fields = {"slug": ("name",)}
+    list_per_page = 200
+    actions = ("activate", "deactivate")
+    # Levels listed until a subtree is opened
+    initial_levels = 2
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # Only the listed page, actions and autocompletes see every node
+        match = request.resolver_match
+        if request.method != "GET" or match is None or match.url_name != "inventory_category_changelist":
+            return queryset
+        if any(name in request.GET for name in ("tree_id", "q")):
+            return queryset
+        return queryset.filter(level__lt=self.initial_levels)
+
+    @admin.display(description=_("subtree"))
+    def subtree(self, obj):
+        if obj.is_leaf_node():
+            return ""
+        return format_html(
+            '<a href="{}?tree_id={}&amp;lft__gte={}&amp;lft__lte={}">{}</a>',
+            reverse("admin:inventory_category_changelist"), obj.tree_id, obj.lft, obj.rght,
+            _("%d categories") % obj.get_descendant_count(),
+        )
+
+    def _set_active(self, request, queryset, value):
+        updated = queryset.update(is_active=value)
+        # update() sends no post_save, the pages cached per tree version
+        # ( inventory/category_tree.py ) would not see the change
+        bump_version_on_commit(CATEGORY_TREE_NAMESPACE)
+        self.message_user(request, _("%d categories updated") % updated)
+
+    @admin.action(description=_("Activate the selected categories"))
+    def activate(self, request, queryset):
+        self._set_active(request, queryset, True)
+
+    @admin.action(description=_("Deactivate the selected categories"))
+    def deactivate(self, request, queryset):
+        self._set_active(request, queryset, False)
+
+
+@admin.register(models.Brand)
+class BrandAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
+
+
+@admin.register(models.ProductType)
+class ProductTypeAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
+
+
+@admin.register(models.Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ("name", "web_id", "slug", "is_active", "updated_at")
+    list_filter = ("is_active",)
+    search_fields = ("=web_id",)
+    prepopulated_fields = {"slug": ("name",)}
+    autocomplete_fields = ("category",)
+    readonly_fields = ("created_at", "updated_at")
+    actions = ("activate", "deactivate")
+    # Products matched by a search, best first
+    search_limit = 200
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        ids = [product_id for product_id, name, rank in autocomplete(search_term, limit=self.search_limit)]
+        return queryset.filter(Q(web_id=search_term) | Q(id__in=ids)), False
+
+    @admin.action(description=_("Activate the selected products"))
+    def activate(self, request, queryset):
+        _update(self, request, queryset, _("%(count)d products activated"), is_active=True, updated_at=Now())
+
+    @admin.action(description=_("Deactivate the selected products"))
+    def deactivate(self, request, queryset):
+        _update(self, request, queryset, _("%(count)d products deactivated"), is_active=False, updated_at=Now())
+
+
+@admin.register(models.ProductInventory)
+class ProductInventoryAdmin(LargeTableAdmin):
+    list_display = (
+        "sku", "upc", "product", "brand", "product_type", "store_price", "sale_price", "is_active", "is_default",
+    )
+    list_select_related = ("product", "brand", "product_type")
+    list_filter = ("is_active", "is_default")
+    search_fields = ("=sku", "=upc")
+    autocomplete_fields = ("product", "brand", "product_type")
+    readonly_fields = ("created_at", "updated_at")
+    actions = ("activate", "deactivate")
+
+    @admin.action(description=_("Activate the selected SKUs"))
+    def activate(self, request, queryset):
+        _update(self, request, queryset, _("%(count)d SKUs activated"), is_active=True, updated_at=Now())
+
+    @admin.action(description=_("Deactivate the selected SKUs"))
+    def deactivate(self, request, queryset):
+        _update(self, request, queryset, _("%(count)d SKUs deactivated"), is_active=False, updated_at=Now())
+
+
+@admin.register(models.Stock)
+class StockAdmin(LargeTableAdmin):
+    list_display = ("product_inventory", "sku", "units", "units_reserved", "units_sold", "shards", "last_checked")
+    list_select_related = ("product_inventory__product",)
+    search_fields = ("=product_inventory__sku",)
+    autocomplete_fields = ("product_inventory",)
+    # Moved by inventory/stock.py, a form save would overwrite concurrent
+    # reservations
+    readonly_fields = ("units_reserved", "units_sold", "shards")
+    actions = ("mark_checked",)
+
+    @admin.display(description=_("sku"), ordering="product_inventory__sku")
+    def sku(self, obj):
+        return obj.product_inventory.sku
+
+    @admin.action(description=_("Mark the selected stock as checked now"))
+    def mark_checked(self, request, queryset):
+        _update(self, request, queryset, _("%(count)d stock rows checked"), last_checked=Now())
@@ -0,0 +1,138 @@
+"""
+    Bulk insert helpers shared by the fixture loader and the data tools.
+
+    Rows are written as they are, without calling pre_save(), so fixture and
+    feed values for auto_now / auto_now_add fields are kept. On PostgreSQL the
+    rows can be streamed with COPY instead of multi-row INSERTs.
+"""
+import datetime
+import io
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def _copy_value(value):
+    if value is None:
+        # An unquoted empty column is NULL in COPY's csv format
+        return ""
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        value = value.isoformat()
+    return '"%s"' % str(value).replace('"', '""')
+
+
+def copy_rows(table, columns, rows, using=DEFAULT_DB_ALIAS):
+    """
+        Writes rows of database values with a single COPY ... FROM STDIN
+        ( PostgreSQL ).
+    """
+    connection = connections[using]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (
+        quote(table), ", ".join(quote(column) for column in columns),
+    )
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(sql, buffer)
+
+
+def copy_insert(model, objs, using=DEFAULT_DB_ALIAS):
+    """
+        Writes the objects with a single COPY ... FROM STDIN ( PostgreSQL ).
+    """
+    connection = connections[using]
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and objs[0].pk is None)
+    ]
+    copy_rows(
+        model._meta.db_table,
+        [field.column for field in fields],
+        (
+            [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+            for obj in objs
+        ),
+        using=using,
+    )
+
+
+def insert_rows(model, columns, rows, batch_size=1000, use_copy=False, using=DEFAULT_DB_ALIAS):
+    """
+        Inserts rows of database values ( tuples in the order of columns )
+        into the model's table, skipping model instances altogether. Uses
+        COPY when use_copy is set and the database is PostgreSQL, multi-row
+        INSERTs otherwise. Returns the number of rows written.
+    """
+    connection = connections[using]
+    rows = list(rows)
+    if not rows:
+        return 0
+    if use_copy and connection.vendor == "postgresql":
+        copy_rows(model._meta.db_table, columns, rows, using=using)
+        return len(rows)
+
+    fields = [model._meta.get_field(column) for column in columns]
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, rows) or batch_size)
+    quote = connection.ops.quote_name
+    placeholder = "(%s)" % ", ".join(["%s"] * len(columns))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                "INSERT INTO %s (%s) VALUES %s" % (
+                    quote(model._meta.db_table),
+                    ", ".join(quote(column) for column in columns),
+                    ", ".join([placeholder] * len(batch)),
+                ),
+                [value for row in batch for value in row],
+            )
+    return len(rows)
+
+
+def bulk_insert(model, objs, batch_size=1000, use_copy=False, using=DEFAULT_DB_ALIAS):
+    """
+        Inserts the objects in batches of batch_size rows, with COPY when
+        use_copy is set and the database is PostgreSQL. Objects with and
+        without a primary key can be mixed, the database assigns the missing
+        ones. Returns the number of rows written.
+    """
+    use_copy = use_copy and connections[using].vendor == "postgresql"
+    with_pk = [obj for obj in objs if obj.pk is not None]
+    without_pk = [obj for obj in objs if obj.pk is None]
+
+    for group in (with_pk, without_pk):
+        if not group:
+            continue
+        if use_copy:
+            copy_insert(model, group, using=using)
+            continue
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not (field.primary_key and group[0].pk is None)
+        ]
+        for start in range(0, len(group), batch_size):
+            # raw=True keeps the values of auto_now fields as given
+            model._base_manager._insert(
+                group[start:start + batch_size], fields=fields, using=using, raw=True
+            )
+    return len(objs)
+
+
+def reset_sequences(model_list, using=DEFAULT_DB_ALIAS):
+    """
+        Moves the primary key sequences past explicitly inserted ids, a no-op
+        on databases without sequences.
+    """
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), model_list)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
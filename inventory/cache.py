@@ -0,0 +1,119 @@
+"""
+    Version counters for cached catalog data.
+
+    Cached entries put the current version of their namespace in the key, so
+    bumping the version invalidates all of them at once without having to
+    find and delete the old keys, which simply expire.
+
+    With read replicas ( DATABASE_REPLICAS, see main/routers.py ) a request
+    reading a replica that has not replayed a commit yet can cache the old
+    rows under the version bumped by that commit. The version is bumped once
+    more REPLICA_PIN_SECONDS after the commit, the lag the router already
+    allows the replicas, by a thread of the process.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(namespace):
+    return f"inventory:version:{namespace}"
+
+
+def get_version(namespace):
+    """
+        Returns the current version of the namespace.
+
+        A missing counter ( first use, eviction or a cache restart ) starts
+        from the current time so it can never fall back to a version that
+        still has entries cached under it.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """
+        Moves the namespace to a new version and returns it.
+    """
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # No counter yet, anything cached was stored under an older one
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+class _LaggedBumps:
+    """
+        Bumps namespaces again after a delay from a daemon thread, started
+        on first use. A namespace pending already is bumped when first due,
+        then again for the commits that came after: a namespace bumped all
+        the time is still bumped once per delay.
+    """
+
+    def __init__(self):
+        # {namespace: [due, latest due]}, time.monotonic()
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def add(self, namespace, delay):
+        due = time.monotonic() + delay
+        with self.condition:
+            if namespace in self.pending:
+                self.pending[namespace][1] = due
+            else:
+                self.pending[namespace] = [due, due]
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="lagged-version-bumps", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def _due(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                ready = [namespace for namespace, (due, latest) in self.pending.items() if due <= now]
+                if ready:
+                    break
+                self.condition.wait(min((due for due, latest in self.pending.values()), default=now + 60) - now)
+            for namespace in ready:
+                due, latest = self.pending.pop(namespace)
+                if latest > due:
+                    self.pending[namespace] = [latest, latest]
+            return ready
+
+    def run(self):
+        while True:
+            for namespace in self._due():
+                bump_version(namespace)
+
+
+_lagged = _LaggedBumps()
+
+
+def _bump_committed(namespace):
+    bump_version(namespace)
+    if any(weight > 0 for weight in settings.DATABASE_REPLICAS.values()):
+        _lagged.add(namespace, settings.REPLICA_PIN_SECONDS)
+
+
+def bump_version_on_commit(namespace):
+    """
+        Bumps the version now and again once the current transaction commits,
+        so data read and cached by another request while the transaction was
+        still open cannot outlive it, and with replicas once more after their
+        lag.
+    """
+    bump_version(namespace)
+    transaction.on_commit(lambda: _bump_committed(namespace))
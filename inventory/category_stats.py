@@ -0,0 +1,375 @@
+"""
+    Maintenance of the per category aggregates ( CategoryStats ).
+
+    Each category holds aggregates of its own products, and the same rolled
+    up over its subtree along the MPTT ranges:
+
+        product_count       products linked to the category
+        units               Stock units of the SKUs of those products,
+                            sharded counters included
+        min/max_price       the SKUs' store price range
+        subtree_*           the above summed ( min, max ) over the category
+                            and all of its descendants
+
+    A product linked to several categories of a subtree is counted once per
+    link.
+
+    Writes move them incrementally: adjust_category_stats() applies the
+    changes of some categories to them and to the subtree aggregates of
+    their ancestors with one UPDATE of F() increments. Product and unit
+    deltas are added, a new price only lowers a minimum or raises a
+    maximum. A price leaving the range of a category, its cheapest SKU
+    got dearer or was deleted, has the range recomputed from the
+    category's SKUs and rolled up again over its ancestors.
+
+    The signals in inventory/signals.py apply the saves and the link
+    changes in their transaction. The stock moves of inventory/stock.py
+    and the supplier feeds of inventory/feeds.py apply theirs once
+    committed, the rows of the top categories are updated by every move
+    and would serialize the buyers. Category moves and deletes roll the
+    ancestors of the nodes up again, once per transaction
+    ( rollup_on_commit() ). Bulk loaders skip all of these, the
+    rebuild-category-stats command recomputes everything.
+
+    Pages read the rollups along with the categories, and cache them for
+    CATEGORY_PAGE_CACHE_TIMEOUT seconds rather than per change, every stock
+    move changes them.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, Exists, F, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, Least, Now
+from django.utils import timezone
+from inventory import models
+
+OWN_FIELDS = ("units", "min_price", "max_price")
+SUBTREE_FIELDS = ("subtree_product_count", "subtree_units", "subtree_min_price", "subtree_max_price")
+
+
+def _own_aggregates(category_ids=None):
+    """
+        Returns {category_id: {units, min_price, max_price}} of the
+        categories' products, every category's when category_ids is None.
+        Categories without SKUs are left out.
+    """
+    skus = models.ProductInventory.objects.order_by()
+    shards = models.StockShard.objects.order_by()
+    if category_ids is not None:
+        skus = skus.filter(product__category__in=category_ids)
+        shards = shards.filter(stock__product_inventory__product__category__in=category_ids)
+    aggregates = {
+        row.pop("product__category"): row
+        for row in skus.exclude(product__category=None).values("product__category").annotate(
+            units=Coalesce(Sum("product_inventory__units"), 0),
+            min_price=Min("store_price"),
+            max_price=Max("store_price"),
+        )
+    }
+    for category_id, units in shards.values_list("stock__product_inventory__product__category").annotate(
+        units=Sum("units")
+    ):
+        if category_id in aggregates:
+            aggregates[category_id]["units"] += units
+    return aggregates
+
+
+def _ensure(category_ids):
+    models.CategoryStats.objects.bulk_create(
+        [models.CategoryStats(category_id=category_id) for category_id in category_ids],
+        ignore_conflicts=True,
+    )
+
+
+def _write(category_ids, values, fields):
+    now = timezone.now()
+    models.CategoryStats.objects.bulk_update(
+        [
+            models.CategoryStats(category_id=category_id, updated_at=now, **values[category_id])
+            for category_id in category_ids
+        ],
+        [*fields, "updated_at"],
+        batch_size=1000,
+    )
+
+
+def rollup_category_stats(category_ids=None):
+    """
+        Recomputes the subtree aggregates of the categories and all of their
+        ancestors, of every category when category_ids is None.
+    """
+    nodes = models.Category.objects.all()
+    if category_ids is not None:
+        nodes = models.Category.objects.filter(id__in=list(category_ids)).get_ancestors(include_self=True)
+    subtree = models.CategoryStats.objects.filter(
+        category__tree_id=OuterRef("tree_id"),
+        category__lft__gte=OuterRef("lft"),
+        category__lft__lte=OuterRef("rght"),
+    ).order_by().values("category__tree_id")
+
+    def total(aggregate, field):
+        return Subquery(subtree.annotate(value=aggregate(field)).values("value"))
+
+    rows = nodes.order_by().annotate(
+        rolled_products=total(Sum, "product_count"),
+        rolled_units=total(Sum, "units"),
+        rolled_min_price=total(Min, "min_price"),
+        rolled_max_price=total(Max, "max_price"),
+    ).values_list("id", "rolled_products", "rolled_units", "rolled_min_price", "rolled_max_price")
+    values = {
+        category_id: {
+            "subtree_product_count": products or 0,
+            "subtree_units": units or 0,
+            "subtree_min_price": min_price,
+            "subtree_max_price": max_price,
+        }
+        for category_id, products, units, min_price, max_price in rows
+    }
+    with transaction.atomic():
+        _ensure(values)
+        _write(values, values, SUBTREE_FIELDS)
+    return len(values)
+
+
+def rollup_on_commit(category_ids=None, using=None):
+    """
+        Queues a rollup of the categories and their ancestors, of every
+        category when category_ids is None, for the commit of the current
+        transaction. The calls of a transaction share a single rollup.
+    """
+    connection = transaction.get_connection(using)
+    pending = getattr(connection, "category_stats_rollup", None)
+    # Dropped with the callbacks of a rolled back transaction
+    if pending is not None and any(func == pending.flush for sids, func, *rest in connection.run_on_commit):
+        pending.add(category_ids)
+        return
+    pending = _PendingRollup(connection)
+    pending.add(category_ids)
+    connection.category_stats_rollup = pending
+    transaction.on_commit(pending.flush, using)
+
+
+class _PendingRollup:
+    def __init__(self, connection):
+        self.connection = connection
+        self.category_ids = set()
+
+    def add(self, category_ids):
+        if self.category_ids is None or category_ids is None:
+            self.category_ids = None
+        else:
+            self.category_ids.update(category_id for category_id in category_ids if category_id is not None)
+
+    def flush(self):
+        if getattr(self.connection, "category_stats_rollup", None) is self:
+            del self.connection.category_stats_rollup
+        if self.category_ids is None or self.category_ids:
+            rollup_category_stats(self.category_ids)
+
+
+def _ancestry(category_ids):
+    """
+        Returns {node_id: [category_ids in its subtree]} for the categories
+        and all of their ancestors, with a single query.
+    """
+    nodes = list(models.Category.objects.filter(Exists(models.Category.objects.filter(
+        id__in=category_ids, tree_id=OuterRef("tree_id"), lft__gte=OuterRef("lft"), lft__lte=OuterRef("rght"),
+    ))).order_by().values_list("id", "tree_id", "lft", "rght"))
+    positions = {node_id: (tree_id, lft) for node_id, tree_id, lft, rght in nodes if node_id in category_ids}
+    return {
+        node_id: [
+            category_id for category_id, (category_tree_id, category_lft) in positions.items()
+            if category_tree_id == tree_id and lft <= category_lft <= rght
+        ]
+        for node_id, tree_id, lft, rght in nodes
+    }
+
+
+def _increment(field, deltas):
+    return F(field) + Case(
+        *[When(category_id=category_id, then=Value(delta)) for category_id, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _widen(field, bounds, function):
+    price = models.CategoryStats._meta.get_field(field)
+    return Case(
+        *[
+            When(category_id=category_id, then=function(
+                Coalesce(F(field), Value(bound, output_field=price)), Value(bound, output_field=price)
+            ))
+            for category_id, bound in bounds.items()
+        ],
+        default=F(field),
+        output_field=price,
+    )
+
+
+def _recompute_prices(category_ids):
+    ranges = {
+        category_id: {"min_price": min_price, "max_price": max_price}
+        for category_id, min_price, max_price in models.ProductInventory.objects.filter(
+            product__category__in=category_ids
+        ).order_by().values_list("product__category").annotate(Min("store_price"), Max("store_price"))
+    }
+    empty = {"min_price": None, "max_price": None}
+    _write(category_ids, {category_id: ranges.get(category_id, empty) for category_id in category_ids},
+           ("min_price", "max_price"))
+
+
+def adjust_category_stats(products=None, units=None, added_prices=None, removed_prices=None):
+    """
+        Applies changes given by category id to the categories and the
+        subtree aggregates of their ancestors: products and units are
+        {category_id: delta}, added_prices and removed_prices
+        {category_id: [store prices]} of SKUs that joined or left the
+        category. One UPDATE, the price ranges of a category losing its
+        lowest or highest price are recomputed.
+    """
+    products = {category_id: delta for category_id, delta in (products or {}).items() if delta}
+    units = {category_id: delta for category_id, delta in (units or {}).items() if delta}
+    added, removed = (
+        {
+            category_id: [price for price in category_prices if price is not None]
+            for category_id, category_prices in (prices or {}).items()
+            if any(price is not None for price in category_prices)
+        }
+        for prices in (added_prices, removed_prices)
+    )
+    categories = {*products, *units, *added, *removed}
+    if not categories:
+        return
+    subtrees = _ancestry(categories)
+    values = {}
+    for field, deltas in (("product_count", products), ("units", units)):
+        own = {category_id: delta for category_id, delta in deltas.items() if category_id in subtrees}
+        rolled = {
+            node_id: sum(deltas.get(category_id, 0) for category_id in members)
+            for node_id, members in subtrees.items()
+        }
+        rolled = {node_id: delta for node_id, delta in rolled.items() if delta}
+        if own:
+            values[field] = _increment(field, own)
+        if rolled:
+            values[f"subtree_{field}"] = _increment(f"subtree_{field}", rolled)
+    # A new price only lowers a minimum or raises a maximum
+    for bound, pick, function in (("min", min, Least), ("max", max, Greatest)):
+        own = {category_id: pick(prices) for category_id, prices in added.items() if category_id in subtrees}
+        rolled = {
+            node_id: pick(price for category_id in members for price in added.get(category_id, ()))
+            for node_id, members in subtrees.items()
+            if any(category_id in added for category_id in members)
+        }
+        if own:
+            values[f"{bound}_price"] = _widen(f"{bound}_price", own, function)
+        if rolled:
+            values[f"subtree_{bound}_price"] = _widen(f"subtree_{bound}_price", rolled, function)
+
+    with transaction.atomic():
+        _ensure(subtrees)
+        if values:
+            models.CategoryStats.objects.filter(category_id__in=subtrees).update(updated_at=Now(), **values)
+        if removed:
+            # A price leaving the range may have been its only bound
+            lost = []
+            for category_id, min_price, max_price in models.CategoryStats.objects.filter(
+                category_id__in=removed
+            ).exclude(min_price=None).values_list("category_id", "min_price", "max_price"):
+                if any(price <= min_price or price >= max_price for price in removed[category_id]):
+                    lost.append(category_id)
+            if lost:
+                _recompute_prices(lost)
+                rollup_category_stats(lost)
+
+
+def adjust_sku_stats(units=None, prices=None):
+    """
+        Applies changes of SKUs to the aggregates of their products'
+        categories: units {inventory_id: delta} and prices
+        {inventory_id: [(old, new)]} store price changes.
+    """
+    units = {inventory_id: delta for inventory_id, delta in (units or {}).items() if delta}
+    prices = prices or {}
+    if not units and not prices:
+        return
+    category_units, added, removed = Counter(), defaultdict(list), defaultdict(list)
+    for inventory_id, category_id in models.ProductInventory.objects.filter(
+        id__in=[*units, *prices]
+    ).exclude(product__category=None).values_list("id", "product__category"):
+        category_units[category_id] += units.get(inventory_id, 0)
+        for old, new in prices.get(inventory_id, ()):
+            removed[category_id].append(old)
+            added[category_id].append(new)
+    adjust_category_stats(units=category_units, added_prices=added, removed_prices=removed)
+
+
+def adjust_links(links, delta):
+    """
+        Applies products linked to ( delta 1 ) or unlinked from ( delta -1 )
+        categories, links being ( category_id, product_id ) pairs: the
+        product counts, and the units and prices of the products' SKUs.
+    """
+    links = list(links)
+    if not links:
+        return
+    product_ids = {product_id for category_id, product_id in links}
+    product_units, product_prices = Counter(), defaultdict(list)
+    for product_id, price, stock_units in models.ProductInventory.objects.filter(
+        product__in=product_ids
+    ).values_list("product_id", "store_price", "product_inventory__units"):
+        product_prices[product_id].append(price)
+        product_units[product_id] += stock_units or 0
+    for product_id, shard_units in models.StockShard.objects.filter(
+        stock__product_inventory__product__in=product_ids
+    ).order_by().values_list("stock__product_inventory__product").annotate(Sum("units")):
+        product_units[product_id] += shard_units
+
+    products, units, prices = Counter(), Counter(), defaultdict(list)
+    for category_id, product_id in links:
+        products[category_id] += delta
+        units[category_id] += delta * product_units[product_id]
+        prices[category_id] += product_prices[product_id]
+    adjust_category_stats(
+        products=products, units=units, **{"added_prices" if delta > 0 else "removed_prices": prices}
+    )
+
+
+def adjust_product_prices(product_id, prices):
+    """
+        Applies [(old, new)] store price changes of a product's SKUs, those
+        of a SKU being deleted ( new None ) included.
+    """
+    categories = models.Product.category.through.objects.filter(product_id=product_id).values_list(
+        "category_id", flat=True
+    )
+    adjust_category_stats(
+        added_prices={category_id: [new for old, new in prices] for category_id in categories},
+        removed_prices={category_id: [old for old, new in prices] for category_id in categories},
+    )
+
+
+def rebuild_category_stats():
+    """
+        Recomputes the aggregates of every category. Returns the number of
+        categories.
+    """
+    counts = dict(models.Category.objects.annotate(count=Count("product")).values_list("id", "count"))
+    aggregates = _own_aggregates()
+    empty = {"units": 0, "min_price": None, "max_price": None}
+    with transaction.atomic():
+        models.CategoryStats.objects.all().delete()
+        models.CategoryStats.objects.bulk_create(
+            [
+                models.CategoryStats(
+                    category_id=category_id, product_count=count, **aggregates.get(category_id, empty)
+                )
+                for category_id, count in counts.items()
+            ],
+            batch_size=1000,
+        )
+        rollup_category_stats()
+    return len(counts)
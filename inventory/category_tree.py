@@ -0,0 +1,16 @@
+"""
+    Version of the category tree.
+
+    The tree almost never changes, the pages rendered from it are cached
+    per version of the "category_tree" namespace ( see inventory/cache.py ):
+    the category page fragment and the listing ETags
+    ( inventory/conditional.py ). The version is bumped by the Category
+    signals in inventory/signals.py.
+"""
+from inventory.cache import get_version
+
+CATEGORY_TREE_NAMESPACE = "category_tree"
+
+
+def get_category_tree_version():
+    return get_version(CATEGORY_TREE_NAMESPACE)
@@ -0,0 +1,150 @@
+"""
+    Catalog change feed.
+
+    Every insert, update and delete of a Product, ProductInventory, Stock or
+    Media row adds a CatalogChange row in the same transaction, from the
+    signals in inventory/signals.py, the bulk stock moves of
+    inventory/stock.py and the supplier feeds of inventory/feeds.py.
+    Downstream systems read the changes after a cursor instead of pulling
+    the whole catalog:
+
+        changes, cursor = changes_since(cursor, limit=500)
+
+    through GET api/changes/?cursor= or the tail-catalog-changes command.
+    Raw saves ( loaddata ) and the bulk loaders are not recorded, a consumer
+    resyncs fully after those.
+
+    Ids are handed out when a row is inserted, not when its transaction
+    commits, so a reader can see id 11 while id 10 is still uncommitted and
+    would skip it for good. On PostgreSQL each change holds the id of its
+    transaction ( txid ), changes are read in (txid, id) order and only from
+    transactions older than every transaction still running: those are all
+    committed or rolled back, nothing can appear before the cursor anymore.
+    A change shows up once the transactions open before it finished, a
+    transaction left open holds back every later change. Elsewhere txid is
+    0 and the order is the id's.
+
+    Neither order is the order of the commits: a transaction started early
+    ( low txid ) can change a row after a later one committed its own
+    change of the row, and is read first. The id is the version of the row
+    instead. A change is recorded after its write, holding the row's lock,
+    so of two changes of a row the later write has the higher id. A
+    consumer keeps the id it applied last per ( model, object_id ) and skips
+    the changes of the row with a lower one.
+
+    Cursors are opaque strings, "" starts from the beginning.
+"""
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.encoding import is_protected_type
+from inventory import models
+from inventory.pagination import InvalidCursor
+
+# The models recorded, by model name
+RECORDED = ("product", "productinventory", "stock", "media")
+
+
+def _postgresql(using):
+    return connections[using].vendor == "postgresql"
+
+
+def _txid(using):
+    # Evaluated by the INSERT, in the writing transaction
+    return RawSQL("txid_current()", []) if _postgresql(using) else 0
+
+
+def snapshot(instance):
+    """
+        The instance's field values by column name, JSON serializable with
+        DjangoJSONEncoder. Saves and bulk updates record the same types.
+    """
+    data = {}
+    for field in instance._meta.concrete_fields:
+        # As read back from the database, a saved instance still holds the
+        # values it was given ( 10 for 10.00 )
+        value = field.to_python(field.value_from_object(instance))
+        if isinstance(value, Decimal):
+            value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+        data[field.attname] = value if is_protected_type(value) else field.value_to_string(instance)
+    return data
+
+
+def record_change(instance, action, using=DEFAULT_DB_ALIAS):
+    """
+        Adds the change of a model instance to the feed.
+    """
+    models.CatalogChange.objects.using(using).create(
+        txid=_txid(using),
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        action=action,
+        data=snapshot(instance),
+    )
+
+
+def record_updates(model, ids, column="id"):
+    """
+        Adds an update of the model's rows whose column is in ids, changed by
+        UPDATEs that send no signal. The rows are read back and recorded with
+        a single INSERT, their data the same snapshot() as a save's.
+    """
+    using = router.db_for_write(models.CatalogChange)
+    models.CatalogChange.objects.using(using).bulk_create([
+        models.CatalogChange(
+            txid=_txid(using),
+            model=model._meta.model_name,
+            object_id=instance.pk,
+            action=models.CatalogChange.UPDATE,
+            data=snapshot(instance),
+        )
+        for instance in model.objects.using(using).filter(**{f"{column}__in": list(ids)})
+    ], batch_size=1000)
+
+
+def record_stock_updates(inventory_ids):
+    """
+        Adds an update of the Stock rows of the SKUs.
+    """
+    record_updates(models.Stock, inventory_ids, "product_inventory_id")
+
+
+def _parse(cursor):
+    if not cursor:
+        return 0, 0
+    try:
+        txid, change_id = (int(part) for part in cursor.split("."))
+    except ValueError:
+        raise InvalidCursor(cursor)
+    return txid, change_id
+
+
+def _format(txid, change_id):
+    return f"{txid}.{change_id}"
+
+
+def changes_since(cursor="", limit=500, model_names=None):
+    """
+        Returns ( changes, cursor ): up to limit changes after cursor as
+        dicts, and the cursor to read the next ones from, the same cursor
+        when there are none yet. model_names restricts them to some of
+        RECORDED. Their id orders the changes of a row, not their position,
+        see the module docstring.
+    """
+    txid, change_id = _parse(cursor)
+    queryset = models.CatalogChange.objects.filter(
+        Q(txid__gt=txid) | Q(txid=txid, id__gt=change_id)
+    ).order_by("txid", "id")
+    if _postgresql(queryset.db):
+        queryset = queryset.filter(txid__lt=RawSQL("txid_snapshot_xmin(txid_current_snapshot())", []))
+    if model_names:
+        queryset = queryset.filter(model__in=model_names)
+
+    changes = list(queryset.values(
+        "txid", "id", "model", "object_id", "action", "data", "changed_at"
+    )[:limit])
+    for change in changes:
+        change["cursor"] = _format(change.pop("txid"), change["id"])
+    return changes, changes[-1]["cursor"] if changes else _format(txid, change_id)
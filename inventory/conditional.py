@@ -0,0 +1,123 @@
+"""
+    Validators ( ETag, Last-Modified ) for conditional GETs of the catalog
+    pages.
+
+    Each is computed with a single query and a couple of cache reads, so
+    revalidating a page the client or a CDN already holds costs one indexed
+    lookup instead of the page's queries and render:
+
+        product page    max(updated_at) and count of the product's SKUs,
+                        whose rows the page then shows without another
+                        query, and the version of the "product:<id>"
+                        namespace
+        category page   the category row with max(updated_at) and count of
+                        the cards in its subtree, and the category tree
+                        version
+
+    updated_at does not move on every change a page shows: stock moves, images,
+    attribute values and deleted rows leave it alone. The signals in
+    inventory/signals.py and the stock functions bump the product's version
+    for those ( touch_products() ). The cards' updated_at follows every
+    refresh and units sync, see inventory/product_cards.py.
+
+    The ETag also keys the template fragment caches of the pages, so a
+    changed page is never served from a stale fragment.
+"""
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from inventory import models
+from inventory.cache import bump_version_on_commit, get_version
+from inventory.category_tree import CATEGORY_TREE_NAMESPACE
+
+PRODUCT_NAMESPACE = "product"
+# Bumped when an attribute value is renamed or deleted, shown by any product
+ATTRIBUTES_NAMESPACE = "attributes"
+
+
+def product_namespace(product_id):
+    return f"{PRODUCT_NAMESPACE}:{product_id}"
+
+
+def touch_products(product_ids):
+    """
+        Changes the ETag of the products' pages.
+    """
+    for product_id in set(product_ids):
+        bump_version_on_commit(product_namespace(product_id))
+
+
+def touch_products_of(inventory_ids):
+    """
+        Changes the ETag of the pages of the products the SKUs belong to.
+    """
+    touch_products(
+        models.ProductInventory.objects.filter(id__in=list(inventory_ids)).values_list(
+            "product_id", flat=True
+        )
+    )
+
+
+def _etag(*parts):
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _latest(*times):
+    times = [time for time in times if time is not None]
+    return max(times) if times else None
+
+
+def product_validators(slug):
+    """
+        Returns {"id", "etag", "last_modified", "skus"} of the product page,
+        None when there is no such product. skus holds the rows of the
+        product's SKUs the page shows, {id: row}, read by the same query.
+    """
+    rows = list(models.ProductInventory.objects.filter(product__slug=slug).values(
+        "id", "product_id", "product__name", "product__updated_at", "sku", "store_price",
+        "product_inventory__units", "updated_at",
+    ))
+    if rows:
+        product_id = rows[0]["product_id"]
+        last_modified = _latest(rows[0]["product__updated_at"], *(row["updated_at"] for row in rows))
+    else:
+        product = models.Product.objects.filter(slug=slug).values("id", "updated_at").first()
+        if product is None:
+            return None
+        product_id, last_modified = product["id"], product["updated_at"]
+    return {
+        "id": product_id,
+        "etag": _etag(
+            "product", product_id, last_modified.isoformat(), len(rows),
+            get_version(product_namespace(product_id)), get_version(ATTRIBUTES_NAMESPACE),
+        ),
+        "last_modified": last_modified,
+        "skus": {row["id"]: row for row in rows},
+    }
+
+
+def category_validators(slug):
+    """
+        Returns {"category", "etag", "last_modified"} of the category page,
+        category being the Category row the listing is read from. None when
+        there is no such category.
+    """
+    cards = models.ProductCard.objects.filter(
+        category__tree_id=OuterRef("tree_id"),
+        category__lft__gte=OuterRef("lft"),
+        category__lft__lte=OuterRef("rght"),
+    ).order_by().values("category__tree_id")
+    category = models.Category.objects.filter(slug=slug).annotate(
+        cards_updated_at=Subquery(cards.annotate(latest=Max("updated_at")).values("latest")),
+        cards=Subquery(cards.annotate(count=Count("id")).values("count")),
+    ).first()
+    if category is None:
+        return None
+    return {
+        "category": category,
+        "etag": _etag(
+            "category", category.id, category.cards_updated_at and category.cards_updated_at.isoformat(),
+            category.cards or 0, get_version(CATEGORY_TREE_NAMESPACE),
+        ),
+        "last_modified": category.cards_updated_at,
+    }
@@ -0,0 +1,65 @@
+"""
+    Row counts of large catalog querysets.
+
+    An exact COUNT(*) reads every matching row, over the joins of products,
+    their category links and SKUs it becomes the slowest query of a page
+    showing "N results". estimated_count() asks PostgreSQL's planner
+    instead, and only counts exactly when the estimate is small enough for
+    a count to be cheap:
+
+        count, exact = estimated_count(queryset)    "about 1,204,000 results"
+
+        unfiltered table    pg_class.reltuples, kept by ANALYZE and autovacuum
+        any other query     the row estimate of EXPLAIN's top plan node
+
+    Estimates are as fresh as the table statistics and can be off by a lot
+    on correlated filters, they are for display, never for paging to the
+    last row.
+
+    The products of a category are counted ahead: CategoryStats holds the
+    number of products linked to each category, moved by F() increments on
+    every change of the links, along with the other aggregates and their
+    subtree rollups, see inventory/category_stats.py.
+"""
+import json
+
+from django.conf import settings
+from django.db import connections
+
+
+def planner_estimate(queryset):
+    """
+        The planner's estimate of the rows of queryset, None on databases
+        other than PostgreSQL or for a table never analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where and not queryset.query.distinct and not queryset.query.is_sliced:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            # -1 until the first ANALYZE
+            return int(row[0]) if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimated_count(queryset, threshold=None):
+    """
+        Returns ( count, exact ): the planner's estimate of the rows of
+        queryset, or their exact count when there is no estimate or it is
+        under threshold ( COUNT_ESTIMATE_THRESHOLD by default ).
+    """
+    threshold = settings.COUNT_ESTIMATE_THRESHOLD if threshold is None else threshold
+    estimate = planner_estimate(queryset)
+    if estimate is None or estimate < threshold:
+        return queryset.count(), True
+    return estimate, False
@@ -0,0 +1,152 @@
+"""
+    Faceted attribute filtering over the SKUs of one product.
+
+    The SKUs ( ProductInventory rows ) of a product are numbered and every
+    ProductAttributeValue gets a bitmap, a Python int where bit n is set when
+    the n-th SKU has that value. Filtering ANDs across attributes and ORs
+    within an attribute, the counts shown next to each value are the SKUs the
+    value would leave when combined with the selection on the other
+    attributes. Both are a handful of integer operations per value.
+
+    Indexes are cached per version of the product's "product:<id>"
+    namespace, which the signals in inventory/signals.py bump when its SKUs
+    or their attribute values change ( touch_products() in
+    inventory/conditional.py ), and of the "attributes" namespace, bumped
+    when a value is renamed or deleted. A write leaves the indexes of the
+    other products cached.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from inventory import models
+from inventory.cache import get_version
+from inventory.conditional import ATTRIBUTES_NAMESPACE, product_namespace
+
+
+def _popcount(bitmap):
+    # int.bit_count() needs Python 3.10
+    return bin(bitmap).count("1")
+
+
+class FacetIndex:
+    """
+        Bitmap index of one product's SKUs by attribute value.
+    """
+
+    def __init__(self, inventory_ids, values):
+        """
+            inventory_ids: SKU ids, bit n stands for inventory_ids[n]
+            values: (inventory_id, value_id, attribute, attribute_value) rows
+        """
+        self.inventory_ids = list(inventory_ids)
+        self.all = (1 << len(self.inventory_ids)) - 1
+        position = {inventory_id: n for n, inventory_id in enumerate(self.inventory_ids)}
+
+        # {attribute: {attribute_value: (value_id, bitmap)}}
+        self.attributes = {}
+        for inventory_id, value_id, attribute, attribute_value in values:
+            attribute_values = self.attributes.setdefault(attribute, {})
+            _, bitmap = attribute_values.get(attribute_value, (value_id, 0))
+            attribute_values[attribute_value] = (
+                value_id, bitmap | 1 << position[inventory_id]
+            )
+
+    @classmethod
+    def build(cls, product_id):
+        """
+            Builds the index of a product in a single query, SKUs without any
+            attribute value come back once with empty value columns.
+        """
+        rows = models.ProductInventory.objects.filter(
+            product_id=product_id
+        ).order_by("id").values_list(
+            "id",
+            "productattributevaluess__attributevalues_id",
+            "productattributevaluess__attributevalues__product_attribute__name",
+            "productattributevaluess__attributevalues__attribute_value",
+        )
+        inventory_ids = []
+        values = []
+        for inventory_id, value_id, attribute, attribute_value in rows:
+            if not inventory_ids or inventory_ids[-1] != inventory_id:
+                inventory_ids.append(inventory_id)
+            if value_id is not None:
+                values.append((inventory_id, value_id, attribute, attribute_value))
+        return cls(inventory_ids, values)
+
+    def selection_from(self, query):
+        """
+            Reads {attribute: {values}} from a QueryDict such as request.GET,
+            ignoring parameters that are not attributes of this product.
+        """
+        return {
+            attribute: set(query.getlist(attribute))
+            for attribute in self.attributes
+            if query.getlist(attribute)
+        }
+
+    def _attribute_mask(self, attribute, selected):
+        attribute_values = self.attributes[attribute]
+        mask = 0
+        for attribute_value in selected:
+            if attribute_value in attribute_values:
+                mask |= attribute_values[attribute_value][1]
+        return mask
+
+    def filter(self, selection):
+        """
+            Returns the matching SKU ids and the facets with their counts.
+        """
+        masks = {
+            attribute: self._attribute_mask(attribute, selected)
+            for attribute, selected in selection.items()
+            if attribute in self.attributes
+        }
+        matched = self.all
+        for mask in masks.values():
+            matched &= mask
+
+        facets = []
+        for attribute in sorted(self.attributes):
+            # Counts ignore the attribute's own selection so the other values
+            # of a selected attribute still show what picking them would add
+            others = self.all
+            for other, mask in masks.items():
+                if other != attribute:
+                    others &= mask
+            selected = selection.get(attribute, ())
+            facets.append({
+                "attribute": attribute,
+                "values": [
+                    {
+                        "id": value_id,
+                        "value": attribute_value,
+                        "count": _popcount(bitmap & others),
+                        "selected": attribute_value in selected,
+                    }
+                    for attribute_value, (value_id, bitmap) in sorted(
+                        self.attributes[attribute].items()
+                    )
+                ],
+            })
+
+        inventory_ids = [
+            inventory_id
+            for n, inventory_id in enumerate(self.inventory_ids)
+            if matched >> n & 1
+        ]
+        return inventory_ids, facets
+
+
+def get_facet_index(product_id):
+    """
+        Returns the FacetIndex of a product, from the cache when it is current.
+    """
+    key = (
+        f"inventory:facets:{product_id}:"
+        f"{get_version(product_namespace(product_id))}:{get_version(ATTRIBUTES_NAMESPACE)}"
+    )
+    index = cache.get(key)
+    if index is None:
+        index = FacetIndex.build(product_id)
+        cache.set(key, index, settings.FACET_INDEX_CACHE_TIMEOUT)
+    return index
@@ -0,0 +1,298 @@
+"""
+    Supplier price and stock feeds.
+
+    A feed is a CSV file with a header line, or NDJSON ( one JSON object a
+    line ), holding a row per SKU keyed by "sku" or "upc" with any of:
+
+        retail_price, store_price, sale_price   the SKU's prices
+        units                                   its stock units
+
+    A missing or empty column leaves the value alone. import_feed() streams
+    the feed a batch at a time, so a file is never held in memory as a
+    whole. Per batch:
+        - the keys are resolved with a single query, which also reads the
+          current prices and units
+        - rows equal to the catalog are skipped, the others are written with
+          one UPDATE ... FROM (VALUES ...) per table, only the columns the
+          feed changed are set
+        - the change feed ( inventory/changes.py ), the listing cards, the
+          product page validators and the category aggregates are updated
+          once for the whole batch, the model signals are not sent
+
+    Each batch is a transaction of its own, an interrupted import keeps the
+    batches written and can simply be run again. Sharded stock
+    ( inventory/stock.py ) is moved by reservations on every shard, its units
+    are not set from a feed.
+"""
+import csv
+import json
+import time
+from collections import Counter
+from functools import partial
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from inventory import models
+from inventory.category_stats import adjust_sku_stats
+from inventory.changes import record_stock_updates, record_updates
+from inventory.conditional import touch_products
+from inventory.product_cards import refresh_product_cards, sync_card_units
+
+KEYS = ("sku", "upc")
+PRICE_FIELDS = ("retail_price", "store_price", "sale_price")
+STOCK_FIELDS = ("units",)
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+class FeedError(Exception):
+    pass
+
+
+def feed_format(path):
+    """
+        The format of a feed file by its extension.
+    """
+    for extension, name in FORMATS.items():
+        if str(path).lower().endswith(extension):
+            return name
+    raise FeedError("Unknown feed format of %s, expected one of %s" % (path, ", ".join(FORMATS)))
+
+
+def read_feed(fp, format):
+    """
+        Yields ( line number, row ) of the feed read from fp, row being None
+        for a line that is not a JSON object.
+    """
+    if format == "csv":
+        reader = csv.DictReader(fp)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def _field(name):
+    model = models.Stock if name in STOCK_FIELDS else models.ProductInventory
+    return model._meta.get_field(name)
+
+
+def clean_row(row):
+    """
+        Returns ( key, values ) of a feed row: key is ("sku", value) or
+        ("upc", value), values the model values of the columns given.
+        Raises ValidationError.
+    """
+    if row is None:
+        raise ValidationError("not a JSON object")
+    key = next(((name, str(row[name])) for name in KEYS if row.get(name) not in (None, "")), None)
+    if key is None:
+        raise ValidationError("no sku or upc")
+    values = {}
+    for name in PRICE_FIELDS + STOCK_FIELDS:
+        if row.get(name) in (None, ""):
+            continue
+        try:
+            values[name] = _field(name).clean(row[name], None)
+        except ValidationError as error:
+            raise ValidationError("%s: %s" % (name, " ".join(error.messages)))
+    if values.get("units", 0) < 0:
+        raise ValidationError("units: must be positive")
+    return key, values
+
+
+class FeedSummary:
+    """
+        What an import changed, or would change on a dry run.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.unknown = 0
+        self.invalid = 0
+        self.sharded = 0
+        # Changed values per field
+        self.fields = Counter()
+        # ( line number, message ) of the invalid rows
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        changed = ", ".join("%s %d" % (name, self.fields[name]) for name in sorted(self.fields))
+        return (
+            "%d rows in %.2fs (%d rows/sec): %d SKUs updated (%s), %d unchanged, %d unknown, "
+            "%d invalid, %d sharded" % (
+                self.rows, self.seconds, self.rows_per_second, self.updated, changed or "nothing",
+                self.unchanged, self.unknown, self.invalid, self.sharded,
+            )
+        )
+
+
+def _resolve(keys):
+    """
+        Returns {key: current row} of the SKUs the keys name, in a single
+        query.
+    """
+    skus = [value for name, value in keys if name == "sku"]
+    upcs = [value for name, value in keys if name == "upc"]
+    rows = models.ProductInventory.objects.filter(Q(sku__in=skus) | Q(upc__in=upcs)).values(
+        "id", "sku", "upc", "product_id", *PRICE_FIELDS,
+        "product_inventory__id", "product_inventory__units", "product_inventory__shards",
+    )
+    found = {}
+    for row in rows:
+        found[("sku", row["sku"])] = row
+        found[("upc", row["upc"])] = row
+    return found
+
+
+def _update(model, key, values, stamp):
+    """
+        Sets the values, {key value: {field: value}}, with one UPDATE ...
+        FROM (VALUES ...) on PostgreSQL. A field missing from a row keeps its
+        value. stamp is a field set to now on every row written.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    now = timezone.now()
+    if connection.vendor != "postgresql":
+        for key_value, changes in values.items():
+            model.objects.using(using).filter(**{key: key_value}).update(**changes, **{stamp: now})
+        return
+
+    fields = [model._meta.get_field(name) for name in sorted({name for row in values.values() for name in row})]
+    quote = connection.ops.quote_name
+    placeholder = "(%s)" % ", ".join(["%s"] * (len(fields) + 1))
+    assignments = [
+        "%s = COALESCE(CAST(feed.%s AS %s), target.%s)" % (
+            quote(field.column), quote(field.name), field.db_type(connection), quote(field.column),
+        )
+        for field in fields
+    ]
+    assignments.append("%s = %%s" % quote(model._meta.get_field(stamp).column))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE %s target SET %s FROM (VALUES %s) AS feed (feed_key, %s) WHERE target.%s = feed.feed_key" % (
+                quote(model._meta.db_table),
+                ", ".join(assignments),
+                ", ".join([placeholder] * len(values)),
+                ", ".join(quote(field.name) for field in fields),
+                quote(model._meta.get_field(key).column),
+            ),
+            [now] + [
+                value
+                for key_value, changes in values.items()
+                for value in (key_value, *(changes.get(field.name) for field in fields))
+            ],
+        )
+
+
+def _apply(batch, summary, dry_run, on_change):
+    found = _resolve({key for number, key, values in batch})
+    prices, stock, product_ids = {}, {}, set()
+    # The moves of the category aggregates
+    price_moves, unit_deltas = {}, Counter()
+    seen = set()
+    for number, key, values in batch:
+        row = found.get(key)
+        if row is None:
+            summary.unknown += 1
+            continue
+        if "units" in values:
+            if row["product_inventory__id"] is None:
+                summary.invalid += 1
+                summary.errors.append((number, "units: the SKU has no stock row"))
+                continue
+            if row["product_inventory__shards"]:
+                summary.sharded += 1
+                values = {name: value for name, value in values.items() if name != "units"}
+
+        changes = {}
+        for name, value in values.items():
+            current = row["product_inventory__units"] if name == "units" else row[name]
+            if value != current:
+                changes[name] = value
+                if on_change is not None:
+                    on_change(row["sku"], name, current, value)
+        if not changes:
+            summary.unchanged += 1
+            continue
+        summary.fields.update(changes.keys())
+        # A SKU given twice is counted once, the last row wins
+        if row["id"] not in seen:
+            summary.updated += 1
+            seen.add(row["id"])
+        price_changes = {name: value for name, value in changes.items() if name in PRICE_FIELDS}
+        if price_changes:
+            prices.setdefault(row["id"], {}).update(price_changes)
+            product_ids.add(row["product_id"])
+        if "store_price" in changes:
+            price_moves.setdefault(row["id"], []).append((row["store_price"], changes["store_price"]))
+        if "units" in changes:
+            stock[row["id"]] = {"units": changes["units"]}
+            unit_deltas[row["id"]] += changes["units"] - row["product_inventory__units"]
+        # The next rows of the batch compare against the new values
+        row.update(price_changes)
+        if "units" in changes:
+            row["product_inventory__units"] = changes["units"]
+
+    if dry_run or not (prices or stock):
+        return
+    with transaction.atomic():
+        if prices:
+            _update(models.ProductInventory, "id", prices, "updated_at")
+            record_updates(models.ProductInventory, prices)
+            # The cards show the default SKU's prices
+            transaction.on_commit(partial(refresh_product_cards, sorted(product_ids)))
+        if stock:
+            _update(models.Stock, "product_inventory", stock, "last_checked")
+            record_stock_updates(stock)
+            transaction.on_commit(partial(sync_card_units, list(stock)))
+            # Prices move the SKU's updated_at, stock does not
+            stocked = {found_row["product_id"] for found_row in found.values() if found_row["id"] in stock}
+            transaction.on_commit(partial(touch_products, stocked))
+        # The price ranges and stock of their categories
+        transaction.on_commit(partial(adjust_sku_stats, units=dict(unit_deltas), prices=price_moves))
+
+
+def import_feed(fp, format, batch_size=5000, dry_run=False, on_change=None):
+    """
+        Applies the feed read from fp, in format "csv" or "ndjson". Nothing
+        is written on a dry run. on_change( sku, field, old, new ) is called
+        for every value changed.
+
+        Returns the FeedSummary.
+    """
+    summary = FeedSummary()
+    started = time.perf_counter()
+    batch = []
+    for number, row in read_feed(fp, format):
+        summary.rows += 1
+        try:
+            key, values = clean_row(row)
+        except ValidationError as error:
+            summary.invalid += 1
+            summary.errors.append((number, " ".join(error.messages)))
+            continue
+        batch.append((number, key, values))
+        if len(batch) >= batch_size:
+            _apply(batch, summary, dry_run, on_change)
+            batch = []
+    if batch:
+        _apply(batch, summary, dry_run, on_change)
+    summary.seconds = time.perf_counter() - started
+    return summary
@@ -0,0 +1,247 @@
+"""
+    Synthetic catalog generator for load tests.
+
+    Rows are generated as plain tuples in a process pool, chunk_size products
+    per task, and written by the parent process with insert_rows()
+    ( inventory/bulk.py ), COPY on PostgreSQL. Primary keys are allocated up
+    front past the current maximum of every table, so the workers never need
+    the database and the chunks can be written in any order.
+
+    Distributions:
+        - categories: a forest of the given depth, each level about
+          categories ** ( 1 / depth ) times wider than the one above, products
+          are put in one or two random leaf categories
+        - variants: 1 to max_variants SKUs per product, most products have a
+          few, the first SKU is the default one
+        - attributes: every SKU gets one value of attributes_per_sku of the
+          generated attributes, prices are log-normal and a quarter of the
+          SKUs are on sale
+"""
+import datetime
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.db import transaction
+from django.db.models import Max
+from inventory import models
+from inventory.bulk import insert_rows, reset_sequences
+
+ATTRIBUTES = {
+    "colour": ["black", "white", "red", "blue", "green", "grey", "brown", "pink", "navy", "beige"],
+    "size": [str(size) for size in range(3, 16)],
+    "material": ["leather", "canvas", "mesh", "suede", "rubber", "synthetic"],
+    "width": ["narrow", "regular", "wide", "extra wide"],
+    "season": ["spring", "summer", "autumn", "winter"],
+}
+
+PRODUCT_COLUMNS = (
+    "id", "web_id", "slug", "name", "description", "is_active", "created_at", "updated_at",
+)
+INVENTORY_COLUMNS = (
+    "id", "sku", "upc", "product_type_id", "product_id", "brand_id", "is_active", "is_default",
+    "retail_price", "store_price", "sale_price", "weight", "created_at", "updated_at",
+)
+STOCK_COLUMNS = (
+    "id", "product_inventory_id", "last_checked", "units", "units_sold", "units_reserved", "shards",
+)
+MEDIA_COLUMNS = (
+    "id", "product_inventory_id", "image", "alt_text", "image_hash", "image_width", "is_feature",
+    "created_at", "updated_at",
+)
+LINK_COLUMNS = ("productinventory_id", "attributevalues_id")
+CATEGORY_LINK_COLUMNS = ("product_id", "category_id")
+
+# Variants per product, 1 to 8, weighted towards a few
+VARIANT_WEIGHTS = [30, 25, 18, 10, 7, 5, 3, 2]
+
+
+def _price(rng):
+    # Log-normal around $60, within the 999.99 the price fields allow
+    return Decimal(min(max(rng.lognormvariate(4.1, 0.7), 1), 900)).quantize(Decimal("0.01"))
+
+
+def generate_chunk(task):
+    """
+        Generates the rows of one chunk of products. Runs in a worker process
+        and only uses the plain values in task.
+    """
+    rng = random.Random(task["seed"])
+    now = task["now"]
+    rows = {
+        "products": [], "category_links": [], "inventories": [], "stocks": [],
+        "media": [], "links": [],
+    }
+    inventory_id = task["first_inventory_id"]
+    media_id = task["first_media_id"]
+
+    for offset, variants in enumerate(task["variants"]):
+        product_id = task["first_product_id"] + offset
+        rows["products"].append((
+            product_id, f"gen{product_id}", f"generated-product-{product_id}",
+            f"generated product {product_id}", "generated product description", True, now, now,
+        ))
+        for category_id in rng.sample(task["leaves"], 2 if rng.random() < 0.2 else 1):
+            rows["category_links"].append((product_id, category_id))
+
+        store_price = _price(rng)
+        brand_id = rng.choice(task["brands"])
+        product_type_id = rng.choice(task["product_types"])
+        attributes = rng.sample(task["attributes"], task["attributes_per_sku"])
+        for variant in range(variants):
+            on_sale = rng.random() < 0.25
+            sale_price = (store_price * Decimal(rng.uniform(0.5, 0.9))).quantize(Decimal("0.01"))
+            rows["inventories"].append((
+                inventory_id, f"G{inventory_id:012d}", f"9{inventory_id:011d}", product_type_id,
+                product_id, brand_id, True, variant == 0,
+                min(store_price * Decimal("1.1"), Decimal("999.99")).quantize(Decimal("0.01")),
+                store_price, sale_price if on_sale else store_price, round(rng.uniform(100, 2000), 1),
+                now, now,
+            ))
+            rows["stocks"].append((
+                inventory_id, inventory_id, now, rng.randint(0, 250), rng.randint(0, 500), 0, 0,
+            ))
+            for image in range(1 + rng.randint(0, 2)):
+                rows["media"].append((
+                    media_id, inventory_id, "images/default.png", "a default image solid color", "", None,
+                    image == 0, now, now,
+                ))
+                media_id += 1
+            for values in attributes:
+                rows["links"].append((inventory_id, rng.choice(values)))
+            inventory_id += 1
+    return rows
+
+
+def _next_id(model):
+    return (model.objects.aggregate(top=Max("id"))["top"] or 0) + 1
+
+
+def _category_forest(count, depth, rng):
+    """
+        Returns [(id, parent_id, level)], ids being positions from 1.
+    """
+    branching = max(count ** (1 / max(depth, 1)), 2)
+    nodes = []
+    previous = []
+    level = 0
+    while len(nodes) < count:
+        width = max(1, round(branching ** level)) if level < depth else count - len(nodes)
+        width = min(width, count - len(nodes))
+        current = []
+        for _ in range(width):
+            node_id = len(nodes) + 1
+            parent_id = rng.choice(previous) if previous else None
+            nodes.append((node_id, parent_id, level))
+            current.append(node_id)
+        previous = current
+        level += 1
+    return nodes
+
+
+def generate_catalog(
+    categories=200, products=10000, depth=3, max_variants=8, attributes_per_sku=3,
+    chunk_size=2000, jobs=None, batch_size=5000, use_copy=True, seed=0, stdout=None,
+):
+    """
+        Generates and writes a synthetic catalog, returns {table: rows}.
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    stamp = int(time.time())
+    totals = {}
+
+    with transaction.atomic():
+        # Categories, brands, types and attributes are few, written up front
+        first_category_id = _next_id(models.Category)
+        forest = _category_forest(categories, depth, rng)
+        parents = {parent_id for _, parent_id, _ in forest if parent_id}
+        models.Category.objects.bulk_create([
+            models.Category(
+                id=first_category_id + node_id - 1,
+                name=f"generated {stamp} {node_id}", slug=f"generated-{stamp}-{node_id}",
+                parent_id=first_category_id + parent_id - 1 if parent_id else None,
+                lft=0, rght=0, tree_id=0, level=level,
+            )
+            for node_id, parent_id, level in forest
+        ], batch_size=batch_size)
+        leaves = [
+            first_category_id + node_id - 1 for node_id, _, _ in forest if node_id not in parents
+        ]
+
+        brands = [
+            models.Brand.objects.create(name=f"generated brand {stamp} {n}").id for n in range(50)
+        ]
+        product_types = [
+            models.ProductType.objects.create(name=f"generated type {stamp} {n}").id for n in range(5)
+        ]
+        attributes = []
+        for name, values in ATTRIBUTES.items():
+            attribute = models.ProductAttribute.objects.create(
+                name=f"generated {stamp} {name}", description=f"generated {name}"
+            )
+            attributes.append([
+                models.ProductAttributeValue.objects.create(
+                    product_attribute=attribute, attribute_value=value
+                ).id
+                for value in values
+            ])
+        attributes_per_sku = min(attributes_per_sku, len(attributes))
+
+        # Chunk tasks with their id ranges, media rows get up to 3 per SKU
+        variants = rng.choices(range(1, max_variants + 1), VARIANT_WEIGHTS[:max_variants], k=products)
+        product_id = _next_id(models.Product)
+        inventory_id = max(_next_id(models.ProductInventory), _next_id(models.Stock))
+        media_id = _next_id(models.Media)
+        tasks = []
+        for start in range(0, products, chunk_size):
+            chunk = variants[start:start + chunk_size]
+            tasks.append({
+                "seed": rng.random(), "now": now, "variants": chunk, "leaves": leaves,
+                "brands": brands, "product_types": product_types, "attributes": attributes,
+                "attributes_per_sku": attributes_per_sku, "first_product_id": product_id,
+                "first_inventory_id": inventory_id, "first_media_id": media_id,
+            })
+            product_id += len(chunk)
+            inventory_id += sum(chunk)
+            media_id += 3 * sum(chunk)
+
+        tables = (
+            ("products", models.Product, PRODUCT_COLUMNS),
+            ("category_links", models.Product.category.through, CATEGORY_LINK_COLUMNS),
+            ("inventories", models.ProductInventory, INVENTORY_COLUMNS),
+            ("stocks", models.Stock, STOCK_COLUMNS),
+            ("media", models.Media, MEDIA_COLUMNS),
+            ("links", models.ProductAttributeValues, LINK_COLUMNS),
+        )
+        started = time.perf_counter()
+        workers = jobs or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            # At most two chunks per worker are waiting to be written, so the
+            # generated rows never pile up in memory when writing is slower
+            pending = deque()
+            tasks = deque(tasks)
+            while tasks or pending:
+                while tasks and len(pending) < workers * 2:
+                    pending.append(pool.submit(generate_chunk, tasks.popleft()))
+                rows = pending.popleft().result()
+                for name, model, columns in tables:
+                    totals[name] = totals.get(name, 0) + insert_rows(
+                        model, columns, rows[name], batch_size=batch_size, use_copy=use_copy
+                    )
+                if stdout is not None:
+                    elapsed = time.perf_counter() - started
+                    stdout.write("%d SKUs written, %d SKUs/min" % (
+                        totals["inventories"], totals["inventories"] / elapsed * 60
+                    ))
+
+        reset_sequences([
+            models.Category, models.Product, models.ProductInventory, models.Stock, models.Media,
+        ])
+        models.Category.objects.rebuild()
+    totals["categories"] = len(forest)
+    return totals
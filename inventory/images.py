@@ -0,0 +1,251 @@
+"""
+    Resized image derivatives for Media.
+
+    Every image is stored resized to each of IMAGE_DERIVATIVE_WIDTHS no wider
+    than the original, in each of IMAGE_DERIVATIVE_FORMATS ( WebP and JPEG
+    by default ), so a page can send a srcset and let the browser download
+    the smallest copy that fills the slot:
+
+        <picture>
+            <source type="image/webp" srcset="{{ media.srcsets.webp }}">
+            <img src="{{ media.image.url }}" srcset="{{ media.srcsets.jpeg }}">
+        </picture>
+
+    Derivatives are named by the sha256 of the original's content,
+    derivatives/ab/abcd.../320.webp, and only generated when missing. An
+    image shared by many Media rows, or uploaded again under another name, is
+    resized once. The Media row keeps the hash and the original's width,
+    which is all the URLs are built from.
+
+    The resizing runs in a process pool of IMAGE_DERIVATIVE_WORKERS, on
+    upload ( see inventory/signals.py ) and through the
+    generate-image-derivatives command for existing rows. The workers read
+    and write files under MEDIA_ROOT, the default FileSystemStorage.
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image, ImageOps, UnidentifiedImageError
+from inventory.conditional import touch_products
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+DERIVATIVES_DIR = "derivatives"
+
+
+def derivative_name(image_hash, width, image_format):
+    return f"{DERIVATIVES_DIR}/{image_hash[:2]}/{image_hash}/{width}.{EXTENSIONS[image_format]}"
+
+
+def derivative_widths(source_width):
+    """
+        The configured widths an image of source_width is resized to, never
+        enlarged. An image narrower than all of them keeps its own width.
+    """
+    widths = [width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width <= source_width]
+    return widths or [source_width]
+
+
+def derivatives(image_hash, image_width, image_format):
+    """
+        (width, url) of an image's derivatives in image_format.
+    """
+    if not image_hash or not image_width:
+        return []
+    return [
+        (width, settings.MEDIA_URL + derivative_name(image_hash, width, image_format))
+        for width in derivative_widths(image_width)
+    ]
+
+
+def srcsets(image_hash, image_width):
+    """
+        {format: "url 160w, url 320w"} for every configured format, empty
+        until the derivatives are generated.
+    """
+    if not image_hash or not image_width:
+        return {}
+    return {
+        image_format: ", ".join(
+            f"{url} {width}w" for width, url in derivatives(image_hash, image_width, image_format)
+        )
+        for image_format in settings.IMAGE_DERIVATIVE_FORMATS
+    }
+
+
+def _save(image, path, image_format, quality):
+    # Written aside and renamed, a reader never sees half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = "%s.%d.part" % (path, os.getpid())
+    if image_format == "jpeg":
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, "white")
+            flattened.paste(image, mask=image.getchannel("A"))
+            image = flattened
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(partial, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(partial, "WEBP", quality=quality, method=4)
+    os.replace(partial, path)
+
+
+def derive(source, root, widths, formats):
+    """
+        Generates the missing derivatives of the image at path source under
+        root. Runs in the worker processes, without Django.
+
+        Returns (sha256, width, derivatives written), or None when the file
+        is missing or not an image.
+    """
+    try:
+        with open(source, "rb") as file:
+            content = file.read()
+    except FileNotFoundError:
+        return None
+    image_hash = hashlib.sha256(content).hexdigest()
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        return None
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    source_width = image.width
+    sizes = [width for width in widths if width <= source_width] or [source_width]
+    missing = [
+        (width, image_format, quality, os.path.join(root, derivative_name(image_hash, width, image_format)))
+        for width in sorted(sizes, reverse=True)
+        for image_format, quality in formats.items()
+    ]
+    missing = [entry for entry in missing if not os.path.exists(entry[3])]
+
+    # Widest first, each resized from the original
+    resized = {}
+    for width, image_format, quality, path in missing:
+        if width not in resized:
+            height = max(round(image.height * width / source_width), 1)
+            resized[width] = (
+                image if width == source_width
+                else image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            )
+        _save(resized[width], path, image_format, quality)
+    return image_hash, source_width, len(missing)
+
+
+def _derive_args(name):
+    return (
+        os.path.join(settings.MEDIA_ROOT, name),
+        str(settings.MEDIA_ROOT),
+        tuple(settings.IMAGE_DERIVATIVE_WIDTHS),
+        dict(settings.IMAGE_DERIVATIVE_FORMATS),
+    )
+
+
+def _derive_name(args):
+    return derive(*args)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+        The process pool shared by the uploads of this process, started on
+        first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS or None)
+        return _pool
+
+
+def derive_images(names, workers=None):
+    """
+        Generates the derivatives of the images named, a process pool of
+        workers processes ( IMAGE_DERIVATIVE_WORKERS by default, 0 runs them
+        here ) resizing several at once. Returns {name: derive() result}.
+    """
+    names = list(dict.fromkeys(names))
+    workers = settings.IMAGE_DERIVATIVE_WORKERS if workers is None else workers
+    tasks = [_derive_args(name) for name in names]
+    if workers == 0 or len(names) <= 1:
+        return {name: derive(*args) for name, args in zip(names, tasks)}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(names, pool.map(_derive_name, tasks, chunksize=4)))
+
+
+def store_results(queryset, results):
+    """
+        Saves the hash and width of each derived image on the rows of
+        queryset still showing it. Returns the rows updated.
+    """
+    updated = 0
+    for name, result in results.items():
+        if result is not None:
+            image_hash, width, written = result
+            rows = queryset.filter(image=name)
+            moved = rows.update(image_hash=image_hash, image_width=width)
+            if moved:
+                # The product pages show the srcsets, an update() moves no
+                # updated_at of their ETags
+                touch_products(rows.values_list("product_inventory__product_id", flat=True))
+            updated += moved
+    return updated
+
+
+def process_media(queryset, workers=None, force=False, batch_size=500):
+    """
+        Generates the derivatives of the images of the Media rows in
+        queryset, the ones without a hash unless force, and saves the hashes.
+
+        Returns the totals: images, missing ( unreadable files ), derivatives
+        written and rows updated.
+    """
+    if not force:
+        queryset = queryset.filter(image_hash="")
+    names = list(queryset.order_by("image").values_list("image", flat=True).distinct())
+    totals = {"images": len(names), "missing": 0, "written": 0, "rows": 0}
+    for start in range(0, len(names), batch_size):
+        results = derive_images(names[start:start + batch_size], workers=workers)
+        totals["missing"] += sum(1 for result in results.values() if result is None)
+        totals["written"] += sum(result[2] for result in results.values() if result is not None)
+        totals["rows"] += store_results(queryset, results)
+    return totals
+
+
+def process_media_later(queryset, names):
+    """
+        Queues the images named on the upload pool, the rows of queryset
+        are updated when they are done. Runs inline when
+        IMAGE_DERIVATIVE_WORKERS is 0.
+    """
+    names = list(dict.fromkeys(names))
+    if settings.IMAGE_DERIVATIVE_WORKERS == 0:
+        store_results(queryset, derive_images(names, workers=0))
+        return
+
+    pool = get_pool()
+    for name in names:
+        future = pool.submit(_derive_name, _derive_args(name))
+
+        def done(future, name=name):
+            # Runs in the pool's management thread, which is not part of a
+            # request and closes its own connection
+            if future.exception() is None:
+                try:
+                    store_results(queryset, {name: future.result()})
+                finally:
+                    close_old_connections()
+
+        future.add_done_callback(done)
@@ -0,0 +1,253 @@
+"""
+    Streaming bulk fixture loader.
+
+    A faster stand-in for a chain of 'loaddata' calls on big fixtures:
+        - fixture files are parsed incrementally, one object at a time, so a
+          file is never held in memory as a whole
+        - objects are written with bulk_insert() ( inventory/bulk.py ) in
+          batches, or COPY on PostgreSQL, instead of one save() each
+        - files are loaded in foreign key dependency order
+        - MPTT fields are computed by a single rebuild() per tree model at the
+          end instead of on every insert
+        - rows/sec are reported per model
+
+    Like loaddata, the model signals are not sent, everything is loaded in a
+    single transaction and rows whose primary key is already in the database
+    are updated, so loading twice is safe. Fixture objects giving their
+    primary key as "id" instead of "pk" keep that id.
+"""
+import json
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.core.serializers.python import Deserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from mptt.models import MPTTModel
+from inventory.bulk import bulk_insert, reset_sequences
+
+
+def iter_json_array(fp, chunk_size=64 * 1024):
+    """
+        Yields the objects of a top level JSON array from a file, reading
+        chunk_size characters at a time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # Skip whitespace and the separators between objects
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            buffer = fp.read(chunk_size)
+            pos = 0
+            eof = not buffer
+            continue
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Fixture is not a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        if buffer[pos] != "{":
+            raise ValueError("Fixture array items must be objects")
+
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The object continues in the next chunk
+            more = fp.read(chunk_size)
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        yield obj
+        pos = end
+        if pos > chunk_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def find_fixture(fixture_name):
+    """
+        Returns the path of a fixture file, looked up like loaddata does in
+        FIXTURE_DIRS and the 'fixtures' directory of every installed app.
+    """
+    dirs = [str(path) for path in settings.FIXTURE_DIRS]
+    dirs += [
+        os.path.join(app_config.path, "fixtures")
+        for app_config in apps.get_app_configs()
+    ]
+    if not fixture_name.endswith(".json"):
+        fixture_name += ".json"
+    for fixture_dir in dirs:
+        path = os.path.join(fixture_dir, fixture_name)
+        if os.path.isfile(path):
+            return path
+    raise CommandError("No fixture named '%s' found." % fixture_name[:-len(".json")])
+
+
+def _fixture_models(path):
+    """
+        Models used in the fixture, read from its first object only.
+    """
+    with open(path, encoding="utf-8") as fp:
+        for obj in iter_json_array(fp):
+            return [apps.get_model(obj["model"])]
+    return []
+
+
+def sort_fixtures(paths):
+    """
+        Orders fixture files so the models a fixture points to with a foreign
+        key are loaded first, keeping the given order otherwise.
+    """
+    file_models = {path: _fixture_models(path) for path in paths}
+    loaded_by = {model: path for path, models in file_models.items() for model in models}
+
+    def depends_on(path):
+        targets = set()
+        for model in file_models[path]:
+            for field in model._meta.concrete_fields:
+                target = field.related_model if field.is_relation else None
+                if target in loaded_by and loaded_by[target] != path:
+                    targets.add(loaded_by[target])
+        return targets
+
+    ordered = []
+    pending = list(paths)
+    while pending:
+        for path in pending:
+            if depends_on(path) <= set(ordered):
+                break
+        else:
+            # A dependency cycle, fall back to the given order
+            path = pending[0]
+        ordered.append(path)
+        pending.remove(path)
+    return ordered
+
+
+class _ModelStats:
+    def __init__(self, model):
+        self.model = model
+        self.rows = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return "%s: %d rows in %.2fs (%d rows/sec)" % (
+            self.model._meta.label, self.rows, self.seconds, self.rows_per_second
+        )
+
+
+def _stream_objects(path):
+    with open(path, encoding="utf-8") as fp:
+        for obj in iter_json_array(fp):
+            if "pk" not in obj and "id" in obj:
+                obj["pk"] = obj.pop("id")
+            yield obj
+
+
+def _flush(model, batch, stats, batch_size, use_copy, using):
+    objs = [deserialized.object for deserialized in batch]
+    if issubclass(model, MPTTModel):
+        # Placeholders, the tree is rebuilt once everything is loaded
+        opts = model._mptt_meta
+        for obj in objs:
+            for attr in (opts.left_attr, opts.right_attr, opts.tree_id_attr, opts.level_attr):
+                if getattr(obj, attr) is None:
+                    setattr(obj, attr, 0)
+    # Rows already there are updated, as loaddata does, the others inserted
+    existing = set(model._base_manager.using(using).filter(
+        pk__in=[obj.pk for obj in objs if obj.pk is not None]
+    ).values_list("pk", flat=True))
+    bulk_insert(
+        model, [obj for obj in objs if obj.pk not in existing],
+        batch_size=batch_size, use_copy=use_copy, using=using,
+    )
+    if existing:
+        # bulk_update() does not call pre_save(), auto_now values are kept too
+        model._base_manager.using(using).bulk_update(
+            [obj for obj in objs if obj.pk in existing],
+            [field.name for field in model._meta.concrete_fields if not field.primary_key],
+            batch_size=batch_size,
+        )
+
+    # Many to many values given inline, written through the link table
+    for deserialized in batch:
+        for field_name, values in (deserialized.m2m_data or {}).items():
+            field = model._meta.get_field(field_name)
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            if deserialized.object.pk in existing:
+                through.objects.using(using).filter(**{f"{source}_id": deserialized.object.pk}).delete()
+            through.objects.using(using).bulk_create([
+                through(**{f"{source}_id": deserialized.object.pk, f"{target}_id": value})
+                for value in values
+            ])
+    stats.rows += len(batch)
+
+
+def load_fixtures(
+    fixture_names, batch_size=1000, use_copy=False, using=DEFAULT_DB_ALIAS, stdout=None
+):
+    """
+        Loads the named fixtures and returns the per model statistics.
+    """
+    paths = sort_fixtures([find_fixture(name) for name in fixture_names])
+    connection = connections[using]
+    stats = {}
+
+    with transaction.atomic(using=using):
+        with connection.constraint_checks_disabled():
+            for path in paths:
+                batches = {}
+                started = time.perf_counter()
+                for deserialized in Deserializer(_stream_objects(path), using=using):
+                    model = type(deserialized.object)
+                    if model not in stats:
+                        stats[model] = _ModelStats(model)
+                    batch = batches.setdefault(model, [])
+                    batch.append(deserialized)
+                    if len(batch) >= batch_size:
+                        _flush(model, batch, stats[model], batch_size, use_copy, using)
+                        batches[model] = []
+                for model, batch in batches.items():
+                    if batch:
+                        _flush(model, batch, stats[model], batch_size, use_copy, using)
+                elapsed = time.perf_counter() - started
+                for model in batches:
+                    stats[model].seconds += elapsed / len(batches)
+
+        loaded = list(stats)
+        connection.check_constraints(table_names=[model._meta.db_table for model in loaded])
+        reset_sequences(loaded, using=using)
+
+        for model in loaded:
+            if issubclass(model, MPTTModel):
+                started = time.perf_counter()
+                model._tree_manager.db_manager(using).rebuild()
+                stats[model].seconds += time.perf_counter() - started
+
+    if stdout is not None:
+        for model_stats in stats.values():
+            stdout.write(str(model_stats))
+    return list(stats.values())
@@ -0,0 +1,57 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from inventory.generator import generate_catalog
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic catalog for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=200, help="Number of categories")
+        parser.add_argument("--products", type=int, default=10000, help="Number of products")
+        parser.add_argument("--depth", type=int, default=3, help="Depth of the category trees")
+        parser.add_argument("--max-variants", type=int, default=8, help="Most SKUs per product ( 1-8 )")
+        parser.add_argument("--attributes", type=int, default=3, help="Attribute values per SKU")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Products per worker task")
+        parser.add_argument("--jobs", type=int, default=None, help="Worker processes ( default: all CPUs )")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT without COPY")
+        parser.add_argument("--no-copy", action="store_true", help="Use INSERTs on PostgreSQL too")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument(
+            "--skip-cards", action="store_true", help="Do not rebuild the product cards afterwards"
+        )
+        parser.add_argument(
+            "--skip-search", action="store_true", help="Do not rebuild the search documents afterwards"
+        )
+        parser.add_argument(
+            "--skip-price-buckets", action="store_true", help="Do not rebuild the price buckets afterwards"
+        )
+        parser.add_argument(
+            "--skip-category-stats", action="store_true", help="Do not rebuild the category stats afterwards"
+        )
+
+    def handle(self, *args, **kwargs):
+        totals = generate_catalog(
+            categories=kwargs["categories"],
+            products=kwargs["products"],
+            depth=kwargs["depth"],
+            max_variants=min(max(kwargs["max_variants"], 1), 8),
+            attributes_per_sku=kwargs["attributes"],
+            chunk_size=kwargs["chunk_size"],
+            jobs=kwargs["jobs"],
+            batch_size=kwargs["batch_size"],
+            use_copy=not kwargs["no_copy"],
+            seed=kwargs["seed"],
+            stdout=self.stdout,
+        )
+        for table, rows in totals.items():
+            self.stdout.write(f"{table}: {rows} rows")
+        if not kwargs["skip_cards"]:
+            call_command("rebuild-product-cards")
+        # Counted from the cards
+        if not kwargs["skip_price_buckets"]:
+            call_command("rebuild-price-buckets")
+        if not kwargs["skip_search"]:
+            call_command("rebuild-search-index")
+        if not kwargs["skip_category_stats"]:
+            call_command("rebuild-category-stats")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from inventory import models
+from inventory.images import process_media
+
+
+class Command(BaseCommand):
+    help = "Generates the resized WebP and JPEG derivatives of the Media images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Processes resizing images, 0 resizes them in this one ( IMAGE_DERIVATIVE_WORKERS by default )",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Also process the images that already have derivatives",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of images handed to the workers at once",
+        )
+
+    def handle(self, *args, **kwargs):
+        totals = process_media(
+            models.Media.objects.all(),
+            workers=kwargs["workers"],
+            force=kwargs["force"],
+            batch_size=kwargs["batch_size"],
+        )
+        if totals["missing"]:
+            self.stderr.write(self.style.WARNING(f"{totals['missing']} images are missing or unreadable"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['images']} images: {totals['written']} derivatives written, "
+            f"{totals['rows']} media rows updated"
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.feeds import FORMATS, FeedError, feed_format, import_feed
+
+
+class Command(BaseCommand):
+    help = "Applies a supplier price and stock feed ( CSV or NDJSON keyed by sku or upc )"
+
+    def add_arguments(self, parser):
+        parser.add_argument("feed", help="Path of the feed file")
+        parser.add_argument(
+            "--format",
+            choices=sorted(set(FORMATS.values())),
+            help="Format of the feed, by its extension by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of feed rows resolved and written at once",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the changes without writing them",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            format = kwargs["format"] or feed_format(kwargs["feed"])
+        except FeedError as error:
+            raise CommandError(str(error))
+
+        # Every change is listed at -v 2
+        on_change = self.write_change if kwargs["verbosity"] > 1 else None
+        try:
+            with open(kwargs["feed"], newline="", encoding="utf-8") as fp:
+                summary = import_feed(
+                    fp, format, batch_size=kwargs["batch_size"], dry_run=kwargs["dry_run"], on_change=on_change,
+                )
+        except OSError as error:
+            raise CommandError(str(error))
+
+        for number, message in summary.errors:
+            self.stderr.write(self.style.WARNING(f"line {number}: {message}"))
+        prefix = "Dry run, nothing written. " if kwargs["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{summary}"))
+
+    def write_change(self, sku, field, old, new):
+        self.stdout.write(f"{sku} {field}: {old} -> {new}")
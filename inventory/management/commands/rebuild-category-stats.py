@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.category_stats import rebuild_category_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the aggregates of every category and their subtree rollups"
+
+    def handle(self, *args, **kwargs):
+        total = rebuild_category_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the stats of {total} categories"))
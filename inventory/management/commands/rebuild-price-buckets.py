@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from inventory import models
+from inventory.price_buckets import rebuild_price_buckets
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the price histograms of the category listings from the product cards"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--category",
+            action="append",
+            default=[],
+            help="Slug of a category to rebuild, all of them by default ( repeatable )",
+        )
+
+    def handle(self, *args, **kwargs):
+        categories = None
+        if kwargs["category"]:
+            categories = models.Category.objects.filter(slug__in=kwargs["category"])
+        total = rebuild_price_buckets(categories)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} price buckets"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from inventory.product_cards import rebuild_product_cards
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the product listing cards from the catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of products read per query",
+        )
+
+    def handle(self, *args, **kwargs):
+        total = rebuild_product_cards(batch_size=kwargs["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} product cards"))
@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from inventory.changes import RECORDED, changes_since
+from inventory.pagination import InvalidCursor
+
+
+class Command(BaseCommand):
+    help = "Writes the catalog changes after a cursor as JSON lines, each with the cursor to resume from"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cursor",
+            default="",
+            help="Cursor of the last change already applied, the whole feed by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of changes read per query",
+        )
+        parser.add_argument(
+            "--models",
+            default="",
+            help="Comma separated models to follow, of %s" % ", ".join(RECORDED),
+        )
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep waiting for new changes instead of stopping at the end of the feed",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between polls with --follow",
+        )
+
+    def handle(self, *args, **kwargs):
+        model_names = [name for name in kwargs["models"].split(",") if name]
+        unknown = [name for name in model_names if name not in RECORDED]
+        if unknown:
+            raise CommandError("Unknown models: %s" % ", ".join(unknown))
+
+        cursor = kwargs["cursor"]
+        total = 0
+        while True:
+            try:
+                changes, cursor = changes_since(cursor, kwargs["batch_size"], model_names)
+            except InvalidCursor:
+                raise CommandError("Invalid cursor: %s" % cursor)
+            for change in changes:
+                self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder))
+            total += len(changes)
+            if len(changes) < kwargs["batch_size"]:
+                if not kwargs["follow"]:
+                    break
+                # Idle between polls, without holding a connection
+                close_old_connections()
+                time.sleep(kwargs["interval"])
+        self.stderr.write(self.style.SUCCESS(f"{total} changes, resume from --cursor {cursor}"))
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.14 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_alter_product_web_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_slug', models.SlugField(help_text='format: copied from category', max_length=150, verbose_name='url safe category name')),
+                ('name', models.CharField(help_text='format: copied from product', max_length=255, verbose_name='product name')),
+                ('slug', models.SlugField(help_text='format: copied from product', max_length=255, verbose_name='product safe URL')),
+                ('store_price', models.DecimalField(blank=True, decimal_places=2, help_text='format: copied from the default sub-product', max_digits=5, null=True, verbose_name='regular store price')),
+                ('units', models.IntegerField(blank=True, help_text='format: copied from the default sub-product stock', null=True, verbose_name='units/qty of stock')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='format: Y-m-d H:M:S', verbose_name='date card last refreshed')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_cards', to='inventory.category')),
+                ('inventory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cards', to='inventory.productinventory')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cards', to='inventory.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['category_slug', 'name'], name='inventory_card_listing_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productcard',
+            unique_together={('category', 'product')},
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.14 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_product_card'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['tree_id', 'lft', 'rght'], include=('id',), name='inventory_category_subtree_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['category'], include=('product', 'name', 'slug', 'store_price', 'units'), name='inventory_card_category_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.14 on 2026-10-18 16:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_category_subtree_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='shards',
+            field=models.PositiveSmallIntegerField(default=0, help_text='format: default-0, 0=not sharded', verbose_name='number of counter shards'),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='units_reserved',
+            field=models.IntegerField(default=0, help_text='format: required, default-0', verbose_name='units reserved for open orders'),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='shard number')),
+                ('units', models.IntegerField(default=0, verbose_name='units/qty of stock')),
+                ('units_sold', models.IntegerField(default=0, verbose_name='units sold to date')),
+                ('units_reserved', models.IntegerField(default=0, verbose_name='units reserved for open orders')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='inventory.stock')),
+            ],
+            options={
+                'unique_together': {('stock', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_product_created_at(apps, schema_editor):
+    ProductCard = apps.get_model('inventory', 'ProductCard')
+    Product = apps.get_model('inventory', 'Product')
+    ProductCard.objects.update(
+        product_created_at=models.Subquery(
+            Product.objects.filter(id=models.OuterRef('product_id')).values('created_at')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcard',
+            name='product_created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='format: copied from product', verbose_name='date product created'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_product_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['product_created_at', 'product'], name='inventory_card_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['category', 'product_created_at', 'product'], name='inventory_card_cat_created_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:31
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The vector is the name at weight A followed by the body at weight B, the
+# same as document_positions() in inventory/search.py
+POSTGRESQL_FORWARD = [
+    """
+    CREATE FUNCTION inventory_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.body, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER inventory_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, body ON inventory_productsearchdocument
+    FOR EACH ROW EXECUTE PROCEDURE inventory_search_vector()
+    """,
+    "CREATE INDEX inventory_search_vector_idx ON inventory_productsearchdocument USING gin (vector)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS inventory_search_vector_idx",
+    "DROP TRIGGER IF EXISTS inventory_search_vector_update ON inventory_productsearchdocument",
+    "DROP FUNCTION IF EXISTS inventory_search_vector()",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_keyset_pagination'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='inventory.product')),
+                ('name', models.CharField(help_text='format: copied from product, searched at weight A', max_length=255, verbose_name='product name')),
+                ('body', models.TextField(blank=True, help_text='format: copied from product, searched at weight B', verbose_name='product description and attribute values')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, help_text='format: set by a trigger on PostgreSQL', null=True, verbose_name='search vector')),
+            ],
+        ),
+        migrations.RunPython(
+            run_on_postgresql(POSTGRESQL_FORWARD), run_on_postgresql(POSTGRESQL_BACKWARD)
+        ),
+    ]
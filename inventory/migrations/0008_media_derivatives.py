@@ -0,0 +1,23 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='format: sha256 of the image, empty until its derivatives are generated', max_length=64, verbose_name='image content hash'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='format: pixels, set with image_hash', null=True, verbose_name='image width'),
+        ),
+    ]
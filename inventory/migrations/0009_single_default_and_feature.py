@@ -0,0 +1,40 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+def keep_first_flagged(model_name, flag, group):
+    """
+        Unflags all but the lowest id of the rows flagged in each group, the
+        row the listings already picked.
+    """
+    def run(apps, schema_editor):
+        model = apps.get_model('inventory', model_name)
+        flagged = model.objects.filter(**{flag: True})
+        first = flagged.order_by().values(group).annotate(first=models.Min('id')).values('first')
+        flagged.exclude(id__in=first).update(**{flag: False})
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_media_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            keep_first_flagged('ProductInventory', 'is_default', 'product'), migrations.RunPython.noop
+        ),
+        migrations.RunPython(
+            keep_first_flagged('Media', 'is_feature', 'product_inventory'), migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='media',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_feature', True)), fields=('product_inventory',), name='inventory_one_feature_image'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinventory',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('product',), name='inventory_one_default_sku'),
+        ),
+    ]
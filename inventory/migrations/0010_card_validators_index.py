@@ -0,0 +1,21 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_single_default_and_feature'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productcard',
+            name='inventory_card_category_idx',
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['category'], include=('product', 'name', 'slug', 'store_price', 'units', 'updated_at'), name='inventory_card_category_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:50
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_card_validators_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txid', models.BigIntegerField(default=0, help_text='format: id of the writing transaction on PostgreSQL, 0 elsewhere', verbose_name='transaction id')),
+                ('model', models.CharField(help_text='format: product, productinventory, stock or media', max_length=32, verbose_name='model name')),
+                ('object_id', models.BigIntegerField(verbose_name='changed row id')),
+                ('action', models.CharField(choices=[('insert', 'insert'), ('update', 'update'), ('delete', 'delete')], max_length=6, verbose_name='change')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='format: field values by column, the last ones for a delete', null=True, verbose_name='row after the change')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, help_text='format: Y-m-d H:M:S', verbose_name='date of the change')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='catalogchange',
+            index=models.Index(fields=['txid', 'id'], name='inventory_change_feed_idx'),
+        ),
+    ]
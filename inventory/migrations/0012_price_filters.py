@@ -0,0 +1,70 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+def copy_sale_prices(apps, schema_editor):
+    # The cards' default SKU prices, as refresh_product_cards() would copy them
+    ProductCard = apps.get_model('inventory', 'ProductCard')
+    ProductInventory = apps.get_model('inventory', 'ProductInventory')
+    sku = ProductInventory.objects.filter(id=models.OuterRef('inventory_id'))
+    ProductCard.objects.update(sale_price=models.Subquery(sku.values('sale_price')[:1]))
+    ProductCard.objects.filter(sale_price__lt=models.F('store_price')).update(on_sale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_catalog_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryPriceBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lower', models.DecimalField(decimal_places=2, help_text='format: included', max_digits=7, verbose_name='lowest price')),
+                ('upper', models.DecimalField(decimal_places=2, help_text='format: excluded', max_digits=7, verbose_name='highest price')),
+                ('products', models.PositiveIntegerField(verbose_name='products in the range')),
+                ('on_sale', models.PositiveIntegerField(default=0, verbose_name='products on sale in the range')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productcard',
+            name='on_sale',
+            field=models.BooleanField(default=False, help_text='format: true=sale price below the store price', verbose_name='on sale'),
+        ),
+        migrations.AddField(
+            model_name='productcard',
+            name='sale_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='format: copied from the default sub-product', max_digits=5, null=True, verbose_name='sale price'),
+        ),
+        migrations.RunPython(copy_sale_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['category', 'store_price'], include=('product', 'product_created_at'), name='inventory_card_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(condition=models.Q(('on_sale', True)), fields=['category', 'product_created_at', 'product'], name='inventory_card_cat_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinventory',
+            index=models.Index(fields=['store_price'], name='inventory_sku_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinventory',
+            index=models.Index(condition=models.Q(('sale_price__lt', django.db.models.expressions.F('store_price'))), fields=['product'], name='inventory_sku_sale_idx'),
+        ),
+        migrations.AddField(
+            model_name='categorypricebucket',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_buckets', to='inventory.category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorypricebucket',
+            unique_together={('category', 'lower')},
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.14 on 2026-10-18 18:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_products(apps, schema_editor):
+    # As rebuild_category_stats() counts them
+    Category = apps.get_model('inventory', 'Category')
+    CategoryStats = apps.get_model('inventory', 'CategoryStats')
+    counts = Category.objects.annotate(count=models.Count('product')).values_list('id', 'count')
+    CategoryStats.objects.bulk_create(
+        [CategoryStats(category_id=category_id, product_count=count) for category_id, count in counts],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_price_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='inventory.category')),
+                ('product_count', models.IntegerField(default=0, help_text='format: products linked to the category itself', verbose_name='products in the category')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='format: Y-m-d H:M:S', verbose_name='date counters last changed')),
+            ],
+            options={
+                'verbose_name_plural': 'category stats',
+            },
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 3.2.14 on 2026-10-18 18:10
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def aggregate_stats(apps, schema_editor):
+    # As rebuild_category_stats() computes them
+    Category = apps.get_model('inventory', 'Category')
+    CategoryStats = apps.get_model('inventory', 'CategoryStats')
+    ProductInventory = apps.get_model('inventory', 'ProductInventory')
+    StockShard = apps.get_model('inventory', 'StockShard')
+    own = {
+        row.pop('product__category'): row
+        for row in ProductInventory.objects.exclude(product__category=None).order_by().values(
+            'product__category'
+        ).annotate(
+            units=Coalesce(models.Sum('product_inventory__units'), 0),
+            min_price=models.Min('store_price'),
+            max_price=models.Max('store_price'),
+        )
+    }
+    shards = StockShard.objects.order_by().values_list('stock__product_inventory__product__category').annotate(
+        units=models.Sum('units')
+    )
+    for category_id, units in shards:
+        if category_id in own:
+            own[category_id]['units'] += units
+    stats = list(CategoryStats.objects.all())
+    for row in stats:
+        values = own.get(row.category_id, {})
+        row.units = values.get('units') or 0
+        row.min_price = values.get('min_price')
+        row.max_price = values.get('max_price')
+    CategoryStats.objects.bulk_update(stats, ['units', 'min_price', 'max_price'], batch_size=1000)
+    counted = {row.category_id for row in stats}
+
+    subtree = CategoryStats.objects.filter(
+        category__tree_id=models.OuterRef('tree_id'),
+        category__lft__gte=models.OuterRef('lft'),
+        category__lft__lte=models.OuterRef('rght'),
+    ).order_by().values('category__tree_id')
+
+    def total(aggregate, field):
+        return models.Subquery(subtree.annotate(value=aggregate(field)).values('value'))
+
+    rolled = Category.objects.order_by().annotate(
+        products=total(models.Sum, 'product_count'),
+        units=total(models.Sum, 'units'),
+        min_price=total(models.Min, 'min_price'),
+        max_price=total(models.Max, 'max_price'),
+    ).values_list('id', 'products', 'units', 'min_price', 'max_price')
+    CategoryStats.objects.bulk_update(
+        [
+            CategoryStats(
+                category_id=category_id, subtree_product_count=products or 0, subtree_units=units or 0,
+                subtree_min_price=min_price, subtree_max_price=max_price,
+            )
+            for category_id, products, units, min_price, max_price in rolled
+            if category_id in counted
+        ],
+        ['subtree_product_count', 'subtree_units', 'subtree_min_price', 'subtree_max_price'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_category_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorystats',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text="format: of the SKUs of the category's products, null-true", max_digits=5, null=True, verbose_name='highest store price'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text="format: of the SKUs of the category's products, null-true", max_digits=5, null=True, verbose_name='lowest store price'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='subtree_max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='format: null-true', max_digits=5, null=True, verbose_name='highest store price in the subtree'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='subtree_min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='format: null-true', max_digits=5, null=True, verbose_name='lowest store price in the subtree'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='subtree_product_count',
+            field=models.IntegerField(default=0, help_text='format: product_count summed over the category and its descendants', verbose_name='products in the subtree'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='subtree_units',
+            field=models.IntegerField(default=0, help_text='format: units summed over the category and its descendants', verbose_name='units in stock in the subtree'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='units',
+            field=models.IntegerField(default=0, help_text="format: stock units of the SKUs of the category's products", verbose_name='units in stock'),
+        ),
+        migrations.RunPython(aggregate_stats, migrations.RunPython.noop),
+    ]
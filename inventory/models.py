@@ -1,6 +1,30 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.dispatch import Signal
 from django.utils.translation import gettext_lazy as _
+from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey, TreeManyToManyField
+from inventory import images
+
+# Sent after the MPTT fields of the category tree were recomputed in bulk
+category_tree_rebuilt = Signal()
+
+
+class CategoryManager(TreeManager):
+    """
+    Tree manager announcing full and partial rebuilds, which update the
+    MPTT fields with queries that send no model signals.
+    """
+
+    def rebuild(self):
+        super().rebuild()
+        category_tree_rebuilt.send(sender=self.model)
+
+    def partial_rebuild(self, tree_id):
+        super().partial_rebuild(tree_id)
+        category_tree_rebuilt.send(sender=self.model)
 
 
 class Category(MPTTModel):
@@ -42,6 +66,8 @@ class Category(MPTTModel):
         help_text=_("Format: not requred"),
     )
 
+    objects = CategoryManager()
+
     class MPTTMeta:
         order_insertion_by = ["name"]
 
@@ -51,6 +77,35 @@ class Category(MPTTModel):
     class Meta:
         verbose_name = _("product category")
         verbose_name_plural = _("product categories")
+        indexes = [
+            # Covers subtree lookups ( tree_id = x AND lft BETWEEN y AND z )
+            # without touching the table, see ProductCardQuerySet
+            models.Index(
+                fields=["tree_id", "lft", "rght"],
+                include=["id"],
+                name="inventory_category_subtree_idx",
+            ),
+        ]
+
+
+class ProductQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+            Products with their default SKU, its stock and its feature image
+            in three queries however many products there are: the products,
+            then each one's default SKU joined to its Stock, then the feature
+            Media of those SKUs. Read them through Product.default_sku and
+            ProductInventory.feature_image.
+        """
+        return self.prefetch_related(
+            Prefetch(
+                "product",
+                queryset=ProductInventory.objects.defaults().select_related(
+                    "product_inventory"
+                ).with_feature_media(),
+                to_attr="default_skus",
+            )
+        )
 
 
 class Product(models.Model):
@@ -116,9 +171,21 @@ class Product(models.Model):
         help_text=_("format: Y-m-d H:M:S"),
     )
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    @property
+    def default_sku(self):
+        """
+            The default ProductInventory row, None for a product without
+            any. Prefetched by Product.objects.for_listing().
+        """
+        if hasattr(self, "default_skus"):
+            return self.default_skus[0] if self.default_skus else None
+        return ProductInventory.objects.filter(product=self).defaults().first()
+
 
 class Brand(models.Model):
     """
@@ -134,6 +201,9 @@ class Brand(models.Model):
         help_text=_("format: required, unique, max-255"),
     )
 
+    def __str__(self):
+        return self.name
+
 
 class ProductType(models.Model):
     """
@@ -201,6 +271,40 @@ class ProductAttributeValue(models.Model):
         return f"{self.product_attribute.name}: {self.attribute_value}"
 
 
+class ProductInventoryQuerySet(models.QuerySet):
+    def defaults(self):
+        """
+            The default SKU of each product: the row flagged 'is_default',
+            or the lowest id when none is, as in inventory/product_cards.py.
+            The flagged rows are read from the partial unique index.
+        """
+        flagged = ProductInventory.objects.filter(product_id=OuterRef("product_id"), is_default=True)
+        first = ProductInventory.objects.filter(
+            product_id=OuterRef("product_id")
+        ).order_by("id").values("id")[:1]
+        return self.filter(Q(is_default=True) | (~Exists(flagged) & Q(id=Subquery(first))))
+
+    def with_feature_media(self):
+        """
+            Prefetches the feature Media rows into feature_media, one query
+            for all the SKUs.
+        """
+        return self.prefetch_related(
+            Prefetch(
+                "media_product_inventory",
+                queryset=Media.objects.filter(is_feature=True).order_by("id"),
+                to_attr="feature_media",
+            )
+        )
+
+    def for_listing(self):
+        """
+            SKUs with their product and stock joined and their feature image
+            prefetched, two queries for any number of rows.
+        """
+        return self.select_related("product", "product_inventory").with_feature_media()
+
+
 class ProductInventory(models.Model):
     """
         Product Inventory Table
@@ -246,13 +350,9 @@ class ProductInventory(models.Model):
         A Product may have many different tuples in Product Inventory table due to
         different SKUs, this field will decide which product is shown as default.
         Eg. X Brand Shoe may have 3 colours, but the red shoe will be shown as default
-        whenever the X Brand Shoe is selected.
+        whenever the X Brand Shoe is selected. At most one row per product is
+        flagged, see make_default().
     """
-    is_default = models.BooleanField(
-        default=False,
-        verbose_name=_("default product"),
-        help_text=_("format: true=sub product is now visible"),
-    )
     is_default = models.BooleanField(
         default=False,
         verbose_name=_("default selection"),
@@ -318,9 +418,57 @@ class ProductInventory(models.Model):
         help_text=_("format: Y-m-d H:M:S"),
     )
 
+    objects = ProductInventoryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["store_price"], name="inventory_sku_price_idx"),
+            # SKUs on sale, a small part of the table
+            models.Index(
+                fields=["product"],
+                condition=Q(sale_price__lt=F("store_price")),
+                name="inventory_sku_sale_idx",
+            ),
+        ]
+        constraints = [
+            # Also the index the default SKU of a product is read from
+            models.UniqueConstraint(
+                fields=["product"],
+                condition=Q(is_default=True),
+                name="inventory_one_default_sku",
+            ),
+        ]
+
     def __str__(self):
         return self.product.name
 
+    def make_default(self):
+        """
+            Makes this the default SKU of its product, unflagging the previous
+            one in the same transaction. The product row is locked, so two
+            switches of the same product run one after the other.
+        """
+        with transaction.atomic():
+            Product.objects.select_for_update().filter(pk=self.product_id).exists()
+            # Saved rather than updated, for the signals ( change feed )
+            for previous in ProductInventory.objects.filter(
+                product_id=self.product_id, is_default=True
+            ).exclude(pk=self.pk):
+                previous.is_default = False
+                previous.save(update_fields=["is_default", "updated_at"])
+            self.is_default = True
+            self.save(update_fields=["is_default", "updated_at"])
+
+    @property
+    def feature_image(self):
+        """
+            The feature Media row, None when there is none. Prefetched by
+            the for_listing() querysets.
+        """
+        if hasattr(self, "feature_media"):
+            return self.feature_media[0] if self.feature_media else None
+        return self.media_product_inventory.filter(is_feature=True).order_by("id").first()
+
 
 class Media(models.Model):
     """
@@ -349,6 +497,21 @@ class Media(models.Model):
         verbose_name=_("alternative text"),
         help_text=_("format: required, max-255"),
     )
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name=_("image content hash"),
+        help_text=_("format: sha256 of the image, empty until its derivatives are generated"),
+    )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("image width"),
+        help_text=_("format: pixels, set with image_hash"),
+    )
     is_feature = models.BooleanField(
         default=False,
         verbose_name=_("product default image"),
@@ -369,6 +532,42 @@ class Media(models.Model):
     class Meta:
         verbose_name = _("product image")
         verbose_name_plural = _("product images")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_inventory"],
+                condition=Q(is_feature=True),
+                name="inventory_one_feature_image",
+            ),
+        ]
+
+    def make_feature(self):
+        """
+            Makes this the feature image of its SKU, unflagging the previous
+            one in the same transaction, under a lock of the SKU row.
+        """
+        with transaction.atomic():
+            ProductInventory.objects.select_for_update().filter(pk=self.product_inventory_id).exists()
+            for previous in Media.objects.filter(
+                product_inventory_id=self.product_inventory_id, is_feature=True
+            ).exclude(pk=self.pk):
+                previous.is_feature = False
+                previous.save(update_fields=["is_feature", "updated_at"])
+            self.is_feature = True
+            self.save(update_fields=["is_feature", "updated_at"])
+
+    def derivatives(self, image_format):
+        """
+            (width, url) of the resized copies in image_format, none until
+            they are generated, see inventory/images.py.
+        """
+        return images.derivatives(self.image_hash, self.image_width, image_format)
+
+    @property
+    def srcsets(self):
+        """
+            {format: srcset} of the resized copies, for <picture> sources.
+        """
+        return images.srcsets(self.image_hash, self.image_width)
 
 
 class Stock(models.Model):
@@ -400,6 +599,50 @@ class Stock(models.Model):
         verbose_name=_("units sold to date"),
         help_text=_("format: required, default-0"),
     )
+    units_reserved = models.IntegerField(
+        default=0,
+        unique=False,
+        null=False,
+        blank=False,
+        verbose_name=_("units reserved for open orders"),
+        help_text=_("format: required, default-0"),
+    )
+    # Hot SKUs spread their counters over StockShard rows, see inventory/stock.py
+    shards = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_("number of counter shards"),
+        help_text=_("format: default-0, 0=not sharded"),
+    )
+
+
+class StockShard(models.Model):
+    """
+    Stock counter shard table
+    Reservations on a sharded SKU only lock one of its shard rows, the SKU's
+    stock is the Stock row plus the sum of its shards.
+    """
+
+    stock = models.ForeignKey(
+        Stock, related_name="counter_shards", on_delete=models.CASCADE
+    )
+    shard = models.PositiveSmallIntegerField(
+        verbose_name=_("shard number"),
+    )
+    units = models.IntegerField(
+        default=0,
+        verbose_name=_("units/qty of stock"),
+    )
+    units_sold = models.IntegerField(
+        default=0,
+        verbose_name=_("units sold to date"),
+    )
+    units_reserved = models.IntegerField(
+        default=0,
+        verbose_name=_("units reserved for open orders"),
+    )
+
+    class Meta:
+        unique_together = (("stock", "shard"),)
 
 
 class ProductAttributeValues(models.Model):
@@ -422,3 +665,355 @@ class ProductAttributeValues(models.Model):
         # A product can'y have the same attribute value twice
         # Eg. A dress' colour can't be red twice
         unique_together = (("attributevalues", "productinventory"),)
+
+
+class ProductCardQuerySet(models.QuerySet):
+    def in_category_subtree(self, category):
+        """
+            Cards of the category and all of its descendants, using the MPTT
+            nested set range instead of walking the tree node by node.
+        """
+        return self.filter(
+            category__tree_id=category.tree_id,
+            category__lft__gte=category.lft,
+            category__lft__lte=category.rght,
+        )
+
+    def priced(self, min_price=None, max_price=None, on_sale=False):
+        """
+            Cards with a store price in [min_price, max_price], either bound
+            optional, and only those on sale when on_sale.
+        """
+        queryset = self
+        if min_price is not None:
+            queryset = queryset.filter(store_price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(store_price__lte=max_price)
+        if on_sale:
+            queryset = queryset.filter(on_sale=True)
+        return queryset
+
+
+class ProductCard(models.Model):
+    """
+    Product listing table ( denormalized read model )
+    One row per product and category holding everything the listing pages
+    show, so a category listing is a single indexed lookup on category_slug.
+    Rows are kept current by the signals in inventory/signals.py and can be
+    rebuilt with the 'rebuild-product-cards' management command.
+    """
+
+    product = models.ForeignKey(
+        Product, related_name="cards", on_delete=models.CASCADE
+    )
+    category = models.ForeignKey(
+        Category, related_name="product_cards", on_delete=models.CASCADE
+    )
+    # The default SKU the price and stock below were copied from
+    inventory = models.ForeignKey(
+        ProductInventory,
+        related_name="cards",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    category_slug = models.SlugField(
+        max_length=150,
+        verbose_name=_("url safe category name"),
+        help_text=_("format: copied from category"),
+    )
+    name = models.CharField(
+        max_length=255,
+        verbose_name=_("product name"),
+        help_text=_("format: copied from product"),
+    )
+    slug = models.SlugField(
+        max_length=255,
+        verbose_name=_("product safe URL"),
+        help_text=_("format: copied from product"),
+    )
+    # Listings page by (product_created_at, product), see inventory/pagination.py
+    product_created_at = models.DateTimeField(
+        verbose_name=_("date product created"),
+        help_text=_("format: copied from product"),
+    )
+    store_price = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("regular store price"),
+        help_text=_("format: copied from the default sub-product"),
+    )
+    sale_price = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("sale price"),
+        help_text=_("format: copied from the default sub-product"),
+    )
+    on_sale = models.BooleanField(
+        default=False,
+        verbose_name=_("on sale"),
+        help_text=_("format: true=sale price below the store price"),
+    )
+    units = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("units/qty of stock"),
+        help_text=_("format: copied from the default sub-product stock"),
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("date card last refreshed"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+
+    objects = ProductCardQuerySet.as_manager()
+
+    class Meta:
+        # A product is listed once per category it belongs to
+        unique_together = (("category", "product"),)
+        indexes = [
+            models.Index(
+                fields=["category_slug", "name"], name="inventory_card_listing_idx"
+            ),
+            # Lets subtree listings and their max(updated_at) ( see
+            # inventory/conditional.py ) read cards with an index-only scan
+            models.Index(
+                fields=["category"],
+                include=["product", "name", "slug", "store_price", "units", "updated_at"],
+                name="inventory_card_category_idx",
+            ),
+            # Keyset pagination of the listings, across categories and in one
+            models.Index(
+                fields=["product_created_at", "product"],
+                name="inventory_card_created_idx",
+            ),
+            models.Index(
+                fields=["category", "product_created_at", "product"],
+                name="inventory_card_cat_created_idx",
+            ),
+            # Price range filters of a category listing, see ProductCardQuerySet
+            models.Index(
+                fields=["category", "store_price"],
+                include=["product", "product_created_at"],
+                name="inventory_card_cat_price_idx",
+            ),
+            # The sale listings, a small part of the cards
+            models.Index(
+                fields=["category", "product_created_at", "product"],
+                condition=Q(on_sale=True),
+                name="inventory_card_cat_sale_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.category_slug}: {self.name}"
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Product search table
+    One row per product with the text searched, see inventory/search.py. On
+    PostgreSQL a trigger sets 'vector' from the name and body and a GIN index
+    covers it, other databases leave it empty.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        related_name="search_document",
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(
+        max_length=255,
+        verbose_name=_("product name"),
+        help_text=_("format: copied from product, searched at weight A"),
+    )
+    body = models.TextField(
+        blank=True,
+        verbose_name=_("product description and attribute values"),
+        help_text=_("format: copied from product, searched at weight B"),
+    )
+    vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name=_("search vector"),
+        help_text=_("format: set by a trigger on PostgreSQL"),
+    )
+
+    def __str__(self):
+        return self.name
+
+
+class CatalogChange(models.Model):
+    """
+    Catalog change feed table ( append-only outbox )
+    One row per insert, update or delete of a Product, ProductInventory,
+    Stock or Media row, written in the same transaction as the change. See
+    inventory/changes.py for reading the feed.
+    """
+
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"
+    ACTIONS = [(INSERT, _("insert")), (UPDATE, _("update")), (DELETE, _("delete"))]
+
+    # Changes are read in (txid, id) order, the id orders the changes of a
+    # row, see inventory/changes.py
+    txid = models.BigIntegerField(
+        default=0,
+        verbose_name=_("transaction id"),
+        help_text=_("format: id of the writing transaction on PostgreSQL, 0 elsewhere"),
+    )
+    model = models.CharField(
+        max_length=32,
+        verbose_name=_("model name"),
+        help_text=_("format: product, productinventory, stock or media"),
+    )
+    object_id = models.BigIntegerField(
+        verbose_name=_("changed row id"),
+    )
+    action = models.CharField(
+        max_length=6,
+        choices=ACTIONS,
+        verbose_name=_("change"),
+    )
+    data = models.JSONField(
+        encoder=DjangoJSONEncoder,
+        null=True,
+        verbose_name=_("row after the change"),
+        help_text=_("format: field values by column, the last ones for a delete"),
+    )
+    changed_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("date of the change"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["txid", "id"], name="inventory_change_feed_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.model} {self.object_id}"
+
+
+class CategoryPriceBucket(models.Model):
+    """
+    Category price histogram table ( precomputed )
+    The number of products of a category's subtree in each price range of
+    PRICE_BUCKET_EDGES, for the price sliders of the listings. Rebuilt by
+    the 'rebuild-price-buckets' management command, see
+    inventory/price_buckets.py.
+    """
+
+    category = models.ForeignKey(
+        Category, related_name="price_buckets", on_delete=models.CASCADE
+    )
+    lower = models.DecimalField(
+        max_digits=7,
+        decimal_places=2,
+        verbose_name=_("lowest price"),
+        help_text=_("format: included"),
+    )
+    upper = models.DecimalField(
+        max_digits=7,
+        decimal_places=2,
+        verbose_name=_("highest price"),
+        help_text=_("format: excluded"),
+    )
+    products = models.PositiveIntegerField(
+        verbose_name=_("products in the range"),
+    )
+    on_sale = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("products on sale in the range"),
+    )
+
+    class Meta:
+        unique_together = (("category", "lower"),)
+
+    def __str__(self):
+        return f"{self.category_id}: {self.lower}-{self.upper}"
+
+
+class CategoryStats(models.Model):
+    """
+    Category aggregates table ( precomputed )
+    Product count, stock units and store price range of the category
+    itself, and rolled up over its whole subtree, so category pages read
+    them in O(categories). Writes move them by F() increments on the
+    categories they touch and their ancestors, see
+    inventory/category_stats.py.
+    """
+
+    category = models.OneToOneField(
+        Category, primary_key=True, related_name="stats", on_delete=models.CASCADE
+    )
+    product_count = models.IntegerField(
+        default=0,
+        verbose_name=_("products in the category"),
+        help_text=_("format: products linked to the category itself"),
+    )
+    units = models.IntegerField(
+        default=0,
+        verbose_name=_("units in stock"),
+        help_text=_("format: stock units of the SKUs of the category's products"),
+    )
+    min_price = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("lowest store price"),
+        help_text=_("format: of the SKUs of the category's products, null-true"),
+    )
+    max_price = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("highest store price"),
+        help_text=_("format: of the SKUs of the category's products, null-true"),
+    )
+    subtree_product_count = models.IntegerField(
+        default=0,
+        verbose_name=_("products in the subtree"),
+        help_text=_("format: product_count summed over the category and its descendants"),
+    )
+    subtree_units = models.IntegerField(
+        default=0,
+        verbose_name=_("units in stock in the subtree"),
+        help_text=_("format: units summed over the category and its descendants"),
+    )
+    subtree_min_price = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("lowest store price in the subtree"),
+        help_text=_("format: null-true"),
+    )
+    subtree_max_price = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("highest store price in the subtree"),
+        help_text=_("format: null-true"),
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("date counters last changed"),
+        help_text=_("format: Y-m-d H:M:S"),
+    )
+
+    class Meta:
+        verbose_name_plural = _("category stats")
+
+    def __str__(self):
+        return f"{self.category_id}: {self.product_count} products"
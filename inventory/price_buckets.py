@@ -0,0 +1,94 @@
+"""
+    Precomputed price histograms of the category listings.
+
+    A listing's price slider shows how many products fall in each price
+    range. Counting them from the cards on every request means reading the
+    whole subtree; instead each category keeps a CategoryPriceBucket row per
+    non empty range of PRICE_BUCKET_EDGES, counting the products of its
+    subtree by the store price of their default SKU:
+
+        edges  (0, 10, 20, 50)   ranges  [0, 10) [10, 20) [20, 50)
+
+    Prices at or over the last edge are not counted. The buckets are rebuilt
+    from the cards by the rebuild-price-buckets command, after
+    rebuild-product-cards or on a schedule, not on every price change, so
+    the counts lag the listings by up to a run. They are served by the JSON
+    API, GET api/price-buckets/?category_id=.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, Q, Value, When
+from inventory import models
+
+
+def bucket_ranges():
+    """
+        The (lower, upper) ranges of PRICE_BUCKET_EDGES.
+    """
+    edges = [Decimal(str(edge)) for edge in settings.PRICE_BUCKET_EDGES]
+    return list(zip(edges, edges[1:]))
+
+
+def _bucket(ranges):
+    # The lower bound of the card's range, None below the first edge or
+    # from the last one on
+    return Case(
+        *(
+            When(store_price__gte=lower, store_price__lt=upper, then=Value(lower))
+            for lower, upper in ranges
+        ),
+        default=None,
+        output_field=DecimalField(max_digits=7, decimal_places=2),
+    )
+
+
+def category_buckets(category, ranges=None):
+    """
+        Returns [CategoryPriceBucket] of the category's subtree, unsaved,
+        counted in a single query. A product listed under several of the
+        subcategories is counted once.
+    """
+    ranges = bucket_ranges() if ranges is None else ranges
+    upper = dict(ranges)
+    rows = (
+        models.ProductCard.objects.in_category_subtree(category)
+        .annotate(bucket=_bucket(ranges))
+        .exclude(bucket=None)
+        .values("bucket")
+        .annotate(
+            products=Count("product", distinct=True),
+            on_sale=Count("product", distinct=True, filter=Q(on_sale=True)),
+        )
+        .order_by("bucket")
+    )
+    return [
+        models.CategoryPriceBucket(
+            category=category,
+            lower=row["bucket"],
+            upper=upper[row["bucket"]],
+            products=row["products"],
+            on_sale=row["on_sale"],
+        )
+        for row in rows
+    ]
+
+
+def rebuild_price_buckets(categories=None):
+    """
+        Replaces the price buckets of categories, every category by default.
+        Each category is replaced in its own transaction. Returns the
+        number of buckets written.
+    """
+    ranges = bucket_ranges()
+    if categories is None:
+        categories = models.Category.objects.only("id", "tree_id", "lft", "rght").iterator()
+    total = 0
+    for category in categories:
+        buckets = category_buckets(category, ranges)
+        with transaction.atomic():
+            models.CategoryPriceBucket.objects.filter(category=category).delete()
+            models.CategoryPriceBucket.objects.bulk_create(buckets)
+        total += len(buckets)
+    return total
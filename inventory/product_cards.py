@@ -0,0 +1,143 @@
+"""
+    Maintenance of the ProductCard read model.
+
+    A card holds one row per (product, category) pair with the name, slug and
+    the store and sale price and stock units of the product's default SKU,
+    flagged on_sale when the sale price is below the store price. The default
+    SKU is the ProductInventory row flagged 'is_default', falling back to the
+    lowest id when no row is flagged ( ProductInventoryQuerySet.defaults() ).
+    The units of a SKU with sharded stock counters ( inventory/stock.py )
+    include its StockShard rows.
+"""
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+from inventory import models
+
+
+def _shard_units(inventory_ref):
+    """
+        Expression of the units held by the counter shards of a SKU, 0 when
+        its stock is not sharded.
+    """
+    return Coalesce(
+        Subquery(
+            models.StockShard.objects.filter(
+                stock__product_inventory_id=inventory_ref
+            ).order_by().values("stock_id").annotate(
+                total=Sum("units")
+            ).values("total")
+        ),
+        0,
+    )
+
+
+def _default_inventories(product_ids):
+    """
+        Returns {product_id: (inventory_id, store_price, sale_price, units)}
+        for the default SKU of each product, in a single query.
+    """
+    rows = models.ProductInventory.objects.filter(
+        product_id__in=product_ids
+    ).defaults().annotate(
+        units=F("product_inventory__units") + _shard_units(OuterRef("id"))
+    ).values_list("product_id", "id", "store_price", "sale_price", "units")
+    return {product_id: values for product_id, *values in rows}
+
+
+def build_product_cards(product_ids):
+    """
+        Returns unsaved ProductCard objects for the given products.
+    """
+    products = {
+        product_id: (name, slug, created_at)
+        for product_id, name, slug, created_at in models.Product.objects.filter(
+            id__in=product_ids
+        ).values_list("id", "name", "slug", "created_at")
+    }
+    defaults = _default_inventories(product_ids)
+    links = models.Product.category.through.objects.filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "category_id", "category__slug")
+
+    cards = []
+    for product_id, category_id, category_slug in links:
+        name, slug, created_at = products[product_id]
+        inventory_id, store_price, sale_price, units = defaults.get(
+            product_id, (None, None, None, None)
+        )
+        cards.append(
+            models.ProductCard(
+                product_id=product_id,
+                category_id=category_id,
+                inventory_id=inventory_id,
+                category_slug=category_slug,
+                name=name,
+                slug=slug,
+                product_created_at=created_at,
+                store_price=store_price,
+                sale_price=sale_price,
+                on_sale=sale_price is not None and sale_price < store_price,
+                units=units,
+            )
+        )
+    return cards
+
+
+def refresh_product_cards(product_ids):
+    """
+        Replaces the cards of the given products with freshly built ones.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    with transaction.atomic():
+        models.ProductCard.objects.filter(product_id__in=product_ids).delete()
+        cards = models.ProductCard.objects.bulk_create(
+            build_product_cards(product_ids)
+        )
+    return len(cards)
+
+
+def sync_card_units(inventory_ids):
+    """
+        Copies the current units of the given SKUs to the cards showing them,
+        in a single UPDATE. Their updated_at moves, it validates the cached
+        listings ( inventory/conditional.py ).
+    """
+    inventory_ids = list(inventory_ids)
+    if not inventory_ids:
+        return 0
+    stock_units = models.Stock.objects.filter(
+        product_inventory_id=OuterRef("inventory_id")
+    ).values("units")
+    return models.ProductCard.objects.filter(inventory_id__in=inventory_ids).update(
+        units=Subquery(stock_units) + _shard_units(OuterRef("inventory_id")),
+        updated_at=Now(),
+    )
+
+
+def rebuild_product_cards(batch_size=1000):
+    """
+        Rebuilds the whole ProductCard table from the catalog, batch_size
+        products at a time. Returns the number of cards written.
+    """
+    total = 0
+    with transaction.atomic():
+        models.ProductCard.objects.all().delete()
+        product_ids = models.Product.objects.order_by("id").values_list(
+            "id", flat=True
+        )
+        batch = []
+        for product_id in product_ids.iterator(chunk_size=batch_size):
+            batch.append(product_id)
+            if len(batch) == batch_size:
+                total += len(models.ProductCard.objects.bulk_create(
+                    build_product_cards(batch)
+                ))
+                batch = []
+        if batch:
+            total += len(models.ProductCard.objects.bulk_create(
+                build_product_cards(batch)
+            ))
+    return total
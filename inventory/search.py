@@ -0,0 +1,437 @@
+"""
+    Product full text search.
+
+    Every product has a ProductSearchDocument holding its name and a body of
+    its description and attribute values, refreshed by the signals in
+    inventory/signals.py or the 'rebuild-search-index' command. Two backends
+    answer queries with the same results:
+
+        PostgresSearchBackend   matches the document's tsvector column, set
+                                by a trigger and covered by a GIN index,
+                                ordered by ts_rank()
+        PythonSearchBackend     an in-memory inverted index of the documents
+                                for SQLite and test runs, ranked like
+                                ts_rank() ( see rank() )
+
+    SEARCH_BACKEND picks one, None picks by database vendor. Text is split
+    the way PostgreSQL's default parser splits plain words, hyphenated words
+    and numbers, and is not stemmed ( the 'simple' configuration ), so both
+    backends hold the same lexemes at the same positions: the name's at
+    weight A, the body's at weight B.
+
+    search() matches the products holding every term of a query.
+    autocomplete() also completes its last, partly typed, term to the most
+    frequent words of the vocabulary starting with it or, when there are
+    none, to words one or two typos away from it.
+"""
+import bisect
+import itertools
+import math
+import re
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from inventory import models
+from inventory.cache import bump_version_on_commit, get_version
+
+SEARCH_NAMESPACE = "search"
+SEARCH_CONFIG = "simple"
+
+# ts_rank() defaults, indexed by weight D, C, B, A
+WEIGHTS = (0.1, 0.2, 0.4, 1.0)
+NAME_WEIGHT = 3
+BODY_WEIGHT = 2
+# tsvector limits: positions are capped, a lexeme keeps its first 256
+MAX_POSITION = 16383
+MAX_POSITIONS = 256
+
+_TOKEN = re.compile(r"\d+\.\d+|[^\W_]+(?:-[^\W_]+)*")
+_AND = "&"
+_OR = "|"
+
+
+def tokenize(text):
+    """
+        Returns the lexemes of text in the order to_tsvector('simple', text)
+        numbers them, a hyphenated word being followed by its parts.
+    """
+    lexemes = []
+    for match in _TOKEN.finditer((text or "").lower()):
+        token = match.group()
+        lexemes.append(token)
+        if "-" in token:
+            lexemes.extend(token.split("-"))
+    return lexemes
+
+
+def query_terms(text):
+    """
+        Returns the distinct terms of a query, hyphenated words as parts.
+    """
+    terms = []
+    for lexeme in tokenize(text):
+        if "-" not in lexeme and lexeme not in terms:
+            terms.append(lexeme)
+    return terms
+
+
+def document_positions(name, body):
+    """
+        Returns {lexeme: [(position, weight)]} like the document's tsvector,
+        setweight(name, 'A') || setweight(body, 'B').
+    """
+    positions = defaultdict(list)
+    shift = 0
+    for text, weight in ((name, NAME_WEIGHT), (body, BODY_WEIGHT)):
+        last = 0
+        for offset, lexeme in enumerate(tokenize(text), 1):
+            last = min(offset, MAX_POSITION)
+            position = min(shift + last, MAX_POSITION)
+            entries = positions[lexeme]
+            if len(entries) < MAX_POSITIONS and (not entries or entries[-1][0] != position):
+                entries.append((position, weight))
+        # The right hand vector is shifted past the left one's last position
+        shift += last
+    return dict(positions)
+
+
+def _rank_or(entries):
+    rank = 0.0
+    for positions in entries:
+        total, best, best_at = 0.0, -1.0, 0
+        for j, (position, weight) in enumerate(positions):
+            total += WEIGHTS[weight] / ((j + 1) * (j + 1))
+            if WEIGHTS[weight] > best:
+                best, best_at = WEIGHTS[weight], j
+        rank += (best + total - best / ((best_at + 1) * (best_at + 1))) / 1.64493406685
+    return rank
+
+
+def _word_distance(distance):
+    return 1e-30 if distance > 100 else 1.0 / (1.005 + 0.05 * math.exp(distance / 1.5 - 2))
+
+
+def _rank_and(entries):
+    rank = -1.0
+    for i, positions in enumerate(entries):
+        for other in entries[:i]:
+            for position, weight in positions:
+                for other_position, other_weight in other:
+                    distance = abs(position - other_position)
+                    if distance:
+                        weighted = math.sqrt(
+                            WEIGHTS[weight] * WEIGHTS[other_weight] * _word_distance(distance)
+                        )
+                        rank = weighted if rank < 0 else 1.0 - (1.0 - rank) * (1.0 - weighted)
+    return rank
+
+
+def rank(positions, operator, terms):
+    """
+        ts_rank() of a document for a query: AND queries of two terms or
+        more are ranked by how close the terms are, the others by how often
+        and with which weight they appear. Only the matched terms count, the
+        result being divided by the number of terms for OR queries.
+    """
+    entries = [positions[term] for term in sorted(set(terms)) if term in positions]
+    if operator == _AND and len(set(terms)) >= 2:
+        value = _rank_and(entries)
+    else:
+        value = _rank_or(entries) / len(set(terms)) if terms else 0.0
+    return value if value >= 0 else 1e-20
+
+
+class Query:
+    """
+        A query as required terms and an optional group of alternatives,
+        one of which is required too: 'a' & 'b' & ( 'c' | 'd' ).
+    """
+
+    def __init__(self, required, alternatives=()):
+        self.required = list(required)
+        self.alternatives = [term for term in alternatives if term not in self.required]
+
+    def __bool__(self):
+        return bool(self.required or self.alternatives)
+
+    @property
+    def terms(self):
+        return self.required + self.alternatives
+
+    @property
+    def operator(self):
+        # The operator at the top of the query tree, what ts_rank() looks at
+        if len(self.required) + bool(self.alternatives) >= 2:
+            return _AND
+        return _OR
+
+    def tsquery(self):
+        """
+            The query in to_tsquery() syntax, terms quoted.
+        """
+        parts = ["'%s'" % term for term in self.required]
+        if self.alternatives:
+            group = " | ".join("'%s'" % term for term in self.alternatives)
+            parts.append("( %s )" % group if parts else group)
+        return " & ".join(parts)
+
+
+####
+# Vocabulary and autocomplete
+###
+
+
+def _within(word, other, limit):
+    """
+        Whether the edit distance of two words is at most limit.
+    """
+    if abs(len(word) - len(other)) > limit:
+        return False
+    previous = list(range(len(other) + 1))
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, other_char in enumerate(other, 1):
+            current.append(min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other_char)
+            ))
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+class Vocabulary:
+    """
+        The indexed words and the number of documents holding each.
+    """
+
+    def __init__(self, frequencies):
+        self.frequencies = frequencies
+        self.words = sorted(frequencies)
+        self.by_initial = defaultdict(list)
+        for word in self.words:
+            self.by_initial[word[0]].append(word)
+
+    def complete(self, prefix, limit):
+        """
+            Returns up to limit words starting with prefix, or at one typo
+            from it ( two from 7 letters ), most frequent first.
+        """
+        start = bisect.bisect_left(self.words, prefix)
+        found = []
+        for word in itertools.islice(self.words, start, None):
+            if not word.startswith(prefix):
+                break
+            found.append(word)
+        if not found and len(prefix) >= 3:
+            typos = 2 if len(prefix) >= 7 else 1
+            # Compared to the whole word and to its part typed so far
+            found = [
+                word for word in self.by_initial.get(prefix[0], ())
+                if _within(prefix, word, typos) or _within(prefix, word[:len(prefix)], typos)
+            ]
+        found.sort(key=lambda word: (-self.frequencies[word], word))
+        return found[:limit]
+
+
+####
+# Backends
+###
+
+
+class PythonSearchBackend:
+    """
+        Inverted index of every document, held in process memory and rebuilt
+        when the documents change.
+    """
+
+    _index = (None, None)
+
+    def index(self):
+        """
+            Returns ({term: {product_id: positions}}, {product_id: name}).
+        """
+        version = get_version(SEARCH_NAMESPACE)
+        if PythonSearchBackend._index[0] != version:
+            terms = defaultdict(dict)
+            names = {}
+            rows = models.ProductSearchDocument.objects.values_list("product_id", "name", "body")
+            for product_id, name, body in rows.iterator(chunk_size=2000):
+                names[product_id] = name
+                for lexeme, positions in document_positions(name, body).items():
+                    terms[lexeme][product_id] = positions
+            PythonSearchBackend._index = (version, (dict(terms), names))
+        return PythonSearchBackend._index[1]
+
+    def vocabulary(self):
+        terms, names = self.index()
+        return Vocabulary({term: len(postings) for term, postings in terms.items()})
+
+    def search(self, query, limit):
+        terms, names = self.index()
+        candidates = None
+        for term in query.required:
+            found = set(terms.get(term, ()))
+            candidates = found if candidates is None else candidates & found
+        if query.alternatives:
+            found = set().union(*(terms.get(term, ()) for term in query.alternatives))
+            candidates = found if candidates is None else candidates & found
+
+        results = []
+        for product_id in candidates or ():
+            positions = {
+                term: terms[term][product_id] for term in query.terms
+                if product_id in terms.get(term, ())
+            }
+            results.append((product_id, names[product_id], rank(positions, query.operator, query.terms)))
+        results.sort(key=lambda result: (-result[2], result[0]))
+        return results[:limit]
+
+
+class PostgresSearchBackend:
+    """
+        Matches the documents' tsvector column with @@, through its GIN
+        index, and orders them by ts_rank().
+    """
+
+    _vocabulary = (None, None)
+
+    def vocabulary(self):
+        # ts_stat() reads every vector, the vocabulary is kept for
+        # SEARCH_VOCABULARY_TIMEOUT and may miss the newest words meanwhile
+        stored = cache.get("inventory:search:vocabulary")
+        if stored is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT word, ndoc FROM ts_stat('SELECT vector FROM %s')"
+                    % models.ProductSearchDocument._meta.db_table
+                )
+                stored = (time.time_ns(), dict(cursor.fetchall()))
+            cache.set("inventory:search:vocabulary", stored, settings.SEARCH_VOCABULARY_TIMEOUT)
+        # Its lookup tables take longer to build than a query, keep the last
+        stamp, frequencies = stored
+        if PostgresSearchBackend._vocabulary[0] != stamp:
+            PostgresSearchBackend._vocabulary = (stamp, Vocabulary(frequencies))
+        return PostgresSearchBackend._vocabulary[1]
+
+    def search(self, query, limit):
+        table = models.ProductSearchDocument._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT product_id, name, ts_rank(vector, query) AS rank"
+                " FROM %s, to_tsquery(%%s, %%s) query"
+                " WHERE vector @@ query ORDER BY rank DESC, product_id LIMIT %%s" % table,
+                [SEARCH_CONFIG, query.tsquery(), limit],
+            )
+            return cursor.fetchall()
+
+
+def get_search_backend():
+    if settings.SEARCH_BACKEND:
+        return import_string(settings.SEARCH_BACKEND)()
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    return PythonSearchBackend()
+
+
+def search(text, limit=20, backend=None):
+    """
+        Returns [(product_id, name, rank)] of the products holding every term
+        of text, best first.
+    """
+    query = Query(query_terms(text))
+    if not query:
+        return []
+    return (backend or get_search_backend()).search(query, limit)
+
+
+def autocomplete(text, limit=10, backend=None):
+    """
+        Returns [(product_id, name, rank)] for text being typed, its last
+        term completed.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return []
+    backend = backend or get_search_backend()
+    if text[-1:].isspace():
+        query = Query(terms)
+    else:
+        completions = backend.vocabulary().complete(terms[-1], settings.SEARCH_AUTOCOMPLETE_EXPANSIONS)
+        if not completions:
+            return []
+        query = Query(terms[:-1], completions)
+    return backend.search(query, limit)
+
+
+####
+# Documents
+###
+
+
+def build_search_documents(product_ids):
+    """
+        Returns unsaved ProductSearchDocument objects for the given products.
+    """
+    values = defaultdict(set)
+    rows = models.ProductAttributeValues.objects.filter(
+        productinventory__product_id__in=product_ids
+    ).values_list("productinventory__product_id", "attributevalues__attribute_value")
+    for product_id, value in rows:
+        values[product_id].add(value)
+
+    return [
+        models.ProductSearchDocument(
+            product_id=product_id,
+            name=name,
+            body=" ".join([description or ""] + sorted(values[product_id])),
+        )
+        for product_id, name, description in models.Product.objects.filter(
+            id__in=product_ids
+        ).values_list("id", "name", "description")
+    ]
+
+
+def refresh_search_documents(product_ids):
+    """
+        Replaces the search documents of the given products.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    with transaction.atomic():
+        models.ProductSearchDocument.objects.filter(product_id__in=product_ids).delete()
+        documents = models.ProductSearchDocument.objects.bulk_create(
+            build_search_documents(product_ids)
+        )
+        bump_version_on_commit(SEARCH_NAMESPACE)
+    return len(documents)
+
+
+def rebuild_search_documents(batch_size=1000):
+    """
+        Rebuilds every search document, batch_size products at a time.
+        Returns the number of documents written.
+    """
+    total = 0
+    with transaction.atomic():
+        models.ProductSearchDocument.objects.all().delete()
+        product_ids = models.Product.objects.order_by("id").values_list("id", flat=True)
+        batch = []
+        for product_id in product_ids.iterator(chunk_size=batch_size):
+            batch.append(product_id)
+            if len(batch) == batch_size:
+                total += len(models.ProductSearchDocument.objects.bulk_create(
+                    build_search_documents(batch)
+                ))
+                batch = []
+        if batch:
+            total += len(models.ProductSearchDocument.objects.bulk_create(
+                build_search_documents(batch)
+            ))
+        bump_version_on_commit(SEARCH_NAMESPACE)
+    return total
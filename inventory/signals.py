@@ -0,0 +1,360 @@
+"""
+    Signal receivers keeping the inventory read models in step with writes.
+
+    Raw saves ( loaddata ) are skipped, the fixture loaders rebuild the read
+    models once at the end instead. Cached data is invalidated by bumping
+    its version, see inventory/cache.py.
+"""
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+from inventory import models
+from inventory.cache import bump_version_on_commit
+from inventory.category_stats import adjust_links, adjust_product_prices, adjust_sku_stats, rollup_on_commit
+from inventory.category_tree import CATEGORY_TREE_NAMESPACE
+from inventory.changes import record_change
+from inventory.conditional import ATTRIBUTES_NAMESPACE, touch_products, touch_products_of
+from inventory.images import process_media_later
+from inventory.product_cards import refresh_product_cards, sync_card_units
+from inventory.search import refresh_search_documents
+from inventory.stock import stock_levels
+
+
+@receiver(post_save, sender=models.Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_product_cards([instance.pk])
+
+
+@receiver(m2m_changed, sender=models.Product.category.through)
+def product_category_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_product_cards([instance.pk])
+    elif pk_set:
+        # category.product_set.add(...) - pk_set holds the products
+        refresh_product_cards(pk_set)
+    else:
+        # category.product_set.clear() gives no pk_set
+        models.ProductCard.objects.filter(category=instance).delete()
+
+
+@receiver(m2m_changed, sender=models.Product.category.through)
+def product_category_counted(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("pre_remove", "pre_clear"):
+        # A remove's pk_set also holds ids that were not linked and a
+        # clear's is None, the links are read before they go
+        links = sender.objects.filter(**{"category" if reverse else "product": instance})
+        if action == "pre_remove":
+            links = links.filter(**{"product_id__in" if reverse else "category_id__in": pk_set})
+        instance._unlinked = set(links.values_list("product_id" if reverse else "category_id", flat=True))
+        return
+    if action == "post_add":
+        # Only the links added
+        linked = pk_set
+    elif action in ("post_remove", "post_clear"):
+        # Counted once gone, a price range recomputed from the category's
+        # SKUs must not find them
+        linked = instance.__dict__.pop("_unlinked", ())
+    else:
+        return
+    adjust_links(
+        [(instance.pk, product_id) for product_id in linked] if reverse
+        else [(category_id, instance.pk) for category_id in linked],
+        1 if action == "post_add" else -1,
+    )
+
+
+@receiver(pre_delete, sender=models.Product)
+def product_unlinked(sender, instance, **kwargs):
+    # The links are deleted by the cascade, without m2m_changed
+    instance._unlinked = list(sender.category.through.objects.filter(product=instance).values_list(
+        "category_id", flat=True
+    ))
+
+
+@receiver(post_delete, sender=models.Product)
+def product_uncounted(sender, instance, **kwargs):
+    # SKUs protect their product, it had none left
+    adjust_links([(category_id, instance.pk) for category_id in instance.__dict__.pop("_unlinked", ())], -1)
+
+
+@receiver(post_save, sender=models.Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    models.ProductCard.objects.filter(category=instance).exclude(
+        category_slug=instance.slug
+    ).update(category_slug=instance.slug, updated_at=Now())
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+@receiver(node_moved, sender=models.Category)
+@receiver(models.category_tree_rebuilt, sender=models.Category)
+def category_tree_changed(sender, **kwargs):
+    # Raw saves included, loading a category fixture changes the tree too
+    bump_version_on_commit(CATEGORY_TREE_NAMESPACE)
+
+
+@receiver(post_init, sender=models.Category)
+def category_loaded(sender, instance, **kwargs):
+    # The parent whose ancestors hold the node's aggregates, read from
+    # __dict__ not to load it when deferred
+    instance._counted_parent = instance.__dict__.get("parent_id")
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(node_moved, sender=models.Category)
+def category_moved(sender, instance, raw=False, **kwargs):
+    # A new node has nothing to roll up yet
+    if raw or instance.parent_id == instance._counted_parent:
+        return
+    rollup_on_commit([instance._counted_parent, instance.pk])
+    instance._counted_parent = instance.parent_id
+
+
+@receiver(post_delete, sender=models.Category)
+def category_deleted(sender, instance, **kwargs):
+    rollup_on_commit([instance.parent_id])
+
+
+@receiver(models.category_tree_rebuilt, sender=models.Category)
+def category_tree_counted(sender, **kwargs):
+    rollup_on_commit()
+
+
+@receiver(post_save, sender=models.ProductInventory)
+@receiver(post_delete, sender=models.ProductInventory)
+def product_inventory_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Any SKU write may change which row is the default, refresh the product
+    refresh_product_cards([instance.product_id])
+
+
+@receiver(post_save, sender=models.Stock)
+def stock_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Only cards showing this SKU as the default are affected
+    sync_card_units([instance.product_inventory_id])
+
+
+@receiver(post_delete, sender=models.Stock)
+def stock_deleted(sender, instance, using=None, **kwargs):
+    # Once committed, the shards deleted along with it are gone too
+    inventory_id = instance.product_inventory_id
+    transaction.on_commit(lambda: sync_card_units([inventory_id]), using=using)
+
+
+# The category aggregates move by the difference with the values loaded,
+# see inventory/category_stats.py
+@receiver(post_init, sender=models.ProductInventory)
+def product_inventory_loaded(sender, instance, **kwargs):
+    instance._counted_price = instance.__dict__.get("store_price")
+
+
+@receiver(post_save, sender=models.ProductInventory)
+def product_inventory_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._counted_price
+    # Saved as given, 10 for 10.00
+    new = models.ProductInventory._meta.get_field("store_price").to_python(instance.store_price)
+    if old != new:
+        adjust_sku_stats(prices={instance.pk: [(old, new)]})
+    instance._counted_price = new
+
+
+@receiver(post_delete, sender=models.ProductInventory)
+def product_inventory_uncounted(sender, instance, **kwargs):
+    # Its stock protects it, only its price goes
+    adjust_product_prices(instance.product_id, [(instance._counted_price, None)])
+
+
+@receiver(post_init, sender=models.Stock)
+def stock_loaded(sender, instance, **kwargs):
+    instance._counted_units = instance.__dict__.get("units")
+
+
+@receiver(post_save, sender=models.Stock)
+def stock_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    counted = 0 if created else instance._counted_units
+    # Unknown when loaded deferred
+    if counted is not None:
+        adjust_sku_stats(units={instance.product_inventory_id: instance.units - counted})
+    instance._counted_units = instance.units
+
+
+@receiver(pre_delete, sender=models.Stock)
+def stock_uncounted(sender, instance, **kwargs):
+    # Its shards included, deleted along with it
+    level = stock_levels([instance.product_inventory_id]).get(instance.product_inventory_id)
+    if level:
+        adjust_sku_stats(units={instance.product_inventory_id: -level["units"]})
+
+
+# Changes of a product page its updated_at does not show, see
+# inventory/conditional.py. Stock moved by inventory/stock.py touches the
+# products there.
+@receiver(post_save, sender=models.Stock)
+@receiver(post_save, sender=models.Media)
+@receiver(post_delete, sender=models.Media)
+def product_page_sku_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    touch_products_of([instance.product_inventory_id])
+
+
+@receiver(post_save, sender=models.ProductAttributeValues)
+@receiver(post_delete, sender=models.ProductAttributeValues)
+def product_page_values_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    touch_products_of([instance.productinventory_id])
+
+
+@receiver(m2m_changed, sender=models.ProductInventory.attribute_values.through)
+def product_page_values_linked(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        touch_products([instance.product_id])
+    else:
+        touch_products_of(pk_set or ())
+
+
+@receiver(post_init, sender=models.ProductInventory)
+def product_page_sku_loaded(sender, instance, **kwargs):
+    instance._loaded_product = instance.__dict__.get("product_id")
+
+
+@receiver(post_save, sender=models.ProductInventory)
+def product_page_sku_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # The page's updated_at shows a changed SKU, not the facet index
+    # ( inventory/facets.py ) gaining or losing one
+    moved = instance._loaded_product
+    if created or moved != instance.product_id:
+        touch_products({instance.product_id, moved} - {None})
+    instance._loaded_product = instance.product_id
+
+
+@receiver(post_delete, sender=models.ProductInventory)
+def product_page_sku_deleted(sender, instance, **kwargs):
+    touch_products([instance.product_id])
+
+
+@receiver(post_save, sender=models.ProductAttributeValue)
+@receiver(post_delete, sender=models.ProductAttributeValue)
+def attribute_value_changed(sender, raw=False, **kwargs):
+    if raw:
+        return
+    bump_version_on_commit(ATTRIBUTES_NAMESPACE)
+
+
+@receiver(post_save, sender=models.Product)
+def product_search_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_search_documents([instance.pk])
+
+
+def _search_products_of(inventory_ids):
+    refresh_search_documents(set(
+        models.ProductInventory.objects.filter(id__in=inventory_ids).values_list(
+            "product_id", flat=True
+        )
+    ))
+
+
+@receiver(post_save, sender=models.ProductAttributeValues)
+@receiver(post_delete, sender=models.ProductAttributeValues)
+def sku_search_values_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _search_products_of([instance.productinventory_id])
+
+
+@receiver(m2m_changed, sender=models.ProductInventory.attribute_values.through)
+def sku_search_values_linked(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_search_documents([instance.product_id])
+    elif pk_set:
+        # value.product_attribute_values.add(...) - pk_set holds the SKUs
+        _search_products_of(pk_set)
+
+
+@receiver(post_save, sender=models.ProductAttributeValue)
+def attribute_value_search_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    _search_products_of(
+        models.ProductAttributeValues.objects.filter(attributevalues=instance).values_list(
+            "productinventory_id", flat=True
+        )
+    )
+
+
+@receiver(post_delete, sender=models.ProductInventory)
+def sku_search_deleted(sender, instance, **kwargs):
+    refresh_search_documents([instance.product_id])
+
+
+@receiver(post_init, sender=models.Media)
+def media_loaded(sender, instance, **kwargs):
+    # The raw value, reading the field would load it when deferred
+    image = instance.__dict__.get("image")
+    instance._loaded_image = getattr(image, "name", image)
+
+
+@receiver(pre_save, sender=models.Media)
+def media_image_replaced(sender, instance, raw=False, **kwargs):
+    if raw or instance.image.name == instance._loaded_image:
+        return
+    # The derivatives are those of the previous image
+    instance.image_hash = ""
+    instance.image_width = None
+
+
+@receiver(post_save, sender=models.Media)
+def media_saved(sender, instance, raw=False, **kwargs):
+    instance._loaded_image = instance.image.name
+    if raw or instance.image_hash or not instance.image:
+        return
+    name = instance.image.name
+    if not default_storage.exists(name):
+        return
+    transaction.on_commit(lambda: process_media_later(
+        models.Media.objects.filter(pk=instance.pk), [name]
+    ))
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_save, sender=models.ProductInventory)
+@receiver(post_save, sender=models.Stock)
+@receiver(post_save, sender=models.Media)
+def catalog_row_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    action = models.CatalogChange.INSERT if created else models.CatalogChange.UPDATE
+    record_change(instance, action, using=using)
+
+
+@receiver(post_delete, sender=models.Product)
+@receiver(post_delete, sender=models.ProductInventory)
+@receiver(post_delete, sender=models.Stock)
+@receiver(post_delete, sender=models.Media)
+def catalog_row_deleted(sender, instance, using=None, **kwargs):
+    record_change(instance, models.CatalogChange.DELETE, using=using)
@@ -0,0 +1,291 @@
+"""
+    Concurrency safe stock reservations.
+
+    Counters are never read, changed and written back: every change is a
+    conditional UPDATE ( units = units - n WHERE units >= n ), so the database
+    serializes concurrent changes of a row and a change the row can no longer
+    cover updates nothing instead of overselling.
+
+        reserve({inventory_id: n})  units -> units_reserved, when ordered
+        commit({inventory_id: n})   units_reserved -> units_sold, when paid
+        release({inventory_id: n})  units_reserved -> units, when cancelled
+        restock({inventory_id: n})  adds units
+
+    A call takes any number of SKUs, moved with one statement and all or
+    nothing: InsufficientStock is raised and no counter changes when one of
+    them is short.
+
+    Hot SKUs can be sharded with shard_stock(): their counters are spread
+    over StockShard rows and a change only locks one random shard, so the
+    buyers of a flash sale SKU mostly do not wait on each other. The stock of
+    a sharded SKU is its Stock row plus the sum of its shards ( stock_levels() ),
+    a change needing more units than a single shard holds locks the Stock row
+    and all the shards.
+"""
+import random
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from inventory import models
+from inventory.category_stats import adjust_sku_stats
+from inventory.changes import record_stock_updates
+from inventory.conditional import touch_products_of
+from inventory.product_cards import sync_card_units
+
+COUNTERS = ("units", "units_reserved", "units_sold")
+
+
+class InsufficientStock(Exception):
+    """
+        Raised when a SKU lacks the units to move, shortages holds the
+        inventory ids concerned.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = sorted(shortages)
+        super().__init__("insufficient stock for SKUs %s" % ", ".join(map(str, self.shortages)))
+
+
+class MissingStock(Exception):
+    """
+        Raised when SKUs to restock have no Stock row, inventory_ids holds
+        them.
+    """
+
+    def __init__(self, inventory_ids):
+        self.inventory_ids = sorted(inventory_ids)
+        super().__init__("no stock row for SKUs %s" % ", ".join(map(str, self.inventory_ids)))
+
+
+class _Shortage(Exception):
+    pass
+
+
+def _quantities(quantities):
+    """
+        Returns {inventory_id: units} without the zero quantities.
+    """
+    cleaned = {}
+    for inventory_id, units in dict(quantities).items():
+        units = int(units)
+        if units < 0:
+            raise ValueError("quantities must be positive, got %d for SKU %s" % (units, inventory_id))
+        if units:
+            cleaned[int(inventory_id)] = units
+    return cleaned
+
+
+class _NoShard(Exception):
+    pass
+
+
+def _move_sharded(stock_id, shards, units, source, destination):
+    """
+        Moves units between two counters of a sharded SKU, returns False when
+        its shards hold less than units.
+    """
+    order = list(range(shards))
+    random.shuffle(order)
+    try:
+        # A shard re-checked after waiting on a concurrent update stays locked
+        # even when it no longer matches, rolling the savepoint back frees them
+        with transaction.atomic():
+            for shard in order:
+                moved = models.StockShard.objects.filter(
+                    stock_id=stock_id, shard=shard, **{f"{source}__gte": units}
+                ).update(**{source: F(source) - units, destination: F(destination) + units})
+                if moved:
+                    return True
+            raise _NoShard
+    except _NoShard:
+        pass
+
+    # No single shard covers units: spread them over the shards, the Stock
+    # row lock keeping the callers taking this path from deadlocking on the
+    # shard locks, single shard updates never take it
+    models.Stock.objects.select_for_update().filter(id=stock_id).values_list("id").get()
+    rows = list(
+        models.StockShard.objects.select_for_update().filter(stock_id=stock_id).order_by(
+            "shard"
+        ).values_list("id", source)
+    )
+    if sum(available for _, available in rows) < units:
+        return False
+    remaining = units
+    for shard_id, available in rows:
+        taken = min(available, remaining)
+        if taken:
+            models.StockShard.objects.filter(id=shard_id).update(
+                **{source: F(source) - taken, destination: F(destination) + taken}
+            )
+            remaining -= taken
+        if not remaining:
+            break
+    return True
+
+
+def _move(quantities, source, destination):
+    """
+        Moves units from the source to the destination counter of each SKU,
+        all or nothing.
+    """
+    quantities = _quantities(quantities)
+    if not quantities:
+        return
+    try:
+        with transaction.atomic():
+            # Unsharded SKUs, one statement for the whole batch
+            amount = Case(
+                *[When(product_inventory_id=inventory_id, then=Value(units))
+                  for inventory_id, units in quantities.items()],
+                output_field=IntegerField(),
+            )
+            moved = models.Stock.objects.filter(
+                product_inventory_id__in=quantities, shards=0, **{f"{source}__gte": amount}
+            ).update(**{source: F(source) - amount, destination: F(destination) + amount})
+
+            if moved < len(quantities):
+                rows = models.Stock.objects.filter(
+                    product_inventory_id__in=quantities
+                ).values_list("product_inventory_id", "id", "shards")
+                # Sharded SKUs in stock id order, so batches lock them in the same order
+                sharded = sorted((row for row in rows if row[2]), key=lambda row: row[1])
+                if moved + len(sharded) < len(quantities):
+                    raise _Shortage
+                for inventory_id, stock_id, shards in sharded:
+                    if not _move_sharded(stock_id, shards, quantities[inventory_id], source, destination):
+                        raise _Shortage
+            record_stock_updates(quantities)
+            if "units" in (source, destination):
+                transaction.on_commit(partial(sync_card_units, list(quantities)))
+                transaction.on_commit(partial(touch_products_of, list(quantities)))
+                # Once committed, the top categories' rows are updated by
+                # every move and would serialize the buyers
+                sign = -1 if source == "units" else 1
+                transaction.on_commit(partial(adjust_sku_stats, units={
+                    inventory_id: sign * units for inventory_id, units in quantities.items()
+                }))
+    except _Shortage:
+        levels = stock_levels(quantities)
+        raise InsufficientStock([
+            inventory_id for inventory_id, units in quantities.items()
+            if levels.get(inventory_id, {}).get(source, 0) < units
+        ])
+
+
+def reserve(quantities):
+    """
+        Reserves {inventory_id: units} for an order.
+    """
+    _move(quantities, "units", "units_reserved")
+
+
+def commit(quantities):
+    """
+        Turns reserved {inventory_id: units} into sold units.
+    """
+    _move(quantities, "units_reserved", "units_sold")
+
+
+def release(quantities):
+    """
+        Puts reserved {inventory_id: units} back in stock.
+    """
+    _move(quantities, "units_reserved", "units")
+
+
+def restock(quantities):
+    """
+        Adds {inventory_id: units} to the stock, a random shard of sharded
+        SKUs receiving them. All or nothing, MissingStock is raised when a
+        SKU has no Stock row.
+    """
+    quantities = _quantities(quantities)
+    if not quantities:
+        return
+    with transaction.atomic():
+        amount = Case(
+            *[When(product_inventory_id=inventory_id, then=Value(units))
+              for inventory_id, units in quantities.items()],
+            output_field=IntegerField(),
+        )
+        moved = models.Stock.objects.filter(product_inventory_id__in=quantities, shards=0).update(
+            units=F("units") + amount
+        )
+        sharded = list(models.Stock.objects.filter(
+            product_inventory_id__in=quantities, shards__gt=0
+        ).values_list("product_inventory_id", "id", "shards"))
+        # Nothing to add the units to, the change feed, cards and category
+        # stats would count units no row holds
+        if moved + len(sharded) < len(quantities):
+            raise MissingStock(set(quantities) - set(models.Stock.objects.filter(
+                product_inventory_id__in=quantities
+            ).values_list("product_inventory_id", flat=True)))
+        for inventory_id, stock_id, shards in sharded:
+            models.StockShard.objects.filter(
+                stock_id=stock_id, shard=random.randrange(shards)
+            ).update(units=F("units") + quantities[inventory_id])
+        record_stock_updates(quantities)
+        transaction.on_commit(partial(sync_card_units, list(quantities)))
+        transaction.on_commit(partial(touch_products_of, list(quantities)))
+        transaction.on_commit(partial(adjust_sku_stats, units=quantities))
+
+
+def stock_levels(inventory_ids):
+    """
+        Returns {inventory_id: {"units", "units_reserved", "units_sold"}},
+        shards included.
+    """
+    levels = {
+        row.pop("product_inventory_id"): row
+        for row in models.Stock.objects.filter(product_inventory_id__in=inventory_ids).values(
+            "product_inventory_id", *COUNTERS
+        )
+    }
+    shards = models.StockShard.objects.filter(
+        stock__product_inventory_id__in=inventory_ids
+    ).order_by().values("stock__product_inventory_id").annotate(
+        **{f"shard_{counter}": Sum(counter) for counter in COUNTERS}
+    )
+    for row in shards:
+        level = levels[row["stock__product_inventory_id"]]
+        for counter in COUNTERS:
+            level[counter] += row[f"shard_{counter}"]
+    return levels
+
+
+def shard_stock(inventory_id, shards):
+    """
+        Spreads the counters of a SKU over shards StockShard rows, 0 folds
+        them back into the Stock row. Units sold stay on the Stock row.
+    """
+    with transaction.atomic():
+        stock = models.Stock.objects.select_for_update().get(product_inventory_id=inventory_id)
+        existing = models.StockShard.objects.select_for_update().filter(stock=stock)
+        totals = {"units": stock.units, "units_reserved": stock.units_reserved}
+        for shard in existing:
+            totals["units"] += shard.units
+            totals["units_reserved"] += shard.units_reserved
+            stock.units_sold += shard.units_sold
+        existing.delete()
+
+        if shards > 1:
+            units, units_extra = divmod(totals["units"], shards)
+            reserved, reserved_extra = divmod(totals["units_reserved"], shards)
+            models.StockShard.objects.bulk_create([
+                models.StockShard(
+                    stock=stock, shard=shard,
+                    units=units + (shard < units_extra),
+                    units_reserved=reserved + (shard < reserved_extra),
+                )
+                for shard in range(shards)
+            ])
+            stock.units, stock.units_reserved, stock.shards = 0, 0, shards
+        else:
+            stock.units, stock.units_reserved, stock.shards = totals["units"], totals["units_reserved"], 0
+        # The units only moved between the row and its shards, the category
+        # aggregates ( stock_counted in inventory/signals.py ) keep them
+        stock._counted_units = stock.units
+        stock.save(update_fields=["units", "units_reserved", "units_sold", "shards"])
+    return stock
@@ -0,0 +1,118 @@
+import pytest
+from django.db import connection
+from django.urls import reverse
+from inventory import models
+from inventory.admin import EstimatedCountPaginator
+from inventory.category_tree import get_category_tree_version
+
+"""
+    Tests for the catalog admin ( inventory/admin.py ).
+"""
+
+
+@pytest.fixture
+def admin_catalog(db, category_factory, product_factory, stock_factory):
+    """
+        A three level category tree and two products with a SKU in stock.
+    """
+    root = category_factory.create(slug="admin-root", name="admin root")
+    child = category_factory.create(slug="admin-child", name="admin child", parent=root)
+    leaf = category_factory.create(slug="admin-leaf", name="admin leaf", parent=child)
+    stocks = [
+        stock_factory.create(
+            product_inventory__product=product_factory.create(
+                web_id=f"admin_web_id_{n}", slug=f"admin-product-{n}", name=f"admin leather boot {n}",
+                category=[leaf],
+            ),
+            product_inventory__sku=f"admin_sku_{n}", product_inventory__upc=f"admin_upc_{n}",
+        )
+        for n in range(2)
+    ]
+    return root, child, leaf, stocks
+
+
+#### Change lists ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_admin_category_tree_opens_subtrees(admin_client, admin_catalog):
+    root, child, leaf = admin_catalog[:3]
+    url = reverse("admin:inventory_category_changelist")
+    response = admin_client.get(url)
+    assert set(response.context["cl"].result_list) == {root, child}
+    assert f"tree_id={child.tree_id}&amp;lft__gte={child.lft}" in response.content.decode()
+
+    response = admin_client.get(url, {"tree_id": child.tree_id, "lft__gte": child.lft, "lft__lte": child.rght})
+    assert list(response.context["cl"].result_list) == [child, leaf]
+
+
+@pytest.mark.dbfactory
+@pytest.mark.parametrize("model", ["product", "productinventory", "stock"])
+def test_inventory_admin_change_lists(admin_client, admin_catalog, django_assert_max_num_queries, model):
+    url = reverse(f"admin:inventory_{model}_changelist")
+    # The related rows are read by the list query, whatever the page size
+    with django_assert_max_num_queries(8):
+        response = admin_client.get(url)
+    assert response.status_code == 200
+    assert response.context["cl"].result_count == 2
+    assert admin_client.get(reverse(f"admin:inventory_{model}_add")).status_code == 200
+
+
+@pytest.mark.dbfactory
+def test_inventory_admin_searches(admin_client, admin_catalog):
+    response = admin_client.get(reverse("admin:inventory_product_changelist"), {"q": "leath"})
+    assert response.context["cl"].result_count == 2
+    response = admin_client.get(reverse("admin:inventory_product_changelist"), {"q": "admin_web_id_1"})
+    assert [product.web_id for product in response.context["cl"].result_list] == ["admin_web_id_1"]
+    response = admin_client.get(reverse("admin:inventory_productinventory_changelist"), {"q": "admin_upc_0"})
+    assert [sku.sku for sku in response.context["cl"].result_list] == ["admin_sku_0"]
+
+    response = admin_client.get(reverse("admin:autocomplete"), {
+        "term": "boot", "app_label": "inventory", "model_name": "productinventory", "field_name": "product",
+    })
+    assert len(response.json()["results"]) == 2
+
+
+@pytest.mark.dbfactory
+def test_inventory_admin_estimated_count(admin_catalog, django_assert_num_queries):
+    queryset = models.ProductInventory.objects.order_by("id")
+    # A table without statistics yet is counted
+    with django_assert_num_queries(2):
+        assert EstimatedCountPaginator(queryset, 10).count == 2
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE inventory_productinventory")
+    for listed in (queryset, queryset.filter(is_active=True)):
+        paginator = EstimatedCountPaginator(listed, 10)
+        paginator.threshold = 0
+        with django_assert_num_queries(1):
+            assert paginator.count == 2
+
+
+#### Actions ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_admin_bulk_actions(admin_client, admin_catalog):
+    root, child, leaf, stocks = admin_catalog
+    skus = [stock.product_inventory_id for stock in stocks]
+    response = admin_client.post(reverse("admin:inventory_productinventory_changelist"), {
+        "action": "deactivate", "_selected_action": skus,
+    })
+    assert response.status_code == 302
+    assert not models.ProductInventory.objects.filter(id__in=skus, is_active=True).exists()
+    assert models.CatalogChange.objects.filter(
+        model="productinventory", object_id__in=skus, action="update"
+    ).count() == 2
+
+    admin_client.post(reverse("admin:inventory_stock_changelist"), {
+        "action": "mark_checked", "_selected_action": [stock.id for stock in stocks],
+    })
+    assert not models.Stock.objects.filter(last_checked=None).exists()
+
+    version = get_category_tree_version()
+    admin_client.post(reverse("admin:inventory_category_changelist"), {
+        "action": "deactivate", "_selected_action": [leaf.id],
+    })
+    assert models.Category.objects.get(id=leaf.id).is_active is False
+    assert get_category_tree_version() != version
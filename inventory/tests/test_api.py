@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from django.urls import reverse
+
+"""
+    Tests for the read-only JSON catalog API ( inventory/views.py ).
+"""
+
+
+@pytest.fixture
+def skus(db, product_factory, stock_factory):
+    """
+        Five SKUs of one product, with their stock.
+    """
+    product = product_factory.create(web_id="api_web_id", slug="api-product", name="api product")
+    return [
+        stock_factory.create(product_inventory__product=product, units=n).product_inventory
+        for n in range(5)
+    ]
+
+
+@pytest.mark.dbfactory
+def test_inventory_api_list_pages_and_selects_fields(client, skus):
+    url = reverse("api:list", kwargs={"resource": "inventories"})
+    seen = []
+    params = {"fields": "sku,store_price", "limit": 2}
+    while True:
+        body = client.get(url, params).json()
+        assert all(set(row) == {"sku", "store_price"} for row in body["results"])
+        seen += [row["sku"] for row in body["results"]]
+        if not body["next"]:
+            break
+        params["cursor"] = body["next"]
+    assert seen == [sku.sku for sku in skus]
+
+    body = client.get(reverse("api:list", kwargs={"resource": "stock"}), {
+        "product_inventory_id": skus[3].id,
+    }).json()
+    assert [row["units"] for row in body["results"]] == [3]
+
+
+@pytest.mark.dbfactory
+def test_inventory_api_detail(client, skus):
+    product_id = skus[0].product_id
+    response = client.get(reverse("api:detail", kwargs={"resource": "products", "pk": product_id}))
+    assert response.json()["name"] == "api product"
+    response = client.get(reverse("api:detail", kwargs={"resource": "products", "pk": 0}))
+    assert response.status_code == 404
+
+
+@pytest.mark.dbfactory
+def test_inventory_api_rejects_bad_requests(client, skus):
+    url = reverse("api:list", kwargs={"resource": "inventories"})
+    assert client.get(url, {"fields": "sku,secret"}).status_code == 400
+    assert client.get(url, {"cursor": "broken"}).status_code == 400
+    assert client.get(url, {"limit": "many"}).status_code == 400
+    assert client.get(url, {"product_id": "x"}).status_code == 400
+    assert client.post(url).status_code == 405
+    assert client.get(reverse("api:list", kwargs={"resource": "users"})).status_code == 404
+
+
+@pytest.mark.dbfactory
+def test_inventory_api_export_streams_ndjson(client, settings, skus):
+    settings.API_EXPORT_CHUNK_SIZE = 2
+    response = client.get(
+        reverse("api:export", kwargs={"resource": "inventories"}), {"fields": "id,sku,retail_price"}
+    )
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+    assert [row["sku"] for row in rows] == [sku.sku for sku in skus]
+    assert rows[0]["retail_price"] == "97.00"
@@ -0,0 +1,220 @@
+import io
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from inventory import category_stats, models
+from inventory.category_stats import rebuild_category_stats
+from inventory.feeds import import_feed
+from inventory.stock import reserve, restock, shard_stock
+
+"""
+    Tests for the per category aggregates and their subtree rollups
+    ( inventory/category_stats.py ).
+"""
+
+
+@pytest.fixture
+def stocked_tree(db, category_factory, product_factory, stock_factory, django_capture_on_commit_callbacks):
+    """
+        root > child > leaf, a product with a SKU in the child and one in
+        the leaf.
+    """
+    with django_capture_on_commit_callbacks(execute=True):
+        root = category_factory.create(slug="stats-root", name="stats root")
+        child = category_factory.create(slug="stats-child", name="stats child", parent=root)
+        leaf = category_factory.create(slug="stats-leaf", name="stats leaf", parent=child)
+        stocks = [
+            stock_factory.create(
+                product_inventory__product=product_factory.create(
+                    web_id=f"stats_web_id_{n}", slug=f"stats-product-{n}", name=f"stats product {n}",
+                    category=[category],
+                ),
+                product_inventory__sku=f"stats_sku_{n}", product_inventory__upc=f"stats_upc_{n}",
+                product_inventory__store_price=price, product_inventory__sale_price=price,
+                units=units,
+            )
+            for n, (category, price, units) in enumerate([(child, 20, 5), (leaf, 10, 3)])
+        ]
+    return root, child, leaf, stocks
+
+
+def _stats(category):
+    return models.CategoryStats.objects.values(
+        "product_count", "units", "min_price", "max_price",
+        "subtree_product_count", "subtree_units", "subtree_min_price", "subtree_max_price",
+    ).get(category=category)
+
+
+def _subtree(category):
+    stats = _stats(category)
+    return (
+        stats["subtree_product_count"], stats["subtree_units"], stats["subtree_min_price"], stats["subtree_max_price"]
+    )
+
+
+#### Maintained on writes ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_stats_rolled_up(stocked_tree):
+    root, child, leaf = stocked_tree[:3]
+    assert _stats(leaf) == {
+        "product_count": 1, "units": 3, "min_price": Decimal("10.00"), "max_price": Decimal("10.00"),
+        "subtree_product_count": 1, "subtree_units": 3,
+        "subtree_min_price": Decimal("10.00"), "subtree_max_price": Decimal("10.00"),
+    }
+    assert _subtree(child) == (2, 8, Decimal("10.00"), Decimal("20.00"))
+    # No products of its own
+    assert _stats(root)["product_count"] == 0 and _stats(root)["min_price"] is None
+    assert _subtree(root) == (2, 8, Decimal("10.00"), Decimal("20.00"))
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_stats_follow_stock_and_prices(stocked_tree, django_capture_on_commit_callbacks):
+    root, child, leaf, stocks = stocked_tree
+    leaf_sku = stocks[1].product_inventory_id
+
+    with django_capture_on_commit_callbacks(execute=True):
+        restock({leaf_sku: 4})
+    assert _subtree(leaf)[1] == 7 and _subtree(root)[1] == 12
+    with django_capture_on_commit_callbacks(execute=True):
+        reserve({leaf_sku: 2})
+    assert _subtree(root)[1] == 10
+
+    with django_capture_on_commit_callbacks(execute=True):
+        import_feed(io.StringIO("sku,store_price,units\nstats_sku_1,30,1\n"), "csv")
+    assert _subtree(leaf) == (1, 1, Decimal("30.00"), Decimal("30.00"))
+    assert _subtree(root) == (2, 6, Decimal("20.00"), Decimal("30.00"))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        stocks[1].delete()
+    assert _subtree(leaf) == (1, 0, Decimal("30.00"), Decimal("30.00"))
+    with django_capture_on_commit_callbacks(execute=True):
+        models.ProductInventory.objects.get(id=leaf_sku).delete()
+    assert _subtree(leaf) == (1, 0, None, None)
+    assert _subtree(root) == (2, 5, Decimal("20.00"), Decimal("20.00"))
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_stats_follow_links_and_moves(
+    stocked_tree, category_factory, django_capture_on_commit_callbacks
+):
+    root, child, leaf, stocks = stocked_tree
+    product = stocks[1].product_inventory.product
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.category.add(root)
+    assert _stats(root)["units"] == 3
+    assert _subtree(root)[:2] == (3, 11)
+    with django_capture_on_commit_callbacks(execute=True):
+        product.category.remove(root)
+    assert _subtree(root)[:2] == (2, 8)
+
+    # The leaf moved to another tree, the tree fields of the instances are
+    # stale once it is created
+    other = category_factory.create(slug="stats-other", name="stats other")
+    with django_capture_on_commit_callbacks(execute=True):
+        models.Category.objects.get(id=leaf.id).move_to(models.Category.objects.get(id=other.id))
+    assert _subtree(root) == (1, 5, Decimal("20.00"), Decimal("20.00"))
+    assert _subtree(other)[:2] == (1, 3)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        models.Category.objects.get(id=child.id).delete()
+    assert _subtree(root) == (0, 0, None, None)
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_stats_moved_incrementally(
+    stocked_tree, stock_factory, django_capture_on_commit_callbacks, monkeypatch
+):
+    root, child, leaf, stocks = stocked_tree
+    leaf_sku = stocks[1].product_inventory_id
+    # The leaf's range 10 - 15 with a SKU inside it
+    with django_capture_on_commit_callbacks(execute=True):
+        for n, price in [(2, 12), (3, 15)]:
+            stock_factory.create(
+                product_inventory__product=stocks[1].product_inventory.product,
+                product_inventory__sku=f"stats_sku_{n}", product_inventory__upc=f"stats_upc_{n}",
+                product_inventory__store_price=price, product_inventory__sale_price=price, units=0,
+            )
+    recompute, recomputed = category_stats._recompute_prices, []
+    monkeypatch.setattr(category_stats, "_recompute_prices", lambda category_ids: (
+        recomputed.append(category_ids), recompute(category_ids)
+    ))
+
+    # Increments, no aggregate of the SKUs
+    with CaptureQueriesContext(connection) as queries, django_capture_on_commit_callbacks(execute=True):
+        reserve({leaf_sku: 1})
+    updates = [query["sql"] for query in queries if query["sql"].startswith('UPDATE "inventory_categorystats"')]
+    assert len(updates) == 1 and '"units" + CASE' in updates[0]
+    assert not any("GROUP BY" in query["sql"] and "inventory_product_category" in query["sql"] for query in queries)
+    assert _subtree(root)[1] == 7
+
+    # Prices inside or widening the range keep it
+    with django_capture_on_commit_callbacks(execute=True):
+        import_feed(io.StringIO("sku,store_price\nstats_sku_2,11\n"), "csv")
+    assert _subtree(leaf)[2:] == (Decimal("10.00"), Decimal("15.00"))
+    with django_capture_on_commit_callbacks(execute=True):
+        import_feed(io.StringIO("sku,store_price\nstats_sku_2,30\n"), "csv")
+    assert _subtree(leaf)[2:] == (Decimal("10.00"), Decimal("30.00"))
+    assert _subtree(root)[2:] == (Decimal("10.00"), Decimal("30.00"))
+    assert recomputed == []
+
+    # Only the category losing its bound is recomputed, and rolled up
+    with django_capture_on_commit_callbacks(execute=True):
+        import_feed(io.StringIO("sku,store_price\nstats_sku_2,13\n"), "csv")
+    assert recomputed == [[leaf.id]]
+    assert _subtree(leaf)[2:] == (Decimal("10.00"), Decimal("15.00"))
+    assert _subtree(root)[2:] == (Decimal("10.00"), Decimal("20.00"))
+
+    # Sharding moves no units
+    shard_stock(leaf_sku, 4)
+    shard_stock(leaf_sku, 0)
+    assert _subtree(leaf)[1] == 2 and _subtree(root)[1] == 7
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_stats_one_rollup_per_transaction(
+    stocked_tree, category_factory, django_capture_on_commit_callbacks, monkeypatch
+):
+    root, child, leaf, stocks = stocked_tree
+    rollups = []
+    monkeypatch.setattr(category_stats, "rollup_category_stats", rollups.append)
+
+    # New nodes hold nothing to roll up
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        for n in range(20):
+            category_factory.create(slug=f"stats-new-{n}", name=f"stats new {n}", parent=root)
+    # Only the bumps of the tree version
+    assert rollups == [] and len(callbacks) == 20
+
+    with django_capture_on_commit_callbacks(execute=True):
+        models.Category.objects.get(id=leaf.id).move_to(models.Category.objects.get(id=root.id))
+        models.Category.objects.get(slug="stats-new-0").delete()
+    assert rollups == [{child.id, leaf.id, root.id}]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        models.Category.objects.rebuild()
+        models.Category.objects.get(slug="stats-new-1").delete()
+    assert rollups[1:] == [None]
+
+
+#### Rebuild ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_stats_rebuild(stocked_tree):
+    root, child, leaf, stocks = stocked_tree
+    expected = [_stats(category) for category in (root, child, leaf)]
+
+    # Written without signals, as the bulk loaders do
+    models.CategoryStats.objects.update(units=0, subtree_units=0, subtree_min_price=None)
+    assert rebuild_category_stats() == 3
+    assert [_stats(category) for category in (root, child, leaf)] == expected
+
+    models.Stock.objects.filter(id=stocks[0].id).update(units=1)
+    call_command("rebuild-category-stats")
+    assert _subtree(root)[1] == 4
@@ -0,0 +1,134 @@
+import time
+
+import pytest
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from inventory import models
+
+"""
+    Subtree listings using the MPTT nested set range
+    ( ProductCardQuerySet.in_category_subtree ) against walking the tree
+    one node at a time.
+"""
+
+
+def build_category_tree(branching, depth):
+    """
+        Bulk inserts a single complete tree with explicit MPTT values and
+        returns the root. branching=10, depth=4 gives 11,111 nodes.
+    """
+    nodes = []
+    next_id = [1]
+
+    def add(parent_id, level, lft):
+        node_id = next_id[0]
+        next_id[0] += 1
+        node = models.Category(
+            id=node_id, name=f"bench_{node_id}", slug=f"bench-{node_id}",
+            parent_id=parent_id, tree_id=1, level=level, lft=lft,
+        )
+        nodes.append(node)
+        rght = lft + 1
+        if level < depth:
+            for _ in range(branching):
+                rght = add(node_id, level + 1, rght) + 1
+        node.rght = rght
+        return rght
+
+    add(None, 0, 1)
+    models.Category.objects.bulk_create(nodes, batch_size=2000)
+    return models.Category.objects.get(id=1)
+
+
+def walk_descendant_ids(node):
+    """
+        The naive approach, one query per node.
+    """
+    ids = [node.id]
+    for child in node.get_children():
+        ids.extend(walk_descendant_ids(child))
+    return ids
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_subtree_matches_descendants(
+    db, category_factory, product_factory
+):
+    root = category_factory.create(name="root", slug="root")
+    child = category_factory.create(name="child", slug="child", parent=root)
+    grandchild = category_factory.create(name="grandchild", slug="grandchild", parent=child)
+    other = category_factory.create(name="other", slug="other")
+    for n, category in enumerate((root, child, grandchild, other)):
+        product_factory.create(web_id=f"sub_{n}", slug=f"sub-{n}", category=[category])
+
+    for node in (root, child, grandchild):
+        node.refresh_from_db()
+        expected = set(
+            models.ProductCard.objects.filter(
+                category__in=node.get_descendants(include_self=True)
+            ).values_list("id", flat=True)
+        )
+        result = set(
+            models.ProductCard.objects.in_category_subtree(node).values_list("id", flat=True)
+        )
+        assert result == expected
+    assert models.ProductCard.objects.in_category_subtree(root).count() == 3
+
+
+@pytest.mark.benchmark
+def test_inventory_category_subtree_benchmark(db, product_factory, django_assert_num_queries):
+    """
+        Compares the range query with the recursive walk on a 10k-node tree,
+        run with 'pytest -m benchmark -s' to see the timings.
+    """
+    root = build_category_tree(branching=10, depth=4)
+    assert models.Category.objects.count() == 11111
+
+    leaves = list(models.Category.objects.filter(level=4).values_list("id", flat=True))
+    products = [
+        product_factory.create(web_id=f"bench_{n}", slug=f"bench-{n}") for n in range(10)
+    ]
+    models.ProductCard.objects.all().delete()
+    models.ProductCard.objects.bulk_create(
+        [
+            models.ProductCard(
+                product=product, category_id=category_id, category_slug=f"bench-{category_id}",
+                name=product.name, slug=product.slug, product_created_at=product.created_at,
+            )
+            for category_id in leaves
+            for product in products
+        ],
+        batch_size=5000,
+    )
+
+    # A level 1 node with 1,111 nodes in its subtree
+    node = root.get_children()[0]
+    subtree = node.get_descendant_count() + 1
+    # MPTT reads no children of a leaf
+    branches = node.get_descendants(include_self=True).exclude(rght=F("lft") + 1).count()
+
+    start = time.perf_counter()
+    with django_assert_num_queries(1):
+        ranged = list(
+            models.ProductCard.objects.in_category_subtree(node).values_list("id", flat=True)
+        )
+    ranged_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        walked = list(
+            models.ProductCard.objects.filter(
+                category_id__in=walk_descendant_ids(node)
+            ).values_list("id", flat=True)
+        )
+    walked_time = time.perf_counter() - start
+
+    print(
+        f"\nsubtree of {subtree} nodes, {len(ranged)} cards: "
+        f"range {ranged_time * 1000:.1f}ms, recursive {walked_time * 1000:.1f}ms"
+    )
+    assert sorted(ranged) == sorted(walked)
+    # The timings vary from run to run, the queries do not: one per branch
+    # walked and the listing
+    assert len(queries) == branches + 1
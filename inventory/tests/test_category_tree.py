@@ -0,0 +1,68 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from inventory import models
+from inventory.category_tree import get_category_tree_version
+
+"""
+    Tests for the category tree version ( inventory/category_tree.py ) and
+    the category page cached with it, with the local memory and the file
+    based cache backends.
+"""
+
+
+@pytest.fixture(params=["locmem", "filebased"])
+def cache_backend(request, settings, tmp_path):
+    if request.param == "locmem":
+        settings.CACHES = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "category-tree-tests",
+            }
+        }
+    else:
+        settings.CACHES = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": str(tmp_path / "cache"),
+            }
+        }
+    cache.clear()
+    return request.param
+
+
+@pytest.mark.dbfactory
+def test_inventory_category_tree_invalidated(db, cache_backend, category_factory):
+    root = category_factory.create(name="root", slug="root")
+
+    version = get_category_tree_version()
+    child = category_factory.create(name="child", slug="child", parent=root)
+    assert get_category_tree_version() != version
+
+    version = get_category_tree_version()
+    models.Category.objects.rebuild()
+    assert get_category_tree_version() != version
+
+    version = get_category_tree_version()
+    child.move_to(None)
+    assert get_category_tree_version() != version
+
+    version = get_category_tree_version()
+    child.delete()
+    assert get_category_tree_version() != version
+
+
+@pytest.mark.dbfactory
+def test_demo_category_page_cached(
+    db, client, cache_backend, category_factory, django_assert_num_queries
+):
+    category_factory.create(name="shoes", slug="shoes")
+    client.get(reverse("demo:categories"))
+
+    with django_assert_num_queries(0):
+        response = client.get(reverse("demo:categories"))
+    assert b"shoes" in response.content
+
+    category_factory.create(name="boots", slug="boots")
+    response = client.get(reverse("demo:categories"))
+    assert b"boots" in response.content
@@ -0,0 +1,179 @@
+import json
+import threading
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.urls import reverse
+from inventory import models
+from inventory.changes import changes_since, record_updates
+from inventory.stock import reserve
+
+"""
+    Tests for the catalog change feed ( inventory/changes.py ), its API
+    endpoint and the tail-catalog-changes command.
+
+    Changes are only read once their transaction and every older one
+    finished, so these tests commit their writes ( transactional_db ).
+"""
+
+
+def create_product(slug, name="changes"):
+    # Not the factory, whose post generation save is a second change
+    return models.Product.objects.create(web_id=slug, slug=slug, name=name, description="")
+
+
+def drain(cursor="", **kwargs):
+    changes, cursor = changes_since(cursor, **kwargs)
+    return [(change["model"], change["action"]) for change in changes], cursor
+
+
+@pytest.mark.dbfactory
+def test_inventory_changes_records_writes(
+    transactional_db, product_inventory_factory, stock_factory, media_factory,
+):
+    product = create_product("changes-1")
+    changes, cursor = drain()
+    assert changes == [("product", "insert")]
+
+    sku = product_inventory_factory.create(product=product, sku="changes-1", upc="changes-1")
+    stock = stock_factory.create(product_inventory=sku, units=5)
+    media = media_factory.create(product_inventory=sku)
+    changes, cursor = drain(cursor)
+    # The factories' SubFactory rows are not recorded
+    assert changes == [("productinventory", "insert"), ("stock", "insert"), ("media", "insert")]
+
+    product.name = "renamed"
+    product.save()
+    media.delete()
+    changes, cursor = drain(cursor)
+    assert changes == [("product", "update"), ("media", "delete")]
+    assert drain(cursor) == ([], cursor)
+
+    # Bulk stock moves are recorded with the row after the move
+    reserve({sku.id: 2})
+    changes, cursor = changes_since(cursor)
+    assert [(change["model"], change["object_id"]) for change in changes] == [("stock", stock.id)]
+    assert changes[0]["data"]["units"] == 3 and changes[0]["data"]["units_reserved"] == 2
+
+    assert drain(model_names=["stock"])[0] == [("stock", "insert"), ("stock", "update")]
+
+
+@pytest.mark.dbfactory
+def test_inventory_changes_bulk_and_saved_data_match(transactional_db, product_inventory_factory):
+    sku = product_inventory_factory.create(
+        product=create_product("changes-match"), sku="changes-match", upc="changes-m", store_price=10,
+    )
+    sku.save()
+    record_updates(models.ProductInventory, [sku.id])
+    saved, bulk = models.CatalogChange.objects.filter(
+        model="productinventory", object_id=sku.id, action="update"
+    ).order_by("id").values_list("data", flat=True)
+    # Same keys and the same value types, whichever path wrote the change
+    assert bulk == saved
+    assert bulk["store_price"] == "10.00"
+
+
+@pytest.mark.dbfactory
+def test_inventory_changes_rolled_back_are_not_recorded(transactional_db):
+    with pytest.raises(RuntimeError), transaction.atomic():
+        create_product("changes-2")
+        raise RuntimeError
+    assert drain() == ([], "0.0")
+
+
+@pytest.mark.dbfactory
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="needs the PostgreSQL backend")
+def test_inventory_changes_wait_for_older_transactions(transactional_db):
+    """
+        A change committed while an older transaction is still open is held
+        back until it finished, so the open one's changes are not skipped.
+    """
+    opened, committed = threading.Event(), threading.Event()
+
+    def older():
+        with transaction.atomic():
+            create_product("changes-older")
+            opened.set()
+            committed.wait(10)
+        connections.close_all()
+
+    thread = threading.Thread(target=older)
+    thread.start()
+    opened.wait(10)
+    create_product("changes-newer")
+    assert drain() == ([], "0.0")
+
+    committed.set()
+    thread.join()
+    changes, cursor = changes_since("")
+    assert [change["data"]["slug"] for change in changes] == ["changes-older", "changes-newer"]
+
+
+@pytest.mark.dbfactory
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="needs the PostgreSQL backend")
+def test_inventory_changes_ids_order_the_writes_of_a_row(transactional_db):
+    """
+        A transaction with a lower txid saving a row after a newer one
+        committed is read first, its change has the higher id.
+    """
+    product = create_product("changes-row")
+    _, cursor = drain()
+    started, saved = threading.Event(), threading.Event()
+
+    def older():
+        with transaction.atomic():
+            create_product("changes-started")
+            started.set()
+            saved.wait(10)
+            older = models.Product.objects.get(id=product.id)
+            older.name = "changes older"
+            older.save()
+        connections.close_all()
+
+    thread = threading.Thread(target=older)
+    thread.start()
+    started.wait(10)
+    newer = models.Product.objects.get(id=product.id)
+    newer.name = "changes newer"
+    newer.save()
+    saved.set()
+    thread.join()
+
+    changes = [change for change in changes_since(cursor)[0] if change["object_id"] == product.id]
+    assert [change["data"]["name"] for change in changes] == ["changes older", "changes newer"]
+    # The row holds the change with the highest id
+    latest = max(changes, key=lambda change: change["id"])
+    assert latest["data"]["name"] == models.Product.objects.get(id=product.id).name == "changes older"
+
+
+@pytest.mark.dbfactory
+def test_inventory_changes_api(transactional_db, client):
+    for index in range(3):
+        create_product(f"changes-api-{index}")
+    url = reverse("api:changes")
+
+    response = client.get(url, {"limit": 2}).json()
+    assert [change["data"]["slug"] for change in response["results"]] == ["changes-api-0", "changes-api-1"]
+    response = client.get(url, {"limit": 2, "cursor": response["next"]}).json()
+    assert [change["action"] for change in response["results"]] == ["insert"]
+    assert client.get(url, {"cursor": response["next"]}).json() == {"results": [], "next": response["next"]}
+
+    assert client.get(url, {"cursor": "nope"}).status_code == 400
+    assert client.get(url, {"models": "product,brand"}).status_code == 400
+
+
+@pytest.mark.dbfactory
+def test_inventory_changes_command(transactional_db, capsys):
+    for index in range(3):
+        create_product(f"changes-cmd-{index}")
+    call_command("tail-catalog-changes", "--batch-size", "2")
+    out, err = capsys.readouterr()
+    lines = [json.loads(line) for line in out.splitlines()]
+    assert [line["data"]["slug"] for line in lines] == [f"changes-cmd-{index}" for index in range(3)]
+    assert f"resume from --cursor {lines[-1]['cursor']}" in err
+
+    create_product("changes-cmd-3")
+    call_command("tail-catalog-changes", "--cursor", lines[-1]["cursor"], "--models", "product")
+    out, err = capsys.readouterr()
+    assert [json.loads(line)["data"]["slug"] for line in out.splitlines()] == ["changes-cmd-3"]
@@ -0,0 +1,95 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from inventory import models
+from inventory.category_stats import rebuild_category_stats
+from inventory.counting import estimated_count, planner_estimate
+
+"""
+    Tests for the estimated counts and the category counters
+    ( inventory/counting.py ).
+"""
+
+
+@pytest.fixture
+def counted(db, category_factory, product_factory):
+    """
+        Two categories and three products, two of them in both.
+    """
+    categories = category_factory.create_batch(2)
+    products = [
+        models.Product.objects.create(web_id=f"counted_{n}", slug=f"counted-{n}", name=f"counted {n}")
+        for n in range(3)
+    ]
+    products[0].category.add(*categories)
+    products[1].category.add(*categories)
+    products[2].category.add(categories[0])
+    return categories, products
+
+
+def _counts(categories):
+    stats = dict(models.CategoryStats.objects.values_list("category_id", "product_count"))
+    return [stats.get(category.id, 0) for category in categories]
+
+
+#### Estimates ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_counting_estimates(counted, django_assert_num_queries):
+    products = models.Product.objects.all()
+    # Never analyzed, counted exactly
+    assert planner_estimate(products) is None
+    assert estimated_count(products, threshold=0) == (3, True)
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE inventory_product")
+    with django_assert_num_queries(1):
+        assert estimated_count(products, threshold=0) == (3, False)
+    # Filtered and joined querysets are estimated with EXPLAIN
+    filtered = products.filter(category__in=counted[0]).distinct()
+    with django_assert_num_queries(1):
+        count, exact = estimated_count(filtered, threshold=0)
+    assert isinstance(count, int) and count >= 0 and not exact
+    # Small results are counted exactly
+    assert estimated_count(filtered, threshold=10 ** 9) == (3, True)
+
+
+#### Category counters ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_counting_category_counters(counted):
+    categories, products = counted
+    assert _counts(categories) == [3, 2]
+
+    # Only the links there are counted off
+    products[2].category.remove(*categories)
+    assert _counts(categories) == [2, 2]
+    products[0].category.add(categories[0])
+    assert _counts(categories) == [2, 2]
+    products[0].category.clear()
+    assert _counts(categories) == [1, 1]
+
+    categories[1].product_set.add(products[0], products[2])
+    assert _counts(categories) == [1, 3]
+    categories[1].product_set.remove(products[0])
+    assert _counts(categories) == [1, 2]
+    categories[1].product_set.clear()
+    assert _counts(categories) == [1, 0]
+
+    products[1].delete()
+    assert _counts(categories) == [0, 0]
+
+
+@pytest.mark.dbfactory
+def test_inventory_counting_rebuild(counted):
+    categories, products = counted
+    models.CategoryStats.objects.update(product_count=0)
+    assert rebuild_category_stats() >= 2
+    assert _counts(categories) == [3, 2]
+
+    # Links written without signals, as the bulk loaders do
+    models.Product.category.through.objects.filter(product=products[2]).delete()
+    call_command("rebuild-category-stats")
+    assert _counts(categories) == [2, 2]
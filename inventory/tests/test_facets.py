@@ -0,0 +1,171 @@
+import time
+
+import pytest
+from django.http import QueryDict
+from django.urls import reverse
+from inventory.facets import FacetIndex, get_facet_index
+
+"""
+    Tests for the attribute facet engine ( inventory/facets.py ).
+
+    The product used below has four SKUs:
+        sku_red_9   - colour: red,  size: 9
+        sku_red_10  - colour: red,  size: 10
+        sku_blue_10 - colour: blue, size: 10
+        sku_plain   - no attributes
+"""
+
+
+@pytest.fixture
+def faceted_product(
+    db, product_factory, product_inventory_factory, product_attribute_factory,
+    product_attribute_value_factory, product_attribute_values_factory,
+):
+    product = product_factory.create(web_id="facet_web_id", slug="facet-product")
+    colour = product_attribute_factory.create(name="colour")
+    size = product_attribute_factory.create(name="size")
+    values = {
+        name: product_attribute_value_factory.create(product_attribute=attribute, attribute_value=value)
+        for name, attribute, value in (
+            ("red", colour, "red"), ("blue", colour, "blue"), ("9", size, "9"), ("10", size, "10"),
+        )
+    }
+    skus = {}
+    for sku, linked in (
+        ("sku_red_9", ("red", "9")),
+        ("sku_red_10", ("red", "10")),
+        ("sku_blue_10", ("blue", "10")),
+        ("sku_plain", ()),
+    ):
+        skus[sku] = product_inventory_factory.create(sku=sku, upc=sku, product=product)
+        for name in linked:
+            product_attribute_values_factory.create(attributevalues=values[name], productinventory=skus[sku])
+    return product, skus
+
+
+def counts(facets):
+    return {
+        facet["attribute"]: {value["value"]: value["count"] for value in facet["values"]}
+        for facet in facets
+    }
+
+
+@pytest.mark.dbfactory
+def test_inventory_facets_no_selection_returns_every_sku(faceted_product):
+    product, skus = faceted_product
+    inventory_ids, facets = FacetIndex.build(product.id).filter({})
+    assert inventory_ids == [sku.id for sku in skus.values()]
+    assert counts(facets) == {"colour": {"blue": 1, "red": 2}, "size": {"10": 2, "9": 1}}
+
+
+@pytest.mark.dbfactory
+@pytest.mark.parametrize(
+    "query, expected, expected_counts",
+    [
+        ("colour=red", ["sku_red_9", "sku_red_10"], {"colour": {"blue": 1, "red": 2}, "size": {"10": 1, "9": 1}}),
+        ("colour=red&size=10", ["sku_red_10"], {"colour": {"blue": 1, "red": 1}, "size": {"10": 1, "9": 1}}),
+        ("size=9&size=10", ["sku_red_9", "sku_red_10", "sku_blue_10"], {"colour": {"blue": 1, "red": 2}, "size": {"10": 2, "9": 1}}),  # noqa: E501
+        ("colour=green", [], {"colour": {"blue": 1, "red": 2}, "size": {"10": 0, "9": 0}}),
+        ("page=2", ["sku_red_9", "sku_red_10", "sku_blue_10", "sku_plain"], {"colour": {"blue": 1, "red": 2}, "size": {"10": 2, "9": 1}}),  # noqa: E501
+    ],
+)
+def test_inventory_facets_and_across_or_within(faceted_product, query, expected, expected_counts):
+    """
+        AND across attributes, OR within one, unknown parameters are ignored.
+    """
+    product, skus = faceted_product
+    index = FacetIndex.build(product.id)
+    inventory_ids, facets = index.filter(index.selection_from(QueryDict(query)))
+    assert inventory_ids == [skus[sku].id for sku in expected]
+    assert counts(facets) == expected_counts
+
+
+@pytest.mark.dbfactory
+def test_inventory_facets_cached_and_invalidated(
+    faceted_product, product_inventory_factory, django_assert_num_queries
+):
+    product, skus = faceted_product
+    get_facet_index(product.id)
+    with django_assert_num_queries(0):
+        get_facet_index(product.id)
+
+    product_inventory_factory.create(sku="sku_new", upc="sku_new", product=product)
+    assert len(get_facet_index(product.id).inventory_ids) == 5
+
+
+@pytest.mark.dbfactory
+def test_inventory_facets_kept_for_other_products(
+    faceted_product, product_factory, product_inventory_factory, django_assert_num_queries
+):
+    product, skus = faceted_product
+    other = product_factory.create(web_id="facet_other", slug="facet-other")
+    get_facet_index(product.id)
+    get_facet_index(other.id)
+
+    product_inventory_factory.create(sku="sku_other", upc="sku_other", product=other)
+    skus["sku_plain"].store_price = 99
+    skus["sku_plain"].save()
+    with django_assert_num_queries(0):
+        get_facet_index(product.id)
+    assert len(get_facet_index(other.id).inventory_ids) == 1
+
+    # Moved to the other product, both change
+    skus["sku_plain"].product = other
+    skus["sku_plain"].save()
+    assert len(get_facet_index(product.id).inventory_ids) == 3
+    assert len(get_facet_index(other.id).inventory_ids) == 2
+
+
+@pytest.mark.dbfactory
+def test_inventory_facets_invalidated_by_links(faceted_product):
+    product, skus = faceted_product
+    red = skus["sku_red_9"].attribute_values.get(attribute_value="red")
+    get_facet_index(product.id)
+
+    skus["sku_plain"].attribute_values.add(red)
+    assert get_facet_index(product.id).filter({"colour": {"red"}})[0] == [
+        skus[sku].id for sku in ("sku_red_9", "sku_red_10", "sku_plain")
+    ]
+    skus["sku_plain"].attribute_values.clear()
+    assert get_facet_index(product.id).filter({"colour": {"red"}})[0] == [
+        skus[sku].id for sku in ("sku_red_9", "sku_red_10")
+    ]
+
+
+@pytest.mark.dbfactory
+def test_demo_product_detail_filters(faceted_product, client):
+    product, skus = faceted_product
+    url = reverse("demo:product_detail", kwargs={"slug": product.slug})
+
+    response = client.get(url)
+    assert response.content.count(b"Stock Left") == 4
+
+    response = client.get(url + "?colour=red&size=10")
+    assert b"sku_red_10" in response.content
+    assert response.content.count(b"Stock Left") == 1
+
+
+@pytest.mark.benchmark
+def test_inventory_facets_filter_benchmark():
+    """
+        Filtering a product with 2,000 SKUs over three attributes.
+    """
+    skus = range(1, 2001)
+    values = [
+        (sku, value_id, attribute, f"{attribute}_{value_id}")
+        for sku in skus
+        for attribute, value_id in (
+            ("colour", sku % 12), ("size", 100 + sku % 20), ("material", 200 + sku % 5),
+        )
+    ]
+    index = FacetIndex(skus, values)
+    selection = {"colour": {"colour_1", "colour_2"}, "size": {"size_101", "size_102", "size_103"}}
+
+    runs = 1000
+    start = time.perf_counter()
+    for _ in range(runs):
+        inventory_ids, facets = index.filter(selection)
+    elapsed = (time.perf_counter() - start) / runs
+    print(f"\nfacet filter over {len(skus)} SKUs: {elapsed * 1000:.3f}ms")
+    assert inventory_ids
+    assert elapsed < 0.001
@@ -0,0 +1,132 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from inventory import models
+from inventory.feeds import import_feed
+from inventory.stock import shard_stock
+
+"""
+    Tests for the supplier price and stock feeds ( inventory/feeds.py ).
+"""
+
+
+@pytest.fixture
+def feed_catalog(db, category_factory, product_factory, stock_factory):
+    """
+        A listed product with two SKUs in stock, sku "feed_a" the default.
+    """
+    category = category_factory.create(slug="fed", name="fed")
+    product = product_factory.create(
+        web_id="feed_web_id", slug="feed-product", name="feed product", category=[category],
+    )
+    stocks = [
+        stock_factory.create(
+            product_inventory__product=product, product_inventory__sku=sku, product_inventory__upc=f"upc_{sku}",
+            product_inventory__is_default=sku == "feed_a", product_inventory__store_price=50,
+            product_inventory__sale_price=50, units=10,
+        )
+        for sku in ("feed_a", "feed_b")
+    ]
+    return product, stocks
+
+
+def _csv(*lines):
+    return io.StringIO("\n".join(("sku,upc,retail_price,store_price,sale_price,units",) + lines) + "\n")
+
+
+def _inventory(sku):
+    return models.ProductInventory.objects.select_related("product_inventory").get(sku=sku)
+
+
+#### Import ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_feeds_apply_csv(feed_catalog, django_capture_on_commit_callbacks):
+    product, stocks = feed_catalog
+    before = _inventory("feed_b").updated_at
+    with django_capture_on_commit_callbacks(execute=True):
+        summary = import_feed(_csv(
+            "feed_a,,,40.00,35,",
+            ",upc_feed_b,,50,,10",
+            "missing,,,1,,",
+            "feed_b,,,,,-1",
+            "feed_b,,,abc,,",
+            ",,,1,,",
+        ), "csv")
+
+    assert (summary.rows, summary.updated, summary.unchanged, summary.unknown, summary.invalid) == (6, 1, 1, 1, 3)
+    assert dict(summary.fields) == {"store_price": 1, "sale_price": 1}
+    assert [number for number, message in summary.errors] == [5, 6, 7]
+
+    changed = _inventory("feed_a")
+    assert (changed.store_price, changed.sale_price, changed.retail_price) == (40, 35, 97)
+    # Unchanged rows are not written
+    assert _inventory("feed_b").updated_at == before
+    card = models.ProductCard.objects.get(product=product)
+    assert (card.store_price, card.sale_price, card.on_sale) == (40, 35, True)
+
+
+@pytest.mark.dbfactory
+def test_inventory_feeds_apply_ndjson_stock(feed_catalog, django_capture_on_commit_callbacks):
+    product, stocks = feed_catalog
+    feed = io.StringIO("\n".join([
+        json.dumps({"upc": "upc_feed_a", "units": 3}),
+        json.dumps({"sku": "feed_b", "units": 7, "retail_price": 99.5}),
+        "[1, 2]",
+        "",
+    ]))
+    with django_capture_on_commit_callbacks(execute=True):
+        summary = import_feed(feed, "ndjson", batch_size=1)
+
+    assert (summary.rows, summary.updated, summary.invalid) == (3, 2, 1)
+    assert _inventory("feed_a").product_inventory.units == 3
+    assert _inventory("feed_a").product_inventory.last_checked is not None
+    assert (_inventory("feed_b").product_inventory.units, _inventory("feed_b").retail_price) == (7, 99.5)
+    assert models.ProductCard.objects.get(product=product).units == 3
+    # Recorded in the change feed
+    assert models.CatalogChange.objects.filter(model="stock", action="update").count() == 2
+    assert models.CatalogChange.objects.filter(
+        model="productinventory", object_id=stocks[1].product_inventory_id
+    ).exists()
+
+
+@pytest.mark.dbfactory
+def test_inventory_feeds_batch_queries(feed_catalog, django_assert_num_queries):
+    lines = [f"feed_{sku},,,{price},,{units}" for sku, price, units in (("a", 45, 5), ("b", 46, 6))]
+    # The lookup, then per table the UPDATE, the rows read back and the
+    # change feed INSERT, in a savepoint here
+    with django_assert_num_queries(9):
+        summary = import_feed(_csv(*lines), "csv")
+    assert summary.updated == 2
+    # Applied again, nothing changes
+    with django_assert_num_queries(1):
+        assert import_feed(_csv(*lines), "csv").unchanged == 2
+
+
+@pytest.mark.dbfactory
+def test_inventory_feeds_dry_run_and_sharded_stock(feed_catalog):
+    product, stocks = feed_catalog
+    shard_stock(stocks[0].product_inventory_id, 2)
+    changes = []
+    summary = import_feed(
+        _csv("feed_a,,,41,,1", "feed_b,,,,,2"), "csv", dry_run=True,
+        on_change=lambda *change: changes.append(change),
+    )
+    assert (summary.updated, summary.sharded) == (2, 1)
+    assert [change[:2] for change in changes] == [("feed_a", "store_price"), ("feed_b", "units")]
+    assert _inventory("feed_a").store_price == 50
+    assert _inventory("feed_b").product_inventory.units == 10
+
+
+@pytest.mark.dbfactory
+def test_inventory_feeds_command(feed_catalog, tmp_path):
+    path = tmp_path / "feed.csv"
+    path.write_text(_csv("feed_a,,,42,,").getvalue())
+    out = io.StringIO()
+    call_command("import-supplier-feed", str(path), verbosity=2, stdout=out)
+    assert "feed_a store_price: 50.00 -> 42" in out.getvalue()
+    assert "1 SKUs updated (store_price 1)" in out.getvalue()
+    assert _inventory("feed_a").store_price == 42
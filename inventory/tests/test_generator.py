@@ -0,0 +1,36 @@
+import pytest
+from django.db.models import Count, Q
+from inventory import models
+from inventory.generator import generate_catalog
+
+"""
+    Tests for the synthetic catalog generator ( inventory/generator.py ).
+"""
+
+
+@pytest.mark.dbfactory
+@pytest.mark.parametrize("use_copy", [False, True])
+def test_inventory_generate_catalog(db, use_copy):
+    totals = generate_catalog(
+        categories=30, products=200, depth=2, chunk_size=64, jobs=2, use_copy=use_copy, seed=1
+    )
+    assert totals["products"] == models.Product.objects.count() == 200
+    assert totals["inventories"] == models.ProductInventory.objects.count()
+    assert totals["stocks"] == models.Stock.objects.count() == totals["inventories"]
+    assert totals["links"] == 3 * totals["inventories"]
+    assert models.Category.objects.count() == 30
+    assert models.Category.objects.filter(level=2).exists()
+
+    # One default SKU and at least one category per product
+    assert not models.Product.objects.annotate(
+        defaults=Count("product", filter=Q(product__is_default=True))
+    ).exclude(defaults=1).exists()
+    assert not models.Product.objects.filter(category=None).exists()
+
+    # The tree was rebuilt and products sit in leaf categories
+    for category in models.Category.objects.filter(product__isnull=False).distinct():
+        assert category.is_leaf_node()
+
+    # Sequences moved past the generated ids
+    product = models.Product.objects.create(web_id="after", slug="after", name="after", description="after")
+    assert product.id > 200
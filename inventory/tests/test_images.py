@@ -0,0 +1,160 @@
+import os
+import shutil
+import time
+
+import pytest
+from django.core.management import call_command
+from inventory import models
+from inventory.images import derivative_name, derive_images, process_media, srcsets
+from PIL import Image
+
+"""
+    Tests for the resized image derivatives ( inventory/images.py ), the
+    upload signals and the generate-image-derivatives command.
+"""
+
+FORMATS = {"webp": 80, "jpeg": 82}
+
+
+@pytest.fixture
+def media_root(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    settings.IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+    settings.IMAGE_DERIVATIVE_FORMATS = FORMATS
+    settings.IMAGE_DERIVATIVE_WORKERS = 0
+    return tmp_path
+
+
+def write_image(root, name, size=(800, 600), mode="RGB", color="red"):
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new(mode, size, color).save(path, "PNG")
+    return name
+
+
+def test_inventory_images_derive_without_enlarging(media_root):
+    name = write_image(media_root, "images/wide.png")
+    image_hash, width, written = derive_images([name])[name]
+    assert width == 800
+    # 160, 320 and 640 in both formats, 800 is narrower than 1280
+    assert written == 6
+
+    for size in (160, 320, 640):
+        with Image.open(media_root / derivative_name(image_hash, size, "webp")) as webp:
+            assert webp.size == (size, size * 3 // 4)
+        with Image.open(media_root / derivative_name(image_hash, size, "jpeg")) as jpeg:
+            assert jpeg.format == "JPEG" and jpeg.width == size
+    assert not (media_root / derivative_name(image_hash, 1280, "webp")).exists()
+
+    # Generated once per content, whatever the name
+    copy = write_image(media_root, "images/copy.png")
+    assert derive_images([name, copy]) == {name: (image_hash, 800, 0), copy: (image_hash, 800, 0)}
+
+
+def test_inventory_images_small_and_transparent_images(media_root):
+    name = write_image(media_root, "images/icon.png", size=(100, 50), mode="RGBA", color=(0, 0, 255, 0))
+    image_hash, width, written = derive_images([name])[name]
+    assert (width, written) == (100, 2)
+    with Image.open(media_root / derivative_name(image_hash, 100, "jpeg")) as jpeg:
+        # The transparent pixels are flattened on white
+        assert jpeg.mode == "RGB" and jpeg.getpixel((50, 25))[0] > 240
+
+    (media_root / "images").joinpath("broken.png").write_bytes(b"not an image")
+    assert derive_images(["images/broken.png", "images/absent.png"]) == {
+        "images/broken.png": None, "images/absent.png": None,
+    }
+
+
+def test_inventory_images_srcsets(settings):
+    settings.MEDIA_URL = "/media/"
+    settings.IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640)
+    settings.IMAGE_DERIVATIVE_FORMATS = FORMATS
+    image_hash = "ab" * 32
+    assert srcsets(image_hash, 400) == {
+        "webp": f"/media/derivatives/ab/{image_hash}/160.webp 160w, /media/derivatives/ab/{image_hash}/320.webp 320w",
+        "jpeg": f"/media/derivatives/ab/{image_hash}/160.jpg 160w, /media/derivatives/ab/{image_hash}/320.jpg 320w",
+    }
+    assert srcsets("", None) == {}
+    assert models.Media(image_hash=image_hash, image_width=100).derivatives("webp") == [
+        (100, f"/media/derivatives/ab/{image_hash}/100.webp"),
+    ]
+
+
+def queued(callbacks):
+    # The on commit callbacks resizing images, not the cache version bumps
+    return [callback for callback in callbacks if callback.__qualname__.startswith("media_saved")]
+
+
+@pytest.mark.dbfactory
+def test_inventory_images_generated_on_upload(
+    db, media_root, product_inventory_factory, media_factory, django_capture_on_commit_callbacks,
+):
+    name = write_image(media_root, "images/upload.png")
+    inventory = product_inventory_factory.create(sku="img-upload", upc="img-upload")
+    with django_capture_on_commit_callbacks(execute=True):
+        media = media_factory.create(product_inventory=inventory, image=name)
+    media.refresh_from_db()
+    assert media.image_width == 800 and len(media.image_hash) == 64
+    assert set(media.srcsets) == {"webp", "jpeg"}
+
+    # A new image drops the previous derivatives until its own are made
+    media.image = write_image(media_root, "images/replaced.png", size=(300, 300), color="green")
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        media.save()
+    assert len(queued(callbacks)) == 1
+    media.refresh_from_db()
+    assert media.image_width == 300
+
+    # Other changes keep them and queue nothing
+    with django_capture_on_commit_callbacks() as callbacks:
+        media.alt_text = "changed"
+        media.save()
+    assert queued(callbacks) == []
+    assert models.Media.objects.only("id").get(pk=media.pk)._loaded_image is None
+
+
+@pytest.mark.dbfactory
+def test_inventory_images_command_backfills(db, media_root, product_inventory_factory, media_factory, capsys):
+    name = write_image(media_root, "images/backfill.png")
+    inventory = product_inventory_factory.create(sku="img-backfill", upc="img-backfill")
+    # Saved before the file existed, as rows loaded from fixtures are
+    media = [
+        media_factory.create(product_inventory=inventory, image=name, is_feature=index == 0)
+        for index in range(2)
+    ] + [media_factory.create(product_inventory=inventory, image="images/absent.png", is_feature=False)]
+
+    call_command("generate-image-derivatives")
+    out, err = capsys.readouterr()
+    assert "Processed 2 images: 6 derivatives written, 2 media rows updated" in out
+    assert "1 images are missing" in err
+    assert {row.image_width for row in models.Media.objects.filter(pk__in=[m.pk for m in media])} == {800, None}
+
+    assert process_media(models.Media.objects.all()) == {"images": 1, "missing": 1, "written": 0, "rows": 0}
+    assert process_media(models.Media.objects.all(), force=True)["rows"] == 2
+
+
+####
+# Benchmark
+###
+
+IMAGES = 24
+
+
+@pytest.mark.benchmark
+def test_benchmark_image_derivatives(request, media_root):
+    names = [
+        write_image(media_root, f"images/bench_{index}.png", size=(2000, 1500), color=(index * 10, 80, 160))
+        for index in range(IMAGES)
+    ]
+    results = {}
+    for label, workers in (("inline", 0), ("process pool", os.cpu_count())):
+        shutil.rmtree(media_root / "derivatives", ignore_errors=True)
+        started = time.perf_counter()
+        derive_images(names, workers=workers)
+        results[label] = IMAGES / (time.perf_counter() - started)
+
+    print()
+    for label, rate in results.items():
+        request.config._benchmark_results[f"image derivatives:{label}"] = {"images_per_sec": round(rate, 1)}
+        print(f"{label:<16} {rate:>8.1f} images/sec")
+    assert len(list((media_root / "derivatives").rglob("*.webp"))) == IMAGES * 4
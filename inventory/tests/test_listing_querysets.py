@@ -0,0 +1,133 @@
+import pytest
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from inventory import models
+
+"""
+    Tests for the listing querysets of Product and ProductInventory
+    ( Product.objects.for_listing(), ProductInventory.objects.for_listing() )
+    and the single default SKU and feature image they read.
+"""
+
+
+@pytest.fixture
+def listing(db, product_factory, product_inventory_factory, stock_factory, media_factory):
+    """
+        Returns a function creating n products, each with three SKUs with
+        stock and images, the second one the default.
+    """
+    created = []
+
+    def create(n):
+        for _ in range(n):
+            index = len(created)
+            product = product_factory.create(web_id=f"listing-{index}", slug=f"listing-{index}")
+            for variant in range(3):
+                sku = product_inventory_factory.create(
+                    product=product, sku=f"ls-{index}-{variant}", upc=f"ls-{index}-{variant}",
+                    is_default=variant == 1,
+                )
+                stock_factory.create(product_inventory=sku, units=index * 10 + variant)
+                media_factory.create(product_inventory=sku, image=f"images/{sku.sku}-b.png", is_feature=False)
+                media_factory.create(product_inventory=sku, image=f"images/{sku.sku}-a.png", is_feature=True)
+            created.append(product)
+        return created
+
+    return create
+
+
+def read_listing(products):
+    rows = []
+    for product in products:
+        sku = product.default_sku
+        rows.append((product.slug, sku.sku, sku.product_inventory.units, sku.feature_image.image.name))
+    return rows
+
+
+@pytest.mark.dbfactory
+def test_inventory_listing_product_query_count_is_constant(listing, django_assert_num_queries):
+    listing(2)
+    with django_assert_num_queries(3):
+        small = read_listing(models.Product.objects.for_listing().order_by("id"))
+    assert small[1] == ("listing-1", "ls-1-1", 11, "images/ls-1-1-a.png")
+
+    listing(18)
+    with django_assert_num_queries(3):
+        large = read_listing(models.Product.objects.for_listing().order_by("id"))
+    assert len(large) == 20 and large[:2] == small
+
+    # The same rows without the prefetch, three queries a product
+    with django_assert_num_queries(1 + 3 * 20):
+        assert read_listing(models.Product.objects.order_by("id")) == large
+
+
+@pytest.mark.dbfactory
+def test_inventory_listing_default_sku_fallbacks(listing, product_factory, product_inventory_factory):
+    product = listing(1)[0]
+    models.ProductInventory.objects.filter(product=product).update(is_default=False)
+    empty = product_factory.create(web_id="listing-empty", slug="listing-empty")
+    sku = product_inventory_factory.create(product=empty, sku="ls-bare", upc="ls-bare")
+
+    products = models.Product.objects.for_listing().in_bulk([product.pk, empty.pk])
+    # No SKU flagged, the first one is the default
+    assert products[product.pk].default_sku.sku == "ls-0-0"
+    assert products[product.pk].default_sku == product.default_sku
+
+    # A SKU without images, a product without SKUs
+    assert products[empty.pk].default_sku.feature_image is None
+    sku.delete()
+    assert models.Product.objects.for_listing().get(pk=empty.pk).default_sku is None
+
+
+@pytest.mark.dbfactory
+def test_inventory_listing_inventory_query_count_is_constant(listing, django_assert_num_queries):
+    listing(6)
+    with django_assert_num_queries(2):
+        rows = [
+            (sku.product.slug, sku.product_inventory.units, sku.feature_image.image.name)
+            for sku in models.ProductInventory.objects.for_listing().order_by("id")
+        ]
+    assert len(rows) == 18
+    assert rows[4] == ("listing-1", 11, "images/ls-1-1-a.png")
+
+
+####
+# One default SKU and feature image
+###
+
+
+@pytest.mark.dbfactory
+def test_inventory_listing_one_default_and_feature(listing, product_inventory_factory, media_factory):
+    product = listing(1)[0]
+    with pytest.raises(IntegrityError), transaction.atomic():
+        product_inventory_factory.create(product=product, sku="ls-second", upc="ls-second", is_default=True)
+    sku = product.default_sku
+    with pytest.raises(IntegrityError), transaction.atomic():
+        media_factory.create(product_inventory=sku, image="images/second.png", is_feature=True)
+    # Unflagged rows are not constrained
+    product_inventory_factory.create(product=product, sku="ls-other", upc="ls-other", is_default=False)
+
+
+@pytest.mark.dbfactory
+def test_inventory_listing_make_default(listing):
+    product = listing(1)[0]
+    first = models.ProductInventory.objects.get(sku="ls-0-0")
+    with CaptureQueriesContext(connection) as queries:
+        first.make_default()
+    assert "FOR UPDATE" in queries[1]["sql"]
+    assert list(
+        models.ProductInventory.objects.filter(product=product, is_default=True).values_list("sku", flat=True)
+    ) == ["ls-0-0"]
+    assert models.Product.objects.for_listing().get(pk=product.pk).default_sku == first
+    first.make_default()
+    assert models.ProductInventory.objects.filter(product=product, is_default=True).count() == 1
+
+
+@pytest.mark.dbfactory
+def test_inventory_listing_make_feature(listing):
+    listing(1)
+    sku = models.ProductInventory.objects.get(sku="ls-0-2")
+    other = sku.media_product_inventory.get(is_feature=False)
+    other.make_feature()
+    assert models.ProductInventory.objects.for_listing().get(pk=sku.pk).feature_image == other
+    assert sku.media_product_inventory.filter(is_feature=True).count() == 1
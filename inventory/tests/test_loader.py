@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+from django.core.management.base import CommandError
+from inventory import models
+from inventory.loader import iter_json_array, load_fixtures
+
+"""
+    Tests for the streaming bulk fixture loader ( inventory/loader.py ).
+"""
+
+CATEGORY_FIXTURE = [
+    # The child comes first, MPTT fields are left out on purpose
+    {"model": "inventory.category", "pk": 11, "fields": {"name": "boots", "slug": "boots", "parent": 10}},
+    {"model": "inventory.category", "pk": 10, "fields": {"name": "shoes", "slug": "shoes", "parent": None}},
+]
+PRODUCT_FIXTURE = [
+    {
+        "model": "inventory.product",
+        "id": str(n),
+        "fields": {
+            "web_id": f"loader_{n}", "slug": f"loader-{n}", "name": f"loader {n}",
+            "description": "loaded", "is_active": True,
+            "created_at": "2021-09-04 22:14:18", "updated_at": "2021-09-04 22:14:18",
+        },
+    }
+    for n in range(1, 6)
+]
+CATEGORY_PRODUCT_FIXTURE = [
+    {"model": "inventory.product_category", "id": str(n), "fields": {"product_id": str(n), "category_id": "11"}}
+    for n in range(1, 6)
+]
+
+
+@pytest.fixture
+def fixture_dir(settings, tmp_path):
+    for name, data in (
+        ("loader_category.json", CATEGORY_FIXTURE),
+        ("loader_product.json", PRODUCT_FIXTURE),
+        ("loader_category_product.json", CATEGORY_PRODUCT_FIXTURE),
+    ):
+        (tmp_path / name).write_text(json.dumps(data, indent=4))
+    settings.FIXTURE_DIRS = [tmp_path]
+    return tmp_path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_inventory_loader_iter_json_array(chunk_size):
+    data = [{"a": 1, "b": "x, ]"}, {"c": [1, 2, {"d": None}]}, {}]
+    fp = io.StringIO(json.dumps(data, indent=2))
+    assert list(iter_json_array(fp, chunk_size=chunk_size)) == data
+
+
+def test_inventory_loader_iter_json_array_truncated():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"a": 1}, {"b":'), chunk_size=4))
+
+
+@pytest.mark.dbfixture
+@pytest.mark.parametrize("use_copy", [False, True])
+def test_inventory_loader_load_fixtures(db, fixture_dir, use_copy):
+    """
+        Fixtures are given in the wrong order on purpose, the loader sorts
+        them by their foreign keys.
+    """
+    stats = load_fixtures(
+        ["loader_category_product", "loader_product.json", "loader_category"],
+        batch_size=2,
+        use_copy=use_copy,
+    )
+    assert {model_stats.model: model_stats.rows for model_stats in stats} == {
+        models.Category: 2,
+        models.Product: 5,
+        models.Product.category.through: 5,
+    }
+
+    product = models.Product.objects.get(id=3)
+    assert product.created_at.strftime("%Y-%m-%d %H:%M:%S") == "2021-09-04 22:14:18"
+    assert list(product.category.values_list("slug", flat=True)) == ["boots"]
+
+    # The tree was rebuilt at the end
+    boots = models.Category.objects.get(slug="boots")
+    assert [node.slug for node in boots.get_ancestors()] == ["shoes"]
+
+    # Sequences were moved past the loaded ids
+    assert models.Product.objects.create(
+        web_id="after_load", slug="after-load", name="after", description="after"
+    ).id > 5
+
+
+@pytest.mark.dbfixture
+def test_inventory_loader_load_fixtures_again(db, fixture_dir):
+    """
+        Loading into a database already loaded updates the rows.
+    """
+    names = ["loader_category", "loader_product", "loader_category_product"]
+    load_fixtures(names)
+    models.Product.objects.filter(id=3).update(name="renamed")
+    load_fixtures(names, batch_size=2)
+
+    assert models.Product.objects.count() == 5
+    product = models.Product.objects.get(id=3)
+    assert product.name == "loader 3"
+    assert product.updated_at.strftime("%Y-%m-%d %H:%M:%S") == "2021-09-04 22:14:18"
+    assert models.Product.category.through.objects.count() == 5
+    assert [node.slug for node in models.Category.objects.get(slug="boots").get_ancestors()] == ["shoes"]
+
+
+def test_inventory_loader_missing_fixture(db, fixture_dir):
+    with pytest.raises(CommandError):
+        load_fixtures(["loader_category", "not_there"])
+    assert not models.Category.objects.exists()
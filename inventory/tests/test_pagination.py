@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+from inventory import models
+from inventory.pagination import InvalidCursor, KeysetPaginator
+from inventory.product_cards import rebuild_product_cards
+
+"""
+    Tests for the keyset paginator ( inventory/pagination.py ).
+"""
+
+
+@pytest.fixture
+def listing(db, category_factory, product_factory):
+    """
+        23 products in a category and its child, every third one in both,
+        the first ten sharing their creation date.
+    """
+    parent = category_factory.create(slug="paged")
+    child = category_factory.create(slug="paged-child", parent=parent)
+    for n in range(23):
+        product_factory.create(
+            web_id=f"paged_{n}", slug=f"paged-{n}", name=f"paged {n}",
+            category=[parent, child] if n % 3 == 0 else [child],
+        )
+    start = datetime.datetime(2022, 1, 1)
+    for n, product in enumerate(models.Product.objects.order_by("id")):
+        product.created_at = start + datetime.timedelta(days=max(n - 9, 0))
+        product.save()
+    rebuild_product_cards()
+    return parent
+
+
+def paginator(parent, per_page=5, keys=("product_created_at", "product_id")):
+    return KeysetPaginator(
+        models.ProductCard.objects.in_category_subtree(parent).values(
+            "product_id", "name", "product_created_at"
+        ),
+        keys,
+        per_page,
+    )
+
+
+def walk(paginator, cursor=None, backwards=False):
+    pages = []
+    while True:
+        page = paginator.page(cursor)
+        pages.append([row["product_id"] for row in page])
+        cursor = page.previous_cursor if backwards else page.next_cursor
+        if cursor is None:
+            return pages[::-1] if backwards else pages
+
+
+@pytest.mark.dbfactory
+def test_inventory_pagination_walks_forward_and_back(listing):
+    expected = list(models.Product.objects.order_by("created_at", "id").values_list("id", flat=True))
+    pages = walk(paginator(listing))
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert sum(pages, []) == expected
+
+    last = paginator(listing).page(None)
+    cursor = None
+    while last.next_cursor:
+        cursor = last.next_cursor
+        last = paginator(listing).page(cursor)
+    assert not last.has_next()
+    back = walk(paginator(listing), last.previous_cursor, backwards=True)
+    assert sum(back, []) == expected[:-3]
+
+
+@pytest.mark.dbfactory
+def test_inventory_pagination_descending_keys(listing):
+    pages = walk(paginator(listing, per_page=4, keys=("-product_created_at", "-product_id")))
+    assert sum(pages, []) == list(
+        models.Product.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+    )
+
+
+@pytest.mark.dbfactory
+def test_inventory_pagination_deep_page_is_one_query(listing, django_assert_num_queries):
+    page = paginator(listing).page(None)
+    for _ in range(2):
+        page = paginator(listing).page(page.next_cursor)
+    cursors = (page.next_cursor, page.previous_cursor)
+    for cursor in cursors:
+        with django_assert_num_queries(1):
+            assert len(paginator(listing).page(cursor).object_list) == 5
+
+
+@pytest.mark.dbfactory
+def test_inventory_pagination_invalid_cursor(listing):
+    for cursor in ("nope", "W10", "WyJ4IiwgWzEsIDJdXQ", "WyJhIixbIm5vdCBhIGRhdGUiLDFdXQ"):
+        with pytest.raises(InvalidCursor):
+            paginator(listing).page(cursor)
@@ -0,0 +1,106 @@
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from inventory import models
+from inventory.price_buckets import category_buckets, rebuild_price_buckets
+
+"""
+    Tests for the price filters of the listing cards and the precomputed
+    price buckets ( inventory/price_buckets.py ).
+"""
+
+
+@pytest.fixture
+def priced_catalog(db, settings, category_factory, product_factory, product_inventory_factory):
+    """
+        A category and its child listing four products priced 5, 15, 15 and
+        900, the 15s one in each category, the first one on sale.
+    """
+    settings.PRICE_BUCKET_EDGES = (0, 10, 20, 50)
+    parent = category_factory.create(slug="priced", name="priced")
+    child = category_factory.create(slug="priced-child", name="priced child", parent=parent)
+    for n, (price, sale, categories) in enumerate((
+        (5, 4, [parent]),
+        (15, 20, [parent, child]),
+        (15, 15, [child]),
+        (900, 900, [parent]),
+    )):
+        product = product_factory.create(
+            web_id=f"priced_web_id_{n}", slug=f"priced-product-{n}", name=f"priced product {n}",
+            category=categories,
+        )
+        product_inventory_factory.create(
+            product=product, upc=f"priced_{n}", store_price=price, sale_price=sale,
+        )
+    return parent, child
+
+
+#### Filters ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_price_cards_copy_the_sale_price(priced_catalog):
+    cards = models.ProductCard.objects.filter(category_slug="priced")
+    assert set(cards.values_list("slug", "sale_price", "on_sale")) == {
+        ("priced-product-0", 4, True),
+        ("priced-product-1", 20, False),
+        ("priced-product-3", 900, False),
+    }
+
+
+@pytest.mark.dbfactory
+def test_inventory_price_cards_priced(priced_catalog):
+    parent, child = priced_catalog
+    cards = models.ProductCard.objects.in_category_subtree(parent)
+
+    def slugs(**filters):
+        return set(cards.priced(**filters).values_list("slug", flat=True))
+
+    assert slugs(min_price=10, max_price=15) == {"priced-product-1", "priced-product-2"}
+    assert slugs(min_price=100) == {"priced-product-3"}
+    assert slugs(max_price=5) == {"priced-product-0"}
+    assert slugs(on_sale=True) == {"priced-product-0"}
+    assert slugs(min_price=10, on_sale=True) == set()
+    assert len(slugs()) == 4
+
+
+#### Buckets ####
+
+
+@pytest.mark.dbfactory
+def test_inventory_price_buckets_count_the_subtree(priced_catalog):
+    parent, child = priced_catalog
+    buckets = [
+        (bucket.lower, bucket.upper, bucket.products, bucket.on_sale)
+        for bucket in category_buckets(parent)
+    ]
+    # The product listed under both categories is counted once, the one
+    # over the last edge not at all
+    assert buckets == [(0, 10, 1, 1), (10, 20, 2, 0)]
+    assert [(bucket.lower, bucket.products) for bucket in category_buckets(child)] == [(10, 2)]
+
+
+@pytest.mark.dbfactory
+def test_inventory_price_buckets_rebuild(priced_catalog):
+    parent, child = priced_catalog
+    assert rebuild_price_buckets() == 3
+    assert parent.price_buckets.count() == 2
+
+    models.ProductInventory.objects.filter(upc="priced_0").update(store_price=45)
+    models.ProductCard.objects.filter(slug="priced-product-0").update(store_price=45)
+    # The buckets only move on a rebuild
+    assert parent.price_buckets.get(lower=0).products == 1
+    call_command("rebuild-price-buckets", "--category", "priced")
+    assert set(parent.price_buckets.values_list("lower", "products")) == {(10, 2), (20, 1)}
+    assert child.price_buckets.count() == 1
+
+
+@pytest.mark.dbfactory
+def test_inventory_price_buckets_api(priced_catalog, client):
+    parent, child = priced_catalog
+    rebuild_price_buckets()
+    response = client.get(
+        reverse("api:list", kwargs={"resource": "price-buckets"}),
+        {"category_id": child.id},
+    )
+    assert [(row["lower"], row["products"]) for row in response.json()["results"]] == [("10.00", 2)]
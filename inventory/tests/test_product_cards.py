@@ -0,0 +1,98 @@
+import pytest
+from django.core.management import call_command
+from inventory import models
+from inventory.product_cards import rebuild_product_cards
+
+"""
+    Tests for the ProductCard read model ( inventory/product_cards.py ) and
+    the signals keeping it current ( inventory/signals.py ).
+"""
+
+
+@pytest.fixture
+def listed_product(db, category_factory, product_factory, stock_factory):
+    """
+        A product in two categories with a single SKU and its stock.
+    """
+    categories = category_factory.create_batch(2)
+    product = product_factory.create(
+        web_id="card_web_id", slug="card-product", name="card product",
+        category=categories,
+    )
+    stock = stock_factory.create(
+        product_inventory__product=product, product_inventory__store_price=55,
+        units=7,
+    )
+    return product, categories, stock
+
+
+@pytest.mark.dbfactory
+def test_inventory_product_card_created_per_category(listed_product):
+    product, categories, stock = listed_product
+    cards = models.ProductCard.objects.filter(product=product)
+    assert cards.count() == 2
+    assert set(cards.values_list("category_slug", flat=True)) == {
+        category.slug for category in categories
+    }
+    for card in cards:
+        assert card.name == "card product"
+        assert card.slug == "card-product"
+        assert card.inventory_id == stock.product_inventory_id
+        assert card.store_price == 55
+        assert card.units == 7
+
+
+@pytest.mark.dbfactory
+def test_inventory_product_card_follows_stock_save(listed_product):
+    product, categories, stock = listed_product
+    stock.units = 3
+    stock.save()
+    assert set(
+        models.ProductCard.objects.filter(product=product).values_list("units", flat=True)
+    ) == {3}
+
+
+@pytest.mark.dbfactory
+def test_inventory_product_card_follows_stock_delete(listed_product, django_capture_on_commit_callbacks):
+    product, categories, stock = listed_product
+    with django_capture_on_commit_callbacks(execute=True):
+        stock.delete()
+    assert set(
+        models.ProductCard.objects.filter(product=product).values_list("units", flat=True)
+    ) == {None}
+
+
+@pytest.mark.dbfactory
+def test_inventory_product_card_uses_default_sku(
+    listed_product, product_inventory_factory
+):
+    product, categories, stock = listed_product
+    default = product_inventory_factory.create(
+        product=product, store_price=12, is_default=True
+    )
+    card = models.ProductCard.objects.filter(product=product).first()
+    assert card.inventory_id == default.id
+    assert card.store_price == 12
+    assert card.units is None
+
+
+@pytest.mark.dbfactory
+def test_inventory_product_card_follows_category_changes(
+    listed_product, category_factory
+):
+    product, categories, stock = listed_product
+    new_category = category_factory.create()
+    product.category.remove(categories[0])
+    product.category.add(new_category)
+    assert set(
+        models.ProductCard.objects.filter(product=product).values_list("category_id", flat=True)
+    ) == {categories[1].id, new_category.id}
+
+
+@pytest.mark.dbfactory
+def test_inventory_product_card_rebuild(listed_product):
+    product, categories, stock = listed_product
+    models.ProductCard.objects.all().delete()
+    assert rebuild_product_cards(batch_size=1) == 2
+    call_command("rebuild-product-cards")
+    assert models.ProductCard.objects.filter(product=product).count() == 2
@@ -0,0 +1,254 @@
+import random
+import re
+
+import pytest
+from django.db import connection, transaction
+from django.urls import reverse
+from inventory import models
+from inventory.bulk import insert_rows, reset_sequences
+from inventory.search import (
+    PostgresSearchBackend,
+    PythonSearchBackend,
+    Vocabulary,
+    autocomplete,
+    document_positions,
+    rebuild_search_documents,
+    search,
+)
+
+"""
+    Tests for the product search ( inventory/search.py ), its backends and
+    the signals keeping the documents current.
+"""
+
+postgresql_only = pytest.mark.skipif(
+    connection.vendor != "postgresql", reason="needs the PostgreSQL backend"
+)
+
+
+@pytest.fixture
+def catalog(
+    db, product_factory, product_inventory_factory, product_attribute_factory,
+    product_attribute_value_factory,
+):
+    """
+        Six shoes with overlapping words in their name, description and
+        attribute values.
+    """
+    colour = product_attribute_factory.create(name="search-colour")
+    red, blue = (
+        product_attribute_value_factory.create(product_attribute=colour, attribute_value=value)
+        for value in ("red", "navy-blue")
+    )
+    texts = [
+        ("Red running shoe", "A light shoe for road running", [red]),
+        ("Trail running shoe", "Grippy outsole, red laces", [blue]),
+        ("Leather boot", "Waterproof leather boot for winter", [red, blue]),
+        ("Running sock", "Cushioned sock for running and trail running", []),
+        ("Canvas sneaker", "Classic canvas shoe", [blue]),
+        ("Runner's shoe bag", "Carries a running shoe or a boot", [red]),
+    ]
+    products = []
+    for n, (name, description, values) in enumerate(texts):
+        product = product_factory.create(
+            web_id=f"search_{n}", slug=f"search-{n}", name=name, description=description
+        )
+        inventory = product_inventory_factory.create(product=product)
+        for value in values:
+            models.ProductAttributeValues.objects.create(
+                productinventory=inventory, attributevalues=value
+            )
+        products.append(product)
+    return products
+
+
+def backends():
+    found = [PythonSearchBackend()]
+    if connection.vendor == "postgresql":
+        found.append(PostgresSearchBackend())
+    return found
+
+
+####
+# Documents
+###
+
+
+@postgresql_only
+@pytest.mark.parametrize("name, body", [
+    ("Red T-Shirt 10.5", "red shirt for men's running, cotton 100"),
+    ("", "only body body"),
+    ("name only", ""),
+    ("a-b-c d", "d d d e-f x2 1,000"),
+])
+def test_inventory_search_positions_match_tsvector(db, name, body):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')",
+            [name, body],
+        )
+        vector = cursor.fetchone()[0]
+    expected = {
+        lexeme: [
+            (int(position.rstrip("ABC")), {"A": 3, "B": 2, "C": 1}.get(position[-1], 0))
+            for position in positions.split(",")
+        ]
+        for lexeme, positions in re.findall(r"'([^']*)':(\S+)", vector)
+    }
+    assert document_positions(name, body) == expected
+
+
+@pytest.mark.dbfactory
+def test_inventory_search_documents_follow_the_catalog(catalog, product_attribute_value_factory):
+    document = models.ProductSearchDocument.objects.get(product=catalog[0])
+    assert document.name == "Red running shoe"
+    assert document.body == "A light shoe for road running red"
+
+    catalog[0].name = "Crimson running shoe"
+    catalog[0].save()
+    value = models.ProductAttributeValue.objects.get(attribute_value="red")
+    value.attribute_value = "scarlet"
+    value.save()
+    document.refresh_from_db()
+    assert (document.name, document.body) == ("Crimson running shoe", "A light shoe for road running scarlet")
+
+    inventory = catalog[4].product.get()
+    inventory.attribute_values.add(value)
+    assert models.ProductSearchDocument.objects.get(product=catalog[4]).body.endswith("navy-blue scarlet")
+
+    assert rebuild_search_documents() == len(catalog)
+
+
+####
+# Queries
+###
+
+
+@pytest.mark.dbfactory
+@pytest.mark.parametrize("text", [
+    "running", "running shoe", "red", "navy", "blue shoe", "boot", "trail running", "missing",
+    "shoe running red",
+])
+def test_inventory_search_backends_agree(catalog, text):
+    """
+        Both backends return the same products in the same order, ranked
+        like ts_rank().
+    """
+    results = [search(text, backend=backend) for backend in backends()]
+    expected = results[0]
+    for found in results[1:]:
+        assert [product_id for product_id, name, rank in found] == [
+            product_id for product_id, name, rank in expected
+        ]
+        assert [rank for product_id, name, rank in found] == pytest.approx(
+            [rank for product_id, name, rank in expected], rel=1e-5
+        )
+
+
+@pytest.mark.dbfactory
+def test_inventory_search_ranks_names_first(catalog):
+    names = [name for product_id, name, rank in search("boot")]
+    assert names[0] == "Leather boot"
+    assert set(names) == {"Leather boot", "Runner's shoe bag"}
+    assert search("running shoe")[0][1] == "Red running shoe"
+    assert search("  ") == []
+
+
+@pytest.mark.dbfactory
+def test_inventory_search_autocomplete(catalog):
+    for backend in backends():
+        assert {name for _, name, _ in autocomplete("leath", backend=backend)} == {"Leather boot"}
+        assert {name for _, name, _ in autocomplete("canvas sne", backend=backend)} == {"Canvas sneaker"}
+        # One typo, in the word or in the part typed so far
+        assert {name for _, name, _ in autocomplete("lether", backend=backend)} == {"Leather boot"}
+        assert {name for _, name, _ in autocomplete("sneek", backend=backend)} == {"Canvas sneaker"}
+        assert autocomplete("xyz", backend=backend) == []
+        # A trailing space ends the word
+        assert autocomplete("sock ", backend=backend) == search("sock", backend=backend)
+
+
+def test_inventory_search_vocabulary_completions():
+    vocabulary = Vocabulary({"running": 5, "runner": 2, "run": 9, "rug": 1, "shoe": 4, "waterproof": 1})
+    assert vocabulary.complete("run", 10) == ["run", "running", "runner"]
+    assert vocabulary.complete("run", 2) == ["run", "running"]
+    assert vocabulary.complete("rnu", 10) == []
+    assert vocabulary.complete("runnign", 10) == ["running"]
+    assert vocabulary.complete("watreproof", 10) == ["waterproof"]
+
+
+@pytest.mark.dbfactory
+def test_inventory_search_api(client, catalog):
+    body = client.get(reverse("api:search"), {"q": "leather"}).json()
+    assert [row["name"] for row in body["results"]] == ["Leather boot"]
+    body = client.get(reverse("api:autocomplete"), {"q": "sne"}).json()
+    assert [row["name"] for row in body["results"]] == ["Canvas sneaker"]
+    assert client.get(reverse("api:search"), {"q": "boot", "limit": "x"}).status_code == 400
+
+
+####
+# Benchmark
+###
+
+WORDS = [
+    "running", "trail", "road", "shoe", "boot", "sneaker", "sandal", "leather", "canvas", "suede",
+    "mesh", "waterproof", "lightweight", "cushioned", "classic", "winter", "summer", "slip",
+    "lace", "red", "blue", "black", "white", "grey", "green", "navy", "wide", "narrow", "kids",
+    "women", "men", "walking", "hiking", "training", "court", "retro", "platform", "ankle",
+    "chelsea", "loafer", "oxford", "derby", "mule", "clog", "espadrille", "slipper", "wedge",
+]
+
+
+@pytest.fixture(scope="module")
+def search_corpus(request, django_db_setup, django_db_blocker):
+    """
+        --catalog-size products with generated names and descriptions, the
+        words Zipf distributed, rolled back after the module.
+    """
+    size = request.config.getoption("--catalog-size")
+    rng = random.Random(0)
+    weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+    now = "2022-01-01 00:00:00"
+    with django_db_blocker.unblock():
+        atomic = transaction.atomic()
+        atomic.__enter__()
+        try:
+            first = (models.Product.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+            for start in range(0, size, 100000):
+                ids = range(first + start, first + min(start + 100000, size))
+                texts = [
+                    (" ".join(rng.choices(WORDS, weights, k=3)) + f" {n}", " ".join(rng.choices(WORDS, weights, k=12)))
+                    for n in ids
+                ]
+                insert_rows(models.Product, (
+                    "id", "web_id", "slug", "name", "description", "is_active", "created_at", "updated_at",
+                ), [
+                    (n, f"corpus{n}", f"corpus-{n}", name, body, True, now, now)
+                    for n, (name, body) in zip(ids, texts)
+                ], batch_size=5000, use_copy=True)
+                insert_rows(models.ProductSearchDocument, ("product_id", "name", "body"), [
+                    (n, name, body) for n, (name, body) in zip(ids, texts)
+                ], batch_size=5000, use_copy=True)
+            reset_sequences([models.Product])
+            yield size
+        finally:
+            transaction.set_rollback(True)
+            atomic.__exit__(None, None, None)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("text", ["sneaker", "leather boot", "waterproof trail running shoe"])
+def test_benchmark_search(db, search_corpus, benchmark, text):
+    """
+        Run with --catalog-size 1000000 for a million products, the queries
+        per second are printed.
+    """
+    result = benchmark(f"query:search:{text}", lambda: search(text, limit=20), max_queries=1)
+    print(f"search {text!r}: {1000 / result['median_ms']:.0f} queries/sec")
+
+
+@pytest.mark.benchmark
+def test_benchmark_autocomplete(db, search_corpus, benchmark):
+    # The first call reads the vocabulary, the timed ones use it
+    autocomplete("leat")
+    result = benchmark("query:autocomplete", lambda: autocomplete("classic leat", limit=10), max_queries=1)
+    print(f"autocomplete: {1000 / result['median_ms']:.0f} queries/sec")
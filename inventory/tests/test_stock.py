@@ -0,0 +1,207 @@
+import threading
+import time
+
+import pytest
+from django.db import connection
+from inventory import models
+from inventory.stock import (
+    InsufficientStock,
+    MissingStock,
+    commit,
+    release,
+    reserve,
+    restock,
+    shard_stock,
+    stock_levels,
+)
+
+"""
+    Tests for the stock reservations ( inventory/stock.py ).
+"""
+
+
+@pytest.fixture
+def stocks(db, category_factory, product_factory, stock_factory):
+    """
+        Three SKUs of one listed product with 10, 5 and 1 units.
+    """
+    product = product_factory.create(
+        web_id="stock_web_id", slug="stock-product", category=[category_factory.create()]
+    )
+    return [
+        stock_factory.create(
+            product_inventory__product=product, product_inventory__is_default=(units == 10),
+            units=units, units_sold=0,
+        )
+        for units in (10, 5, 1)
+    ]
+
+
+def levels(stocks):
+    found = stock_levels([stock.product_inventory_id for stock in stocks])
+    return [
+        (found[stock.product_inventory_id]["units"], found[stock.product_inventory_id]["units_reserved"],
+         found[stock.product_inventory_id]["units_sold"])
+        for stock in stocks
+    ]
+
+
+####
+# Reservations
+###
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_reserve_commit_release(stocks):
+    first, second, third = (stock.product_inventory_id for stock in stocks)
+    reserve({first: 4, second: 5})
+    assert levels(stocks) == [(6, 4, 0), (0, 5, 0), (1, 0, 0)]
+    commit({first: 3})
+    release({first: 1, second: 2})
+    assert levels(stocks) == [(7, 0, 3), (2, 3, 0), (1, 0, 0)]
+    restock({third: 4})
+    assert levels(stocks) == [(7, 0, 3), (2, 3, 0), (5, 0, 0)]
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_batch_is_all_or_nothing(stocks):
+    first, second, third = (stock.product_inventory_id for stock in stocks)
+    with pytest.raises(InsufficientStock) as error:
+        reserve({first: 2, second: 6, third: 1})
+    assert error.value.shortages == [second]
+    assert levels(stocks) == [(10, 0, 0), (5, 0, 0), (1, 0, 0)]
+
+    with pytest.raises(InsufficientStock):
+        commit({first: 1})
+    with pytest.raises(InsufficientStock):
+        reserve({first: 1, 0: 1})
+    assert levels(stocks) == [(10, 0, 0), (5, 0, 0), (1, 0, 0)]
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_restock_without_stock_row(
+    stocks, product_inventory_factory, django_capture_on_commit_callbacks
+):
+    first = stocks[0].product_inventory_id
+    unstocked = product_inventory_factory.create(product=stocks[0].product_inventory.product).id
+    changes = models.CatalogChange.objects.count()
+    with pytest.raises(MissingStock) as error, django_capture_on_commit_callbacks() as callbacks:
+        restock({first: 3, unstocked: 2, 0: 1})
+    assert error.value.inventory_ids == [0, unstocked]
+    assert levels(stocks)[0] == (10, 0, 0)
+    assert models.CatalogChange.objects.count() == changes and callbacks == []
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_batch_is_one_statement(stocks, django_assert_num_queries):
+    # One savepoint pair, the UPDATE, and the rows read back for the change
+    # feed INSERT, the card sync runs on commit
+    with django_assert_num_queries(5):
+        reserve({stock.product_inventory_id: 1 for stock in stocks})
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_rejects_negative_quantities(stocks):
+    with pytest.raises(ValueError):
+        reserve({stocks[0].product_inventory_id: -1})
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_updates_cards(stocks, django_capture_on_commit_callbacks):
+    card = models.ProductCard.objects.get(inventory_id=stocks[0].product_inventory_id)
+    assert card.units == 10
+    with django_capture_on_commit_callbacks(execute=True):
+        reserve({stocks[0].product_inventory_id: 4})
+    card.refresh_from_db()
+    assert card.units == 6
+
+
+####
+# Shards
+###
+
+
+@pytest.mark.dbfactory
+def test_inventory_stock_shard_and_fold_back(stocks, django_capture_on_commit_callbacks):
+    first, second, third = (stock.product_inventory_id for stock in stocks)
+    reserve({first: 1})
+    shard_stock(first, 4)
+    assert models.StockShard.objects.filter(stock=stocks[0]).count() == 4
+    assert sorted(models.StockShard.objects.values_list("units", flat=True)) == [2, 2, 2, 3]
+    assert levels(stocks)[0] == (9, 1, 0)
+
+    reserve({first: 3, second: 1})
+    commit({first: 2})
+    assert levels(stocks)[:2] == [(6, 2, 2), (4, 1, 0)]
+    # More than any single shard holds is spread over them
+    with django_capture_on_commit_callbacks(execute=True):
+        reserve({first: 6})
+    assert levels(stocks)[0] == (0, 8, 2)
+    assert models.ProductCard.objects.get(inventory_id=first).units == 0
+    with pytest.raises(InsufficientStock):
+        reserve({first: 1})
+
+    restock({first: 5})
+    shard_stock(first, 0)
+    stocks[0].refresh_from_db()
+    assert (stocks[0].units, stocks[0].units_reserved, stocks[0].units_sold) == (5, 8, 2)
+    assert not models.StockShard.objects.filter(stock=stocks[0]).exists()
+
+
+####
+# Concurrency
+###
+
+
+def run_buyers(inventory_id, buyers, attempts):
+    """
+        Buyers threads with their own connection each reserve one unit
+        attempts times, returns (reserved, rejected, seconds).
+    """
+    counts = {"reserved": 0, "rejected": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(buyers)
+
+    def buy():
+        try:
+            start.wait()
+            for _ in range(attempts):
+                try:
+                    reserve({inventory_id: 1})
+                    outcome = "reserved"
+                except InsufficientStock:
+                    outcome = "rejected"
+                with lock:
+                    counts[outcome] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buy) for _ in range(buyers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts["reserved"], counts["rejected"], time.perf_counter() - started
+
+
+@pytest.mark.dbfactory
+@pytest.mark.parametrize("shards", [0, 8])
+def test_inventory_stock_concurrent_reservations_never_oversell(
+    transactional_db, product_factory, stock_factory, shards
+):
+    stock = stock_factory.create(
+        product_inventory__product=product_factory.create(web_id="flash_web_id", slug="flash-sale"),
+        units=150, units_sold=0,
+    )
+    inventory_id = stock.product_inventory_id
+    if shards:
+        shard_stock(inventory_id, shards)
+
+    reserved, rejected, seconds = run_buyers(inventory_id, buyers=8, attempts=25)
+    print("%d shards: %.0f reservations/sec" % (shards, (reserved + rejected) / seconds))
+
+    assert (reserved, rejected) == (150, 50)
+    assert stock_levels([inventory_id])[inventory_id] == {
+        "units": 0, "units_reserved": 150, "units_sold": 0,
+    }
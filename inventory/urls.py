@@ -0,0 +1,13 @@
+from django.urls import path
+from . import views
+
+app_name = "api"
+
+urlpatterns = [
+    path('search/', views.product_search, name='search'),
+    path('autocomplete/', views.product_autocomplete, name='autocomplete'),
+    path('changes/', views.catalog_changes, name='changes'),
+    path('<slug:resource>/', views.resource_list, name='list'),
+    path('<slug:resource>/export/', views.resource_export, name='export'),
+    path('<slug:resource>/<int:pk>/', views.resource_detail, name='detail'),
+]
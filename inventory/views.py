@@ -1 +1,214 @@
-# from django.shortcuts import render
+"""
+    Read-only JSON catalog API.
+
+        GET api/<resource>/                 a page of rows, keyset paginated
+        GET api/<resource>/<id>/            one row
+        GET api/<resource>/export/          every row, as streamed NDJSON
+        GET api/search/?q=                  products matching a query
+        GET api/autocomplete/?q=            products matching a partly typed one
+        GET api/changes/?cursor=            catalog changes after a cursor
+
+    ?fields=id,name selects the fields returned, ?cursor= is the "next"
+    value of the previous page, the filters listed in RESOURCES take an id
+    ( ?product_id=3 ). The export reads the rows through a server-side
+    cursor in API_EXPORT_CHUNK_SIZE batches and writes them as they come,
+    so a full catalog export runs in constant memory.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from inventory import models
+from inventory.changes import RECORDED, changes_since
+from inventory.pagination import InvalidCursor, KeysetPaginator
+from inventory.search import autocomplete, search
+
+RESOURCES = {
+    "products": (
+        models.Product,
+        ("id", "web_id", "slug", "name", "description", "is_active", "created_at", "updated_at"),
+        (),
+    ),
+    "inventories": (
+        models.ProductInventory,
+        (
+            "id", "sku", "upc", "product_type_id", "product_id", "brand_id", "is_active",
+            "is_default", "retail_price", "store_price", "sale_price", "weight", "created_at",
+            "updated_at",
+        ),
+        ("product_id",),
+    ),
+    "stock": (
+        models.Stock,
+        ("id", "product_inventory_id", "last_checked", "units", "units_sold", "units_reserved"),
+        ("product_inventory_id",),
+    ),
+    "media": (
+        models.Media,
+        ("id", "product_inventory_id", "image", "alt_text", "is_feature", "created_at", "updated_at"),
+        ("product_inventory_id",),
+    ),
+    "attributes": (
+        models.ProductAttribute,
+        ("id", "name", "description"),
+        (),
+    ),
+    "attribute-values": (
+        models.ProductAttributeValue,
+        ("id", "product_attribute_id", "attribute_value"),
+        ("product_attribute_id",),
+    ),
+    "inventory-attribute-values": (
+        models.ProductAttributeValues,
+        ("id", "productinventory_id", "attributevalues_id"),
+        ("productinventory_id", "attributevalues_id"),
+    ),
+    "price-buckets": (
+        models.CategoryPriceBucket,
+        ("id", "category_id", "lower", "upper", "products", "on_sale"),
+        ("category_id",),
+    ),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def _resource(resource):
+    try:
+        return RESOURCES[resource]
+    except KeyError:
+        raise Http404("Unknown resource")
+
+
+def _queryset(request, resource):
+    """
+        Returns the resource's rows as a values() queryset with the requested
+        fields and filters.
+    """
+    model, fields, filters = _resource(resource)
+    if request.GET.get("fields"):
+        selected = request.GET["fields"].split(",")
+        unknown = [field for field in selected if field not in fields]
+        if unknown:
+            raise BadRequest("Unknown fields: %s" % ", ".join(unknown))
+    else:
+        selected = list(fields)
+
+    lookups = {}
+    for name in filters:
+        if name in request.GET:
+            try:
+                lookups[name] = int(request.GET[name])
+            except ValueError:
+                raise BadRequest("%s must be an id" % name)
+    return model.objects.filter(**lookups).values(*selected), selected
+
+
+def _dumps(row):
+    return json.dumps(row, cls=DjangoJSONEncoder)
+
+
+@require_GET
+def resource_list(request, resource):
+    try:
+        queryset, selected = _queryset(request, resource)
+        limit = min(int(request.GET.get("limit", settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+    except BadRequest as error:
+        return _error(str(error), 400)
+    except ValueError:
+        return _error("limit must be a number", 400)
+
+    # Pages by id, which is also selected to build the next cursor
+    paged = queryset.values(*selected, *([] if "id" in selected else ["id"]))
+    paginator = KeysetPaginator(paged, ("id",), max(limit, 1))
+    try:
+        page = paginator.page(request.GET.get("cursor"))
+        rows = page.object_list
+    except InvalidCursor:
+        return _error("Invalid cursor", 400)
+    return JsonResponse({
+        "results": [{field: row[field] for field in selected} for row in rows],
+        "next": page.next_cursor,
+    })
+
+
+@require_GET
+def resource_detail(request, resource, pk):
+    try:
+        queryset, selected = _queryset(request, resource)
+    except BadRequest as error:
+        return _error(str(error), 400)
+    row = queryset.filter(pk=pk).first()
+    if row is None:
+        raise Http404("No such row")
+    return JsonResponse(row)
+
+
+@require_GET
+def resource_export(request, resource):
+    try:
+        queryset, selected = _queryset(request, resource)
+    except BadRequest as error:
+        return _error(str(error), 400)
+
+    # iterator() reads the rows through a server-side cursor on PostgreSQL,
+    # only one chunk is ever held in memory
+    rows = queryset.order_by("pk").iterator(chunk_size=settings.API_EXPORT_CHUNK_SIZE)
+    response = StreamingHttpResponse(
+        (_dumps(row) + "\n" for row in rows), content_type="application/x-ndjson"
+    )
+    response["Content-Disposition"] = 'attachment; filename="%s.ndjson"' % resource
+    return response
+
+
+def _search_response(request, find, default_limit):
+    try:
+        limit = min(int(request.GET.get("limit", default_limit)), settings.API_MAX_PAGE_SIZE)
+    except ValueError:
+        return _error("limit must be a number", 400)
+    return JsonResponse({
+        "results": [
+            {"product_id": product_id, "name": name, "rank": rank}
+            for product_id, name, rank in find(request.GET.get("q", ""), limit=max(limit, 1))
+        ],
+    })
+
+
+@require_GET
+def product_search(request):
+    return _search_response(request, search, settings.API_PAGE_SIZE)
+
+
+@require_GET
+def product_autocomplete(request):
+    return _search_response(request, autocomplete, 10)
+
+
+@require_GET
+def catalog_changes(request):
+    """
+        The change feed, see inventory/changes.py. ?models=product,stock
+        restricts it to some models, "next" is the cursor of the following
+        request and stays the same until there are new changes.
+    """
+    try:
+        limit = min(int(request.GET.get("limit", settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+    except ValueError:
+        return _error("limit must be a number", 400)
+    model_names = [name for name in request.GET.get("models", "").split(",") if name]
+    unknown = [name for name in model_names if name not in RECORDED]
+    if unknown:
+        return _error("Unknown models: %s" % ", ".join(unknown), 400)
+    try:
+        changes, cursor = changes_since(request.GET.get("cursor", ""), max(limit, 1), model_names)
+    except InvalidCursor:
+        return _error("Invalid cursor", 400)
+    return JsonResponse({"results": changes, "next": cursor})
@@ -0,0 +1,258 @@
+"""
+    In-process database connection pool.
+
+    Opening a PostgreSQL connection costs a TCP ( or TLS ) handshake, the
+    authentication exchange and a backend process fork, several times a short
+    query such as the category list. The pool keeps opened connections and
+    hands them out again, see main/db/postgresql_pool/ for the Django backend
+    using it.
+
+        pool = ConnectionPool(connect, size=10, max_overflow=10, timeout=30)
+        connection = pool.checkout()
+        ...
+        pool.checkin(connection)
+
+    Up to size connections are kept open once used, up to max_overflow more
+    are opened under load and closed again when returned. Past size +
+    max_overflow checkout() waits for a returned connection, up to timeout
+    seconds before raising PoolTimeout.
+
+    Connections are checked on checkout when idle for more than check_after
+    seconds ( a SELECT 1 ) and replaced when broken or older than recycle
+    seconds. Returned connections are rolled back if still in a transaction,
+    and dropped if that fails.
+
+    Every pool counts checkouts, waits, timeouts and the connections it
+    opened and closed, see ConnectionPool.stats() and pool_stats().
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2 import extensions
+
+RESETTABLE = (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+        A thread safe pool of DB-API connections returned by connect().
+    """
+
+    def __init__(self, connect, size=10, max_overflow=10, timeout=30, recycle=None, check_after=30):
+        self.connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check_after = check_after
+
+        self._lock = threading.Condition()
+        # (connection, opened at, returned at), most recently returned last
+        self._idle = deque()
+        # {connection: opened at} of the connections handed out
+        self._in_use = {}
+        # Connections being opened, outside the lock
+        self._opening = 0
+        self.counters = dict.fromkeys((
+            "checkouts", "checkins", "connects", "closes", "waits", "wait_time", "timeouts",
+            "health_check_failures", "recycled", "discarded",
+        ), 0)
+
+    @property
+    def capacity(self):
+        return self.size + self.max_overflow
+
+    def _count(self, counter, value=1):
+        # Called with the lock held
+        self.counters[counter] += value
+
+    def _open_count(self):
+        # Called with the lock held
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _take(self):
+        """
+            Returns an idle connection, or None having reserved a slot for a
+            new one. Called with the lock held.
+        """
+        if self._idle:
+            return self._idle.pop()
+        self._opening += 1
+        return None
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._count("closes")
+
+    def _healthy(self, connection, opened, returned):
+        """
+            Returns the reason to drop an idle connection, or None to use it.
+        """
+        if connection.closed:
+            return "discarded"
+        now = time.monotonic()
+        if self.recycle is not None and now - opened >= self.recycle:
+            return "recycled"
+        if self.check_after is not None and now - returned >= self.check_after:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            except Exception:
+                return "health_check_failures"
+        return None
+
+    def checkout(self):
+        """
+            Returns an open connection, waiting up to timeout seconds for one
+            when the pool is exhausted.
+        """
+        started = None
+        with self._lock:
+            while not self._idle and self._open_count() >= self.capacity:
+                if started is None:
+                    started = time.monotonic()
+                    self._count("waits")
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0 or not self._lock.wait(remaining):
+                    if not self._idle and self._open_count() >= self.capacity:
+                        self._count("timeouts")
+                        self._count("wait_time", time.monotonic() - started)
+                        raise PoolTimeout(
+                            "No connection returned to the pool within %ss, %d in use"
+                            % (self.timeout, len(self._in_use))
+                        )
+            if started is not None:
+                self._count("wait_time", time.monotonic() - started)
+            self._count("checkouts")
+            idle = self._take()
+
+        while idle is not None:
+            connection, opened, returned = idle
+            reason = self._healthy(connection, opened, returned)
+            if reason is None:
+                with self._lock:
+                    self._in_use[connection] = opened
+                return connection
+            self._close(connection)
+            with self._lock:
+                self._count(reason)
+                idle = self._take()
+
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._in_use[connection] = time.monotonic()
+            self._count("connects")
+        return connection
+
+    def checkin(self, connection):
+        """
+            Returns a connection from checkout(), it is closed when it is not
+            reusable or the pool holds size connections without it.
+        """
+        with self._lock:
+            opened = self._in_use[connection]
+            self._count("checkins")
+            keep = self._open_count() <= self.size
+
+        # The connection keeps its slot until it is idle or closed
+        reusable = keep and not connection.closed
+        if reusable:
+            status = connection.info.transaction_status
+            if status in RESETTABLE:
+                try:
+                    connection.rollback()
+                except Exception:
+                    reusable = False
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                reusable = False
+        if not reusable:
+            self._close(connection)
+
+        with self._lock:
+            del self._in_use[connection]
+            if reusable:
+                self._idle.append((connection, opened, time.monotonic()))
+            elif keep:
+                self._count("discarded")
+            self._lock.notify()
+
+    def dispose(self):
+        """
+            Closes the idle connections, the ones in use are closed when they
+            are returned.
+        """
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, opened, returned in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "wait_time": round(self.counters["wait_time"], 6),
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use) + self._opening,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def get_pool(key, connect, **options):
+    """
+        Returns the process' pool for key, creating it with connect and
+        options on first use. A forked process starts without pools, the
+        parent's connections must not be shared.
+    """
+    global _pid
+    with _pools_lock:
+        if os.getpid() != _pid:
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(connect, **options)
+        return pool
+
+
+def pools():
+    with _pools_lock:
+        return dict(_pools)
+
+
+def pool_stats():
+    """
+        Returns the stats() of every pool of this process by key.
+    """
+    return {key: pool.stats() for key, pool in pools().items()}
+
+
+def dispose_pools(predicate=None):
+    """
+        Closes the idle connections of every pool whose key matches.
+    """
+    for key, pool in pools().items():
+        if predicate is None or predicate(key):
+            pool.dispose()
@@ -0,0 +1,90 @@
+"""
+    PostgreSQL backend taking its connections from an in-process pool.
+
+        DATABASES = {
+            'default': {
+                'ENGINE': 'main.db.postgresql_pool',
+                ...
+                'POOL': {'SIZE': 10, 'MAX_OVERFLOW': 10, 'TIMEOUT': 30},
+            }
+        }
+
+    Closing the connection, at the end of every request with CONN_MAX_AGE 0,
+    returns it to the pool rather than closing it, see main/db/pool.py for
+    the POOL options. Connections of one database, user and alias share a
+    pool across threads. The connections used to create and drop databases
+    are not pooled.
+"""
+import psycopg2
+import psycopg2.extras
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from main.db.pool import get_pool
+from main.db.postgresql_pool.creation import DatabaseCreation
+
+POOL_OPTIONS = {
+    "SIZE": "size",
+    "MAX_OVERFLOW": "max_overflow",
+    "TIMEOUT": "timeout",
+    "RECYCLE": "recycle",
+    "CHECK_AFTER": "check_after",
+}
+
+
+def pool_key(alias, conn_params):
+    return (
+        alias, conn_params.get("host"), conn_params.get("port"), conn_params["database"],
+        conn_params.get("user"),
+    )
+
+
+def _connect(conn_params, isolation_level):
+    # What the PostgreSQL backend's get_new_connection() does to a new
+    # connection, the wrapper's own state is set on checkout
+    connection = psycopg2.connect(**conn_params)
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_pool = None
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict["OPTIONS"]
+        return get_pool(
+            pool_key(self.alias, conn_params),
+            lambda: _connect(conn_params, options.get("isolation_level")),
+            **{
+                POOL_OPTIONS[name]: value
+                for name, value in self.settings_dict.get("POOL", {}).items()
+            },
+        )
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            self.connection_pool = None
+            return super().get_new_connection(conn_params)
+        self.connection_pool = self.get_pool(conn_params)
+        connection = self.connection_pool.checkout()
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.connection_pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps the connection until the atomic block exits,
+                # it must not be handed out again meanwhile
+                self.connection.close()
+            self.connection_pool.checkin(self.connection)
@@ -0,0 +1,10 @@
+from django.db.backends.postgresql import creation
+from main.db.pool import dispose_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep DROP DATABASE from running
+        dispose_pools(lambda key: key[3] == test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,182 @@
+"""
+    Read replica routing.
+
+    Reads of the catalog apps go to the replicas in DATABASE_REPLICAS, an
+    {alias: weight} mapping of DATABASES entries, picked by smooth weighted
+    round robin: with {"replica_a": 3, "replica_b": 1} three reads in four go
+    to replica_a, interleaved rather than in runs. Writes and everything else
+    stay on the primary ( "default" ).
+
+    Replicas lag behind the primary, so reads stay on the primary:
+        - inside a transaction on the primary, which must see its own writes
+        - for REPLICA_PIN_SECONDS after a write in the same request or
+          session. PrimaryPinMiddleware remembers the write in a cookie for
+          the client's next requests.
+
+    Locally, a replica can be a second DATABASES entry for the same database,
+    or a copy of it:
+
+        DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+        DATABASE_REPLICAS = {'replica': 1}
+
+    Replicas are never migrated, they follow the primary.
+"""
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "primary_pinned_until"
+
+
+class RoutingState:
+    """
+        Whether reads of the current request, or of code running outside
+        one, are pinned to the primary and until when.
+    """
+
+    def __init__(self, pinned_until=0.0):
+        self.pinned_until = pinned_until
+        self.wrote = False
+
+    def pinned(self):
+        return time.time() < self.pinned_until
+
+    def pin(self):
+        self.wrote = True
+        self.pinned_until = time.time() + settings.REPLICA_PIN_SECONDS
+
+
+_state = ContextVar("routing_state", default=None)
+
+
+def routing_state():
+    state = _state.get()
+    if state is None:
+        # Outside a request, a management command say, the state lasts as
+        # long as the context
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+class WeightedRoundRobin:
+    """
+        Smooth weighted round robin over {choice: weight}.
+    """
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self.total = sum(self.weights.values())
+        self.current = dict.fromkeys(self.weights, 0)
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            for choice, weight in self.weights.items():
+                self.current[choice] += weight
+            chosen = max(self.current, key=self.current.get)
+            self.current[chosen] -= self.total
+            return chosen
+
+
+class ReplicaRouter:
+    """
+        Sends reads of route_app_labels to the replicas, see the module
+        docstring.
+    """
+
+    route_app_labels = {"inventory"}
+
+    def __init__(self):
+        self._balancers = {}
+
+    def _replicas(self):
+        weights = tuple(sorted(
+            (alias, weight) for alias, weight in settings.DATABASE_REPLICAS.items() if weight > 0
+        ))
+        if not weights:
+            return None
+        balancer = self._balancers.get(weights)
+        if balancer is None:
+            balancer = self._balancers[weights] = WeightedRoundRobin(weights)
+        return balancer
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        balancer = self._replicas()
+        if balancer is None:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or routing_state().pinned():
+            return DEFAULT_DB_ALIAS
+        return balancer.next()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        routing_state().pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class PrimaryPinMiddleware:
+    """
+        Keeps a client's reads on the primary for REPLICA_PIN_SECONDS after
+        one of its requests wrote, through a cookie holding the time the pin
+        ends. Every request starts with its own RoutingState.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Lets Django call it as a coroutine, like MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def _start(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0.0
+        state = RoutingState(pinned_until)
+        return state, _state.set(state)
+
+    def _finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, "%.3f" % state.pinned_until, max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite="Lax",
+            )
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
@@ -45,6 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Only active with QUERY_METRICS_ENABLED, kept first to time everything
+    'demo.middleware.QueryMetricsMiddleware',
+    # Reads after a write stay on the primary, see main/routers.py
+    'main.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,17 +89,140 @@ WSGI_APPLICATION = 'main.wsgi.application'
 #     }
 # }
 
+# Connections come from an in-process pool ( main/db/pool.py ), closing one at
+# the end of a request returns it to the pool. POOL sets the connections
+# kept open, the extra ones opened under load, the seconds a request waits
+# for one, after which a connection is replaced ( None keeps it ) and after
+# how long idle it is checked with a SELECT 1 before use. Pooling also
+# covers the executor threads of the async views ( demo/async_views.py ),
+# whose connections persistent ones would leave open per thread.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'main.db.postgresql_pool',
         'NAME': 'postgres',
         'USER': 'postgres',
         'PASSWORD': 'postgres',
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': 10,
+            'MAX_OVERFLOW': 10,
+            'TIMEOUT': 30,
+            'RECYCLE': 60 * 60,
+            'CHECK_AFTER': 30,
+        },
     }
 }
 
+# Without the pool, persistent connections are kept per thread for
+# CONN_MAX_AGE seconds instead
+# DATABASES['default']['ENGINE'] = 'django.db.backends.postgresql'
+# DATABASES['default']['CONN_MAX_AGE'] = 60
+
+# Read replicas of the primary as {alias: weight}, catalog reads are spread
+# over them ( main/routers.py ). Reads stay on the primary for
+# REPLICA_PIN_SECONDS after a write by the same client, and cached catalog
+# data is invalidated again that long after a write ( inventory/cache.py ),
+# keep it above the replicas' lag.
+# DATABASES['replica'] = {**DATABASES['default'], 'HOST': '10.0.0.2', 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = {}
+REPLICA_PIN_SECONDS = 5
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce',
+    }
+}
+
+# A file based cache is shared by all the server processes
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#         'LOCATION': BASE_DIR / 'cache',
+#     }
+# }
+
+# Seconds a rendered categories page is kept for. Category changes
+# invalidate it by a version bump, the stock and price rollups shown with
+# it ( inventory/category_stats.py ) are left this old at most
+CATEGORY_PAGE_CACHE_TIMEOUT = 60
+
+# Seconds a product's attribute facet index is kept for
+FACET_INDEX_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a rendered listing page is kept for, keyed by its ETag so it is
+# never served once the listing changed, see inventory/conditional.py
+CATALOG_FRAGMENT_CACHE_TIMEOUT = 60 * 10
+
+# Cache-Control of the catalog views by policy name, see demo/caching.py.
+# Browsers revalidate on every use, a 304 costs one query; shared caches
+# ( a CDN ) keep a page for s_maxage and may serve it stale while they
+# revalidate in the background
+CACHE_CONTROL_POLICIES = {
+    'listing': {'public': True, 'max_age': 0, 's_maxage': 60, 'stale_while_revalidate': 300},
+    'product': {'public': True, 'max_age': 0, 's_maxage': 30, 'stale_while_revalidate': 60},
+}
+
+# Querysets the planner estimates at this many rows or more are not counted
+# exactly, see inventory/counting.py
+COUNT_ESTIMATE_THRESHOLD = 10000
+
+# Edges of the price ranges counted for the listings' price sliders, see
+# inventory/price_buckets.py. Prices from the last edge on are not counted
+PRICE_BUCKET_EDGES = (0, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+# Rows per page of the keyset paginated listings, see inventory/pagination.py
+CATEGORIES_PER_PAGE = 100
+PRODUCTS_PER_PAGE = 24
+
+# JSON catalog API ( inventory/views.py ), rows per page by default and at
+# most, and rows read per server-side cursor fetch by the NDJSON exports
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_EXPORT_CHUNK_SIZE = 2000
+
+# Product search ( inventory/search.py ), the backend's dotted path or None
+# to pick by database vendor, seconds the PostgreSQL vocabulary is kept for
+# and the completions of a partly typed word an autocomplete searches for
+SEARCH_BACKEND = None
+SEARCH_VOCABULARY_TIMEOUT = 60 * 10
+SEARCH_AUTOCOMPLETE_EXPANSIONS = 10
+
+
+# Query metrics
+# Per request query count, DB and render time as Server-Timing headers and
+# 'demo.metrics' log lines, aggregated per URL name in QUERY_METRICS_CACHE.
+# Dump the histograms with: python manage.py dump-query-metrics
+
+QUERY_METRICS_ENABLED = False
+
+QUERY_METRICS_CACHE = 'default'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'demo.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -133,6 +260,17 @@ USE_TZ = False
 
 STATIC_URL = 'static/'
 
+# Uploaded files, Media images and their resized derivatives
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+
+# Media images are resized to these widths in these formats ( with their
+# quality ) by a process pool of IMAGE_DERIVATIVE_WORKERS, None for one per
+# CPU, 0 to resize in the uploading process. See inventory/images.py
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+IMAGE_DERIVATIVE_FORMATS = {'webp': 80, 'jpeg': 82}
+IMAGE_DERIVATIVE_WORKERS = None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
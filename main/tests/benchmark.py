@@ -0,0 +1,244 @@
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+import factory
+import pytest
+from django.db import connection, transaction
+from demo.metrics import QueryRecorder
+from inventory import models
+from inventory.category_stats import rebuild_category_stats
+from inventory.price_buckets import rebuild_price_buckets
+from inventory.product_cards import rebuild_product_cards
+from inventory.search import rebuild_search_documents
+from main.tests import factory as factories
+
+"""
+    Catalog performance benchmark plugin.
+
+    Options:
+        --catalog-size          ProductInventory rows in the benchmark catalog
+        --benchmark-json        file the timings are written to
+        --benchmark-baseline    earlier --benchmark-json file to compare with
+        --benchmark-tolerance   allowed slowdown against the baseline ( 0.25 )
+
+    Run with:
+        pytest -m benchmark --catalog-size 100000 --benchmark-json results.json
+        pytest -m benchmark --catalog-size 100000 --benchmark-baseline results.json
+
+    A benchmark fails when it runs more queries than its upper bound or than
+    the baseline, or when its median time is over the baseline's median by
+    more than the tolerance. Baselines only apply to runs on the same catalog
+    size and database.
+"""
+
+SKUS_PER_PRODUCT = 4
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark")
+    group.addoption(
+        "--catalog-size", type=int, default=1000,
+        help="ProductInventory rows in the benchmark catalog ( default 1000 )",
+    )
+    group.addoption("--benchmark-json", help="write the benchmark results to this file")
+    group.addoption("--benchmark-baseline", help="compare the results with this file")
+    group.addoption(
+        "--benchmark-tolerance", type=float, default=0.25,
+        help="allowed slowdown against the baseline ( default 0.25 )",
+    )
+
+
+def pytest_configure(config):
+    config._benchmark_results = {}
+    config._benchmark_baseline = {}
+    baseline = config.getoption("--benchmark-baseline", None)
+    if baseline:
+        config._benchmark_baseline = json.loads(Path(baseline).read_text())
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    path = config.getoption("--benchmark-json", None)
+    if path and config._benchmark_results:
+        Path(path).write_text(json.dumps({
+            "catalog_size": config.getoption("--catalog-size"),
+            "database": connection.vendor,
+            "results": config._benchmark_results,
+        }, indent=2, sort_keys=True))
+
+
+def build_catalog(size, seed=0):
+    """
+        Builds a catalog with the factories and writes it with bulk_create:
+            - a category tree of 1 root, 10 children and 100 leaves
+            - size // SKUS_PER_PRODUCT products, each in one leaf category
+            - size SKUs with their stock, a feature image and two attribute
+              values ( colour and size ), priced 5 to 999, one in ten on sale
+    """
+    rng = random.Random(seed)
+    root = factories.CategoryFactory.create(name="bench", slug="bench")
+    children = [
+        factories.CategoryFactory.create(name=f"bench_{n}", slug=f"bench-{n}", parent=root)
+        for n in range(10)
+    ]
+    leaves = [
+        factories.CategoryFactory.create(
+            name=f"bench_{parent.id}_{n}", slug=f"bench-{parent.id}-{n}", parent=parent
+        )
+        for parent in children
+        for n in range(10)
+    ]
+
+    product_type = factories.ProductTypeFactory.create()
+    brand = factories.BrandFactory.create()
+    # Created without their factories, whose sequences the tests of the same
+    # session expect to start at 0
+    colour = models.ProductAttribute.objects.create(name="bench-colour", description="benchmark colour")
+    shoe_size = models.ProductAttribute.objects.create(name="bench-size", description="benchmark size")
+    colours = [
+        models.ProductAttributeValue.objects.create(product_attribute=colour, attribute_value=value)
+        for value in ("red", "blue", "green", "black")
+    ]
+    sizes = [
+        models.ProductAttributeValue.objects.create(product_attribute=shoe_size, attribute_value=str(value))
+        for value in range(5, 13)
+    ]
+
+    products = models.Product.objects.bulk_create(
+        factories.ProductFactory.build_batch(
+            max(size // SKUS_PER_PRODUCT, 1),
+            web_id=factory.Sequence(lambda n: f"bench_{n}"),
+            slug=factory.Sequence(lambda n: f"bench-product-{n}"),
+            name=factory.Sequence(lambda n: f"bench product {n}"),
+            description="benchmark product",
+        ),
+        batch_size=5000,
+    )
+    through = models.Product.category.through
+    through.objects.bulk_create(
+        [through(product_id=product.id, category_id=rng.choice(leaves).id) for product in products],
+        batch_size=5000,
+    )
+
+    inventories = models.ProductInventory.objects.bulk_create(
+        factories.ProductInventoryFactory.build_batch(
+            size,
+            sku=factory.Sequence(lambda n: f"bench_{n}"),
+            upc=factory.Sequence(lambda n: f"b{n}"),
+            product=factory.Iterator(
+                [product for product in products for _ in range(SKUS_PER_PRODUCT)]
+            ),
+            is_default=factory.Iterator([True] + [False] * (SKUS_PER_PRODUCT - 1)),
+            store_price=factory.LazyFunction(lambda: rng.randint(5, 999)),
+            sale_price=factory.LazyAttribute(
+                lambda inventory: inventory.store_price // 2 if rng.random() < 0.1 else inventory.store_price
+            ),
+            product_type=product_type,
+            brand=brand,
+        ),
+        batch_size=5000,
+    )
+    models.Stock.objects.bulk_create(
+        factories.StockFactory.build_batch(
+            size, product_inventory=factory.Iterator(inventories), units=factory.LazyFunction(
+                lambda: rng.randint(0, 200)
+            ),
+        ),
+        batch_size=5000,
+    )
+    models.Media.objects.bulk_create(
+        factories.MediaFactory.build_batch(size, product_inventory=factory.Iterator(inventories)),
+        batch_size=5000,
+    )
+    models.ProductAttributeValues.objects.bulk_create(
+        [
+            models.ProductAttributeValues(productinventory_id=inventory.id, attributevalues_id=value.id)
+            for inventory in inventories
+            for value in (rng.choice(colours), rng.choice(sizes))
+        ],
+        batch_size=5000,
+    )
+    rebuild_product_cards(batch_size=5000)
+    rebuild_search_documents(batch_size=5000)
+    rebuild_price_buckets()
+    rebuild_category_stats()
+    return {
+        "root": root,
+        "category": children[0],
+        "leaf": leaves[0],
+        "products": products,
+        "product": products[0],
+    }
+
+
+@pytest.fixture(scope="module")
+def catalog(request, django_db_setup, django_db_blocker):
+    """
+        The benchmark catalog, built once per module and rolled back after.
+    """
+    size = request.config.getoption("--catalog-size")
+    with django_db_blocker.unblock():
+        atomic = transaction.atomic()
+        atomic.__enter__()
+        try:
+            yield build_catalog(size)
+        finally:
+            transaction.set_rollback(True)
+            atomic.__exit__(None, None, None)
+
+
+@pytest.fixture
+def benchmark(request):
+    """
+        Times a callable and records the result:
+
+            benchmark("name", fn, max_queries=3, rounds=5)
+
+        Every round runs fn once, the query count is taken from the first.
+    """
+    config = request.config
+
+    def run(name, fn, max_queries=None, rounds=5):
+        with QueryRecorder() as recorder:
+            fn()
+        queries = recorder.count
+
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        result = {
+            "queries": queries,
+            "rounds": rounds,
+            "min_ms": round(min(timings), 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+        }
+        config._benchmark_results[name] = result
+
+        if max_queries is not None:
+            assert queries <= max_queries, (
+                f"{name} ran {queries} queries, the upper bound is {max_queries}"
+            )
+        baseline = config._benchmark_baseline
+        comparable = (
+            baseline.get("catalog_size") == config.getoption("--catalog-size"),
+            baseline.get("database") == connection.vendor,
+            name in baseline.get("results", {}),
+        )
+        if all(comparable):
+            previous = baseline["results"][name]
+            tolerance = config.getoption("--benchmark-tolerance")
+            assert queries <= previous["queries"], (
+                f"{name} ran {queries} queries, {previous['queries']} in the baseline"
+            )
+            assert result["median_ms"] <= previous["median_ms"] * (1 + tolerance), (
+                f"{name} took {result['median_ms']}ms, {previous['median_ms']}ms in the baseline"
+            )
+        return result
+
+    return run
@@ -1,5 +1,18 @@
 import pytest
+from django.core.cache import cache
 from django.core.management import call_command
+from inventory.loader import load_fixtures
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Empties the cache around every test, cached catalog data would otherwise
+    outlive the rolled back test transaction
+    """
+    cache.clear()
+    yield
+    cache.clear()
 
 
 @pytest.fixture
@@ -19,15 +32,19 @@ def django_db_fixture_setup(django_db_setup, django_db_blocker):
         - Category fixture
     """
     with django_db_blocker.unblock():
-        call_command("loaddata", "db_admin_fixture.json")
-        call_command("loaddata", "db_category_fixture.json")
-        call_command("loaddata", "db_product_fixture.json")
-        call_command("loaddata", "db_category_product_fixture.json")
-        call_command("loaddata", "db_brand_fixture.json")
-        call_command("loaddata", "db_type_fixture.json")
-        call_command("loaddata", "db_product_inventory_fixture.json")
-        call_command("loaddata", "db_media_fixture.json")
-        call_command("loaddata", "db_stock_fixture.json")
-        call_command("loaddata", "db_product_attribute_fixture.json")
-        call_command("loaddata", "db_product_attribute_value_fixture.json")
-        call_command("loaddata", "db_product_attribute_values_fixture.json")
+        load_fixtures([
+            "db_admin_fixture.json",
+            "db_category_fixture.json",
+            "db_product_fixture.json",
+            "db_category_product_fixture.json",
+            "db_brand_fixture.json",
+            "db_type_fixture.json",
+            "db_product_inventory_fixture.json",
+            "db_media_fixture.json",
+            "db_stock_fixture.json",
+            "db_product_attribute_fixture.json",
+            "db_product_attribute_value_fixture.json",
+            "db_product_attribute_values_fixture.json",
+        ])
+        call_command("rebuild-product-cards")
+        call_command("rebuild-search-index")
@@ -0,0 +1,256 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresWrapper
+from main.db.pool import ConnectionPool, PoolTimeout, dispose_pools, pool_stats
+from main.db.postgresql_pool.base import DatabaseWrapper
+from psycopg2 import extensions
+
+"""
+    Tests for the connection pool ( main/db/pool.py ) and the pooled
+    PostgreSQL backend ( main/db/postgresql_pool/ ).
+"""
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = 0
+        self.info = type("Info", (), {"transaction_status": extensions.TRANSACTION_STATUS_IDLE})()
+        self.rollbacks = 0
+        self.pings = 0
+        self.broken = False
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        if self.broken:
+            raise RuntimeError("server closed the connection unexpectedly")
+        self.pings += 1
+        return self
+
+    def execute(self, sql):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def fake_pool(**options):
+    return ConnectionPool(FakeConnection, **{"size": 2, "max_overflow": 1, "timeout": 0.05, **options})
+
+
+def test_main_pool_reuses_connections():
+    pool = fake_pool()
+    first = pool.checkout()
+    pool.checkin(first)
+    assert pool.checkout() is first
+    stats = pool.stats()
+    assert (stats["checkouts"], stats["connects"], stats["in_use"], stats["idle"]) == (2, 1, 1, 0)
+
+
+def test_main_pool_overflow_is_closed_on_checkin():
+    pool = fake_pool()
+    connections = [pool.checkout() for _ in range(3)]
+    for checked_out in connections:
+        pool.checkin(checked_out)
+    # The first one back finds the pool over its size
+    assert [checked_out.closed for checked_out in connections] == [1, 0, 0]
+    assert pool.stats()["idle"] == 2
+
+
+def test_main_pool_times_out_when_exhausted():
+    pool = fake_pool()
+    for _ in range(3):
+        pool.checkout()
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+    stats = pool.stats()
+    assert (stats["waits"], stats["timeouts"]) == (1, 1)
+    assert stats["wait_time"] >= 0.05
+
+
+def test_main_pool_waits_for_a_returned_connection():
+    pool = fake_pool(size=3, max_overflow=0, timeout=5)
+    connections = [pool.checkout() for _ in range(3)]
+    threading.Timer(0.05, pool.checkin, [connections[0]]).start()
+    assert pool.checkout() is connections[0]
+    stats = pool.stats()
+    assert (stats["waits"], stats["timeouts"], stats["connects"]) == (1, 0, 3)
+
+
+def test_main_pool_resets_and_replaces_connections():
+    pool = fake_pool(check_after=None)
+
+    # Returned in a transaction, rolled back
+    checked_out = pool.checkout()
+    checked_out.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+    pool.checkin(checked_out)
+    assert checked_out.rollbacks == 1
+    assert pool.checkout() is checked_out
+
+    # Returned mid query, dropped
+    checked_out.info.transaction_status = extensions.TRANSACTION_STATUS_ACTIVE
+    pool.checkin(checked_out)
+    assert checked_out.closed
+    assert pool.checkout() is not checked_out
+    assert pool.stats()["discarded"] == 1
+
+
+def test_main_pool_health_checks_idle_connections():
+    pool = fake_pool(check_after=0)
+    checked_out = pool.checkout()
+    pool.checkin(checked_out)
+    assert pool.checkout() is checked_out
+    assert checked_out.pings == 1
+
+    checked_out.broken = True
+    pool.checkin(checked_out)
+    assert pool.checkout() is not checked_out
+    assert pool.stats()["health_check_failures"] == 1
+
+    pool = fake_pool(recycle=0)
+    checked_out = pool.checkout()
+    pool.checkin(checked_out)
+    assert pool.checkout() is not checked_out
+    assert pool.stats()["recycled"] == 1
+
+
+def test_main_pool_never_exceeds_its_capacity():
+    pool = fake_pool(size=3, max_overflow=2, timeout=5)
+    peak = []
+
+    def use(_):
+        checked_out = pool.checkout()
+        peak.append(pool.stats()["in_use"])
+        time.sleep(0.001)
+        pool.checkin(checked_out)
+
+    with ThreadPoolExecutor(16) as executor:
+        list(executor.map(use, range(400)))
+    stats = pool.stats()
+    assert max(peak) <= 5
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 3
+    assert stats["connects"] - stats["closes"] == 3
+
+
+####
+# Backend
+###
+
+
+def pooled_wrapper(alias, **settings):
+    return DatabaseWrapper({**connection.settings_dict, **settings}, alias=alias)
+
+
+def test_main_pool_backend_returns_connections_on_close(db):
+    wrapper = pooled_wrapper("pool_test")
+    try:
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        assert not raw.closed
+
+        wrapper.ensure_connection()
+        assert wrapper.connection is raw
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.fetchone() == (1,)
+        wrapper.close()
+
+        stats = [stats for key, stats in pool_stats().items() if key[0] == "pool_test"][0]
+        assert (stats["connects"], stats["checkouts"], stats["idle"]) == (1, 2, 1)
+    finally:
+        dispose_pools(lambda key: key[0] == "pool_test")
+
+
+def test_main_pool_backend_rolls_back_returned_transactions(db):
+    wrapper = pooled_wrapper("pool_test_rollback")
+    try:
+        wrapper.ensure_connection()
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TEMPORARY TABLE pool_test_rollback (id int)")
+        wrapper.close()
+
+        wrapper.ensure_connection()
+        assert wrapper.get_autocommit()
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pool_test_rollback')")
+            assert cursor.fetchone() == (None,)
+        wrapper.close()
+    finally:
+        dispose_pools(lambda key: key[0] == "pool_test_rollback")
+
+
+####
+# Benchmark
+###
+
+THREADS = 8
+REQUESTS = 2000
+
+
+def request_rate(make_wrapper):
+    """
+        Requests per second of THREADS threads each running REQUESTS /
+        THREADS "requests": connect if needed, read a page of categories,
+        then what request_finished does to the connection.
+    """
+    local = threading.local()
+
+    def request(_):
+        if not hasattr(local, "wrapper"):
+            local.wrapper = make_wrapper()
+        wrapper = local.wrapper
+        with wrapper.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, name, slug, level FROM inventory_category ORDER BY tree_id, lft LIMIT 100"
+            )
+            cursor.fetchall()
+        wrapper.close_if_unusable_or_obsolete()
+        return wrapper
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as executor:
+        wrappers = set(executor.map(request, range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+    for wrapper in wrappers:
+        wrapper.inc_thread_sharing()
+        wrapper.close()
+    return REQUESTS / elapsed
+
+
+@pytest.mark.benchmark
+def test_benchmark_connection_pool(request, db):
+    settings = connection.settings_dict
+    results = {
+        "connect per request": request_rate(
+            lambda: PostgresWrapper({**settings, "CONN_MAX_AGE": 0}, alias="bench_connect")
+        ),
+        "persistent ( CONN_MAX_AGE 60 )": request_rate(
+            lambda: PostgresWrapper({**settings, "CONN_MAX_AGE": 60}, alias="bench_persistent")
+        ),
+        "pool": request_rate(lambda: pooled_wrapper("bench_pool", CONN_MAX_AGE=0)),
+    }
+    stats = [stats for key, stats in pool_stats().items() if key[0] == "bench_pool"][0]
+    dispose_pools(lambda key: key[0] == "bench_pool")
+
+    print()
+    for name, rate in results.items():
+        request.config._benchmark_results[f"connections:{name}"] = {"requests_per_sec": round(rate, 1)}
+        print(f"{name:<32} {rate:>8.0f} requests/sec")
+    print("pool:", stats)
+    assert stats["connects"] <= THREADS
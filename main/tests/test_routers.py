@@ -0,0 +1,140 @@
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from inventory import models
+from inventory.cache import bump_version_on_commit, get_version
+from main.db.pool import dispose_pools
+from main.routers import PIN_COOKIE, PrimaryPinMiddleware, WeightedRoundRobin, routing_state
+
+"""
+    Tests for the read replica router ( main/routers.py ).
+
+    The replicas are extra connections to the test database, the way
+    replicas are tried locally. They only see committed rows, so these tests
+    use the transactional_db fixture.
+"""
+
+REPLICAS = {"replica_a": 3, "replica_b": 1}
+
+
+@pytest.fixture
+def replicas(transactional_db, settings):
+    for alias in REPLICAS:
+        connections.databases[alias] = dict(connections.databases["default"])
+    settings.DATABASE_REPLICAS = REPLICAS
+    # Writes by the fixtures pin the test's reads to the primary
+    routing_state().pinned_until = 0
+    yield REPLICAS
+    for alias in REPLICAS:
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+    dispose_pools(lambda key: key[0] in REPLICAS)
+
+
+def test_main_routers_weighted_round_robin():
+    balancer = WeightedRoundRobin({"a": 3, "b": 1})
+    picks = [balancer.next() for _ in range(8)]
+    assert picks.count("a") == 6
+    # One b in every four picks, not in a run
+    assert "".join(picks) == "aabaaaba"
+
+
+@pytest.mark.dbfactory
+def test_main_routers_without_replicas_use_the_primary(db):
+    assert models.Category.objects.all().db == "default"
+    assert router.db_for_write(models.Category) == "default"
+
+
+@pytest.mark.dbfactory
+def test_main_routers_read_from_replicas(replicas, category_factory):
+    category = category_factory.create(slug="routed", name="routed")
+    routing_state().pinned_until = 0
+
+    aliases = [models.Category.objects.all().db for _ in range(8)]
+    assert aliases.count("replica_a") == 6 and aliases.count("replica_b") == 2
+    # The replica connection reads the committed row
+    for _ in range(4):
+        assert models.Category.objects.get(slug="routed") == category
+    # Other apps stay on the primary
+    assert User.objects.all().db == "default"
+
+    with transaction.atomic():
+        assert models.Category.objects.all().db == "default"
+
+    category_factory.create(slug="routed-child", name="routed child", parent=category)
+    assert models.Category.objects.all().db == "default"
+    routing_state().pinned_until = 0
+    assert models.Category.objects.all().db in replicas
+
+    assert router.allow_migrate("replica_a", "inventory") is False
+    assert router.allow_migrate("default", "inventory") is True
+
+
+@pytest.mark.dbfactory
+def test_main_routers_demo_views_read_from_replicas(replicas, client, category_factory):
+    category_factory.create(slug="routed-view", name="routed view")
+    with CaptureQueriesContext(connections["default"]) as primary:
+        with CaptureQueriesContext(connections["replica_a"]) as replica_a:
+            with CaptureQueriesContext(connections["replica_b"]) as replica_b:
+                for _ in range(4):
+                    assert client.get(reverse("demo:product_by_category", kwargs={"category": "routed-view"}))
+    assert len(primary) == 0
+    # Two queries, then one a request once the listing fragment is cached
+    assert (len(replica_a), len(replica_b)) == (4, 1)
+
+
+@pytest.mark.dbfactory
+def test_main_routers_pin_reads_after_a_write(replicas, category_factory):
+    factory = RequestFactory()
+
+    def write(request):
+        category_factory.create(slug="pinning", name="pinning")
+        return HttpResponse()
+
+    def read(request):
+        return HttpResponse(models.Category.objects.all().db)
+
+    response = PrimaryPinMiddleware(write)(factory.get("/"))
+    cookie = response.cookies[PIN_COOKIE]
+    assert cookie["max-age"] == 5
+
+    # The same client's next requests read from the primary, others do not
+    pinned = factory.get("/")
+    pinned.COOKIES[PIN_COOKIE] = cookie.value
+    assert PrimaryPinMiddleware(read)(pinned).content == b"default"
+    assert PrimaryPinMiddleware(read)(factory.get("/")).content in (b"replica_a", b"replica_b")
+
+    expired = factory.get("/")
+    expired.COOKIES[PIN_COOKIE] = "1.0"
+    assert PrimaryPinMiddleware(read)(expired).content != b"default"
+
+    async def async_read(request):
+        return read(request)
+
+    assert async_to_sync(PrimaryPinMiddleware(async_read))(pinned).content == b"default"
+
+
+@pytest.mark.dbfactory
+def test_main_routers_versions_bumped_after_the_replica_lag(
+    replicas, settings, django_capture_on_commit_callbacks
+):
+    # Entries cached from a replica behind the commit are dropped too
+    settings.REPLICA_PIN_SECONDS = 0.2
+    with django_capture_on_commit_callbacks(execute=True):
+        bump_version_on_commit("lagged")
+    committed = get_version("lagged")
+    for _ in range(50):
+        if get_version("lagged") != committed:
+            break
+        time.sleep(0.05)
+    assert get_version("lagged") == committed + 1
+    time.sleep(0.3)
+    assert get_version("lagged") == committed + 1
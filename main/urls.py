@@ -13,10 +13,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('demo/', include('demo.urls', namespace='demo')),
+    path('api/', include('inventory.urls', namespace='api')),
 ]
+
+# Uploaded images and their derivatives, only served by runserver ( DEBUG )
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)